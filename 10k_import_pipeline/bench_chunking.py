@@ -0,0 +1,699 @@
+import os
+import re
+import sys
+import json
+import math
+import time
+import platform
+import tracemalloc
+import contextlib
+import io
+import random
+from datetime import datetime
+from typing import List, Dict, Any, Callable, Optional, Sequence
+
+from import_2_chunking import (
+    DEFAULT_MAX_CHUNK_SIZE,
+    DEFAULT_MIN_CHUNK_SIZE,
+    STANDARD_10K_HEADINGS,
+    LabelTable,
+    SourceBuffer,
+    classify_line,
+    classify_lines,
+    detect_subheading,
+    find_content_start_line,
+    is_financial_line,
+    is_likely_toc_entry,
+    is_table_line,
+    iter_post_processed_chunks,
+    iter_section_chunks,
+    iter_window_fitted_chunks,
+    iter_parallel_text_chunks,
+    iter_text_chunks,
+    process_and_save_chunks,
+    post_process_chunks,
+    merge_related_chunks,
+    split_by_subheadings,
+    table_features
+)
+from token_counting import get_tokenizer
+
+# Sample filing shipped with the repo
+NETFLIX_SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "docs", "10K example Netflix.md")
+
+# Synthetic filing sizes run by the scaling suite
+SUITE_SCALES = (1, 10, 50)
+
+# Upper bound for the fitted exponent of time vs. input lines (1.0 is perfectly linear)
+MAX_SCALING_EXPONENT = 1.2
+
+# Sizes (lines) of the worst-case TOC filings timed by the content start scaling check
+TOC_WORST_CASE_LINES = (2000, 20000, 100000)
+
+# Upper bounds of the chunk-size histogram buckets (tokens)
+CHUNK_SIZE_BUCKETS = (50, 100, 200, 300, 400, 512)
+
+# Adversarial documents (see ADVERSARIAL_INPUTS) are generated at these sizes in characters.
+# At 4 MB the table input has well over 100k rows.
+ADVERSARIAL_SIZES = (500_000, 1_000_000, 4_000_000)
+ADVERSARIAL_TEST_SIZES = (200_000, 800_000)
+
+# Per-stage time limits for adversarial documents in seconds per MB of input (with at least
+# 1 MB charged per document), i.e. a guaranteed minimum throughput, so a stage that grows
+# super-linearly fails at the larger sizes. The slowest stage measured (window fitting one
+# 4 MB paragraph, about 3 MB/s) is 6x within its limit.
+ADVERSARIAL_STAGE_LIMITS = {
+    "classify_lines": 2.0,
+    "find_content_start_line": 1.0,
+    "iter_section_chunks": 2.0,
+    "iter_post_processed_chunks": 4.0,
+    "iter_window_fitted_chunks": 2.0
+}
+
+# Single adversarial lines are timed through the line predicates at these lengths; each call
+# may take at most LINE_PREDICATE_LIMIT seconds per MB (at least 1 ms). Lengths grow 4x so a
+# quadratic pattern fails on a short line instead of hanging on a long one.
+ADVERSARIAL_LINE_LENGTHS = (1_000, 4_000, 16_000, 64_000)
+LINE_PREDICATE_LIMIT = 2.0
+
+# The time limits above are for the --adversarial benchmark on a known machine; the tests
+# only check that time grows near-linearly with input size (2.0 is quadratic), for stages
+# slow enough at the largest size for the growth to stand out of timing noise
+ADVERSARIAL_MAX_EXPONENT = 1.6
+ADVERSARIAL_MIN_TIMED_SECONDS = 0.05
+
+def load_sample_filing(path: str = NETFLIX_SAMPLE, repeat: int = 1) -> str:
+    """
+    Load a sample filing and reflow it to roughly one sentence per line.
+    The Netflix sample stores the whole filing on a single line, while LlamaParse
+    output usually has one paragraph or table row per line; reflowing gives a
+    line density closer to what the chunker sees in production.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    lines = []
+    for line in text.split('\n'):
+        lines.extend(re.split(r'(?<=[.!?])\s+(?=[A-Z#])', line))
+    return '\n'.join(lines * repeat)
+
+def make_synthetic_filing(scale: int = 1, seed: int = 42) -> str:
+    """
+    Build a synthetic LlamaParse-style 10-K: XBRL preamble, dense TOC and every
+    standard Item with prose paragraphs, markdown subheadings, ignored table
+    headings and financial tables. scale=1 is roughly 3,000 lines.
+    """
+    rng = random.Random(seed)
+    words = ("the company revenue increased million net income total assets operating segment risk "
+             "our customers may adversely affect results fiscal year ended december 31, 2023 "
+             "$ 1,234 (567) cash flows compared prior period primarily due to").split()
+    subheadings = ["Overview", "Competition", "Human Capital", "Segment Information", "Liquidity",
+                   "Consolidated Statements of Operations", "Notes to Consolidated Financial Statements",
+                   "Year Ended December 31,", "(in millions)", "Critical Audit Matters"]
+    line_items = ["Revenues", "Cost of revenues", "Operating income", "Net income", "Total assets",
+                  "Cash and cash equivalents", "Total liabilities"]
+
+    def paragraph(n: int) -> str:
+        return " ".join(rng.choice(words) for _ in range(n)) + "."
+
+    def table(rows: int) -> List[str]:
+        out = ["| | 2023 | 2022 | 2021 |", "|---|---|---|---|"]
+        for _ in range(rows):
+            out.append(f"| {rng.choice(line_items)} | $ {rng.randint(1, 99999):,} | "
+                       f"{rng.randint(1, 99999):,} | ({rng.randint(1, 999)}) |")
+        return out
+
+    lines = ["http://fasb.org/us-gaap/2023#Member", "---", "# Table of Contents", ""]
+    lines += [f"{heading} {rng.randint(1, 120)}" for heading in STANDARD_10K_HEADINGS]
+    lines += ["", "# Forward-Looking Statements", paragraph(60), ""]
+    for _ in range(scale):
+        for heading in STANDARD_10K_HEADINGS:
+            lines += [f"# {heading}", ""]
+            for _ in range(rng.randint(2, 6)):
+                lines += [f"## {rng.choice(subheadings)}", ""]
+                for _ in range(rng.randint(2, 6)):
+                    if rng.random() < 0.3:
+                        lines += table(rng.randint(3, 30))
+                    else:
+                        lines.append(paragraph(rng.randint(20, 250)))
+                    lines.append("")
+    return "\n".join(lines)
+
+def make_statement_chunks(count: int = 2000, seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    Build Item 8 style chunks: consecutive small financial statement tables with
+    different headers and column counts. Every adjacent pair fits the token limit
+    but is not merged, so each chunk goes through the table merge checks twice.
+    """
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(count):
+        columns = 2 + i % 2
+        rows = ["| " + " | ".join(f"S{i}c{c}" for c in range(columns)) + " |",
+                "|" + "---|" * columns]
+        for _ in range(18):
+            rows.append("| " + " | ".join(str(rng.randint(1, 99)) for _ in range(columns)) + " |")
+        chunks.append({"heading": "Item 8. Financial Statements and Supplementary Data",
+                       "subheading": f"Statement {i}", "text": "\n".join(rows)})
+    return chunks
+
+def make_dense_toc_filing(lines: int = 20000, content_start: bool = False) -> str:
+    """
+    Worst case for content start detection: a dense TOC right after the preamble, followed
+    by repeated cross-reference lists (one bare "Item 7." style reference per line) and
+    no Forward-Looking Statements or Item 1. Business heading, so the search runs to the
+    end of the filing. With content_start=True the real Item 1. Business is the last line.
+    """
+    references = [heading.split(".", 1)[0] + "." for heading in STANDARD_10K_HEADINGS]
+    body = ["---", "# Table of Contents"]
+    body.extend(f"{reference} {page}" for page, reference in enumerate(references, 3))
+    while len(body) < lines - 1:
+        body.append("The following Items are incorporated by reference:")
+        body.extend(references)
+    body = body[:lines - 1]
+    body.append("# Item 1. Business of the company" if content_start else "End of filing.")
+    return "\n".join(body)
+
+def lines_to_size(make_line: Callable[[int], str], size: int) -> str:
+    """An Item 1 heading followed by make_line(0), make_line(1), ... up to about size characters."""
+    lines = ["# Item 1. Business"]
+    total = len(lines[0])
+    while total < size:
+        line = make_line(len(lines) - 1)
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines)
+
+def make_long_line(size: int) -> str:
+    """One paragraph of about size characters without a line or sentence break."""
+    words = ("revenue", "increased", "$1,234", "for", "the", "year", "ended", "December", "31,", "2023",
+             "(in", "millions)", "compared", "to", "consolidated", "net", "income")
+    line = " ".join(words[i % len(words)] for i in range(size // 6))
+    return "# Item 1. Business\n" + line
+
+def make_long_token(size: int) -> str:
+    """One word of size characters, larger than any window (such a word is kept whole)."""
+    return "# Item 1. Business\n" + "x" * size
+
+def make_whitespace_runs(size: int) -> str:
+    """
+    Lines with long whitespace runs that are not followed by a page number, the worst case
+    for patterns like \\s+\\d+$ that backtrack through every suffix of the run.
+    """
+    run = " " * 4096
+    return lines_to_size(lambda i: (f"Item {1 + i % 9}. Business{run}x" if i % 2 else f"|{run}-{run}x"), size)
+
+def make_pipe_only_lines(size: int) -> str:
+    """Lines consisting of nothing but pipes, e.g. empty LlamaParse table grids."""
+    return lines_to_size(lambda i: "|" * (1 + i % 200), size)
+
+def make_large_table(size: int) -> str:
+    """A single financial table with about size / 30 rows and no blank line or heading."""
+    header = ["| Line item | 2023 | 2022 |", "|---|---:|---:|"]
+    return lines_to_size(lambda i: header[i] if i < 2 else f"| Revenue {i} | ${i:,} | ({i % 1000}) |", size)
+
+def make_malformed_table(size: int) -> str:
+    """
+    Broken table rows as LlamaParse produces them: unterminated rows, separators without
+    headers, ragged column counts, empty cells and separator-like text between rows.
+    """
+    rows = ("| Total net revenue | $ 1,000", "|---|:-:|---|", "| " + " | ".join(["1"] * 37) + " |",
+            "||||||", "| - - - - - - - - - - - - - - - - - |", "(in millions) | continued", "|")
+    return lines_to_size(lambda i: rows[i % len(rows)], size)
+
+def make_heading_flood(size: int) -> str:
+    """A subheading on every other line, so every section is a tiny chunk that goes through merging."""
+    return lines_to_size(lambda i: f"## Note {i // 2}" if i % 2 == 0 else f"Amounts for note {i // 2} are $ {i}.", size)
+
+def make_fuzz_filing(size: int, seed: int = 42) -> str:
+    """Random sequence of markdown, table and financial statement fragments."""
+    rng = random.Random(seed)
+    fragments = ("|", "|---", ":", " ", "  ", "#", "## ", "\n", "\n\n", "$", "(", ")", "1,000", "Item 7.",
+                 "Item 1A.", "Total", "year ended", "December 31, 2023", "(in millions)", "Table of Contents",
+                 "Notes to", "continued", ".", "word")
+    parts = ["# Item 1. Business\n"]
+    total = len(parts[0])
+    while total < size:
+        fragment = rng.choice(fragments)
+        parts.append(fragment)
+        total += len(fragment)
+    return "".join(parts)
+
+# Generators of worst-case documents for the chunker, by name: size -> filing text
+ADVERSARIAL_INPUTS = {
+    "long_line": make_long_line,
+    "long_token": make_long_token,
+    "whitespace_runs": make_whitespace_runs,
+    "pipe_only_lines": make_pipe_only_lines,
+    "large_table": make_large_table,
+    "malformed_table": make_malformed_table,
+    "heading_flood": make_heading_flood,
+    "fuzz": make_fuzz_filing
+}
+
+def make_adversarial_lines(length: int) -> Dict[str, str]:
+    """Single lines of about length characters that stress regex backtracking, by name."""
+    return {
+        "spaces": "Item 1. Business" + " " * length + "x",
+        "tabs_in_row": "|" + "\t" * length + "x",
+        "pipes": "|" * length,
+        "dashes_in_row": "|" + "-:" * (length // 2) + "x",
+        "digits": "Item 7. " + "1" * length + "x",
+        "spaced_digits": "# " + " 1" * (length // 2) + "x",
+        "amounts": "$" + ",000" * (length // 4) + ",",
+        "hashes": "#" * length + "x",
+        "financial_words": "| " + "consolidated total year " * (length // 24)
+    }
+
+def time_call(func: Callable, *args, runs: int = 3) -> float:
+    """Return the best wall-clock time (seconds) over a few runs, silencing prints."""
+    best = float('inf')
+    for _ in range(runs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func(*args)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_line_classifier(text: str) -> Dict[str, Any]:
+    """Measure throughput of the one-pass line classifier."""
+    lines = text.split('\n')
+    seconds = time_call(classify_lines, lines)
+    return {
+        "stage": "classify_lines",
+        "lines": len(lines),
+        "seconds": seconds,
+        "lines_per_second": len(lines) / seconds if seconds else 0.0,
+        "mb_per_second": len(text) / seconds / 1e6 if seconds else 0.0
+    }
+
+def bench_content_start(text: str) -> Dict[str, Any]:
+    """Measure content start detection (find_content_start_line) on pre-classified lines."""
+    lines = text.split('\n')
+    kinds = classify_lines(lines)
+    seconds = time_call(find_content_start_line, lines, kinds)
+    return {
+        "stage": "find_content_start_line",
+        "lines": len(lines),
+        "seconds": seconds,
+        "lines_per_second": len(lines) / seconds if seconds else 0.0,
+        "mb_per_second": len(text) / seconds / 1e6 if seconds else 0.0
+    }
+
+def bench_chunker(text: str) -> Dict[str, Any]:
+    """Measure end-to-end throughput of process_and_save_chunks."""
+    lines = text.count('\n') + 1
+    seconds = time_call(process_and_save_chunks, text)
+    return {
+        "stage": "process_and_save_chunks",
+        "lines": lines,
+        "seconds": seconds,
+        "lines_per_second": lines / seconds if seconds else 0.0,
+        "mb_per_second": len(text) / seconds / 1e6 if seconds else 0.0
+    }
+
+def bench_parallel_chunking(text: str, workers: Optional[int] = None, max_tokens: int = DEFAULT_MAX_CHUNK_SIZE,
+                            min_tokens: int = DEFAULT_MIN_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Compare serial chunking (iter_text_chunks) with per-Item parallel chunking
+    (iter_parallel_text_chunks) on one document and chunk size setting, and check that
+    both give the same chunks. Parallel time includes starting the process pool.
+    """
+    workers = workers or os.cpu_count() or 1
+    lines = text.count('\n') + 1
+    outputs = {}
+
+    def run_serial():
+        outputs["serial"] = [(chunk.heading, chunk.subheading, chunk.text)
+                             for chunk in iter_text_chunks(text, max_tokens, min_tokens=min_tokens)]
+
+    def run_parallel():
+        outputs["parallel"] = [(chunk.heading, chunk.subheading, chunk.text)
+                               for chunk in iter_parallel_text_chunks(text, max_tokens, workers=workers,
+                                                                      min_tokens=min_tokens)]
+
+    serial_seconds = time_call(run_serial)
+    parallel_seconds = time_call(run_parallel)
+    identical = outputs["serial"] == outputs["parallel"]
+    return {
+        "stage": f"iter_parallel_text_chunks ({workers} workers)",
+        "lines": lines,
+        "seconds": parallel_seconds,
+        "serial_seconds": serial_seconds,
+        "speedup": serial_seconds / parallel_seconds if parallel_seconds else 0.0,
+        "identical": identical,
+        "lines_per_second": lines / parallel_seconds if parallel_seconds else 0.0,
+        "mb_per_second": len(text) / parallel_seconds / 1e6 if parallel_seconds else 0.0
+    }
+
+def bench_post_processing(text: str) -> Dict[str, Any]:
+    """Measure split/merge post-processing (post_process_chunks) on subheading chunks."""
+    chunks = split_by_subheadings(text)
+    lines = text.count('\n') + 1
+
+    def run():
+        # post_process_chunks mutates merged chunks, so work on fresh copies
+        post_process_chunks([dict(chunk) for chunk in chunks])
+
+    seconds = time_call(run)
+    return {
+        "stage": "post_process_chunks",
+        "lines": lines,
+        "seconds": seconds,
+        "lines_per_second": lines / seconds if seconds else 0.0,
+        "mb_per_second": len(text) / seconds / 1e6 if seconds else 0.0
+    }
+
+def bench_table_merging(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Measure merge_related_chunks on table-heavy chunks (see make_statement_chunks)."""
+    lines = sum(chunk["text"].count('\n') + 1 for chunk in chunks)
+    size = sum(len(chunk["text"]) for chunk in chunks)
+    seconds = time_call(lambda: merge_related_chunks([dict(chunk) for chunk in chunks]))
+    return {
+        "stage": "merge_related_chunks (tables)",
+        "lines": lines,
+        "seconds": seconds,
+        "lines_per_second": lines / seconds if seconds else 0.0,
+        "mb_per_second": size / seconds / 1e6 if seconds else 0.0
+    }
+
+def bench_adversarial_document(name: str, text: str) -> List[Dict[str, Any]]:
+    """
+    Time each stage of the streaming chunker separately on one adversarial document:
+    line classification, content start detection, the Item/subheading split,
+    post-processing and window fitting. Each stage runs once on the previous stage's
+    output (post-processing mutates its input chunks, so it cannot be repeated).
+    Returns one result per stage.
+    """
+    lines = text.split('\n')
+    characters = len(text)
+    tokenizer = get_tokenizer()
+    outputs = {}
+
+    def classify():
+        outputs["kinds"] = classify_lines(lines)
+
+    def content_start():
+        outputs["start"] = find_content_start_line(lines, outputs["kinds"])
+
+    def sections():
+        offsets = []
+        offset = 0
+        for line in lines:
+            offsets.append(offset)
+            offset += len(line) + 1
+        start = outputs["start"]
+        content = zip(lines[start:], outputs["kinds"][start:], offsets[start:])
+        outputs["sections"] = list(iter_section_chunks(content, LabelTable(), SourceBuffer(text, 0)))
+
+    def post_process():
+        outputs["chunks"] = list(iter_post_processed_chunks(iter(outputs["sections"])))
+
+    def window_fit():
+        outputs["fitted"] = list(iter_window_fitted_chunks(iter(outputs["chunks"]), tokenizer))
+
+    results = []
+    for stage, func in (("classify_lines", classify), ("find_content_start_line", content_start),
+                        ("iter_section_chunks", sections), ("iter_post_processed_chunks", post_process),
+                        ("iter_window_fitted_chunks", window_fit)):
+        seconds = time_call(func, runs=1)
+        results.append({
+            "document": name,
+            "stage": stage,
+            "lines": len(lines),
+            "characters": characters,
+            "seconds": seconds,
+            "lines_per_second": len(lines) / seconds if seconds else 0.0,
+            "mb_per_second": characters / seconds / 1e6 if seconds else 0.0
+        })
+    results[-1]["chunks"] = len(outputs["fitted"])
+    return results
+
+def stage_limit(result: Dict[str, Any]) -> float:
+    """Time limit (seconds) of an adversarial stage result, see ADVERSARIAL_STAGE_LIMITS."""
+    return ADVERSARIAL_STAGE_LIMITS[result["stage"]] * max(result["characters"] / 1e6, 1.0)
+
+def check_stage_limits(results: List[Dict[str, Any]]):
+    """Raise AssertionError if a stage took longer than its limit on an adversarial document."""
+    slow = [f"{result['document']} ({result['characters']:,} characters) {result['stage']}: "
+            f"{result['seconds']:.3f}s > {stage_limit(result):.3f}s"
+            for result in results if result["seconds"] > stage_limit(result)]
+    assert not slow, "Chunker stages over their time limit: " + "; ".join(slow)
+
+def run_adversarial_suite(sizes: Sequence[int] = ADVERSARIAL_SIZES) -> List[Dict[str, Any]]:
+    """
+    Run every adversarial document (ADVERSARIAL_INPUTS) at each size through
+    bench_adversarial_document, print the per-stage times with their limits and return
+    all stage results for check_stage_limits.
+    """
+    results = []
+    print(f"{'document':<16} {'characters':>11} {'stage':<27} {'seconds':>8} {'limit':>7} {'MB/s':>7}")
+    for name, make_document in ADVERSARIAL_INPUTS.items():
+        for size in sizes:
+            for result in bench_adversarial_document(name, make_document(size)):
+                results.append(result)
+                print(f"{name:<16} {result['characters']:>11,} {result['stage']:<27} {result['seconds']:>8.3f} "
+                      f"{stage_limit(result):>7.2f} {result['mb_per_second']:>7.2f}")
+    return results
+
+def bench_line_predicates(lengths: Sequence[int] = ADVERSARIAL_LINE_LENGTHS,
+                          check_limits: bool = True) -> List[Dict[str, Any]]:
+    """
+    Time the per-line predicates of the chunker (and their regexes) on single adversarial
+    lines (see make_adversarial_lines) of growing length. With check_limits, fail as soon
+    as a call takes longer than LINE_PREDICATE_LIMIT allows, before a quadratic pattern
+    reaches the longer lines. Returns one result per predicate, line and length.
+    """
+    predicates = (classify_line, detect_subheading, is_table_line, is_likely_toc_entry,
+                  is_financial_line, table_features)
+    results = []
+    for length in lengths:
+        for line_name, line in make_adversarial_lines(length).items():
+            for predicate in predicates:
+                seconds = time_call(predicate, line)
+                limit = max(LINE_PREDICATE_LIMIT * len(line) / 1e6, 0.001)
+                results.append({"stage": predicate.__name__, "document": line_name, "lines": 1,
+                                "characters": len(line), "seconds": seconds})
+                assert not check_limits or seconds <= limit, (
+                    f"{predicate.__name__} took {seconds:.3f}s on a {len(line):,} character '{line_name}' line "
+                    f"(limit {limit:.3f}s): super-linear regex backtracking?"
+                )
+    return results
+
+def measure_peak_memory(func: Callable, *args) -> int:
+    """Peak memory (bytes) allocated by Python while running func, measured with tracemalloc."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        try:
+            func(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return peak
+
+def percentile(sorted_values: Sequence[int], fraction: float) -> int:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def chunk_size_distribution(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Token-size distribution of chunks, counted with the shared tokenizer."""
+    sizes = sorted(get_tokenizer().count_batch([chunk["text"] for chunk in chunks]))
+    histogram = {}
+    lower = 0
+    for upper in CHUNK_SIZE_BUCKETS:
+        histogram[f"{lower}-{upper}"] = sum(1 for size in sizes if lower <= size < upper)
+        lower = upper
+    histogram[f"{lower}+"] = sum(1 for size in sizes if size >= lower)
+    return {
+        "chunks": len(sizes),
+        "min": sizes[0] if sizes else 0,
+        "p50": percentile(sizes, 0.5),
+        "p90": percentile(sizes, 0.9),
+        "p99": percentile(sizes, 0.99),
+        "max": sizes[-1] if sizes else 0,
+        "mean": sum(sizes) / len(sizes) if sizes else 0.0,
+        "histogram": histogram
+    }
+
+def measure_document(name: str, text: str, runs: int = 3) -> Dict[str, Any]:
+    """
+    End-to-end chunking measurements for one document: best-of-runs time, throughput,
+    tracemalloc peak (a separate run, since tracing slows execution down) and the
+    chunk-size distribution.
+    """
+    lines = text.count('\n') + 1
+    with contextlib.redirect_stdout(io.StringIO()):
+        chunks = process_and_save_chunks(text)
+    seconds = time_call(process_and_save_chunks, text, runs=runs)
+    return {
+        "document": name,
+        "lines": lines,
+        "characters": len(text),
+        "seconds": seconds,
+        "lines_per_second": lines / seconds if seconds else 0.0,
+        "mb_per_second": len(text) / seconds / 1e6 if seconds else 0.0,
+        "peak_memory_bytes": measure_peak_memory(process_and_save_chunks, text),
+        "chunk_sizes": chunk_size_distribution(chunks)
+    }
+
+def scaling_exponent(results: List[Dict[str, Any]], size: str = "lines") -> float:
+    """
+    Least-squares slope of log(seconds) over log(size) (lines, or characters). 1.0 means
+    time grows linearly with input size, 2.0 quadratically.
+    """
+    points = [(math.log(result[size]), math.log(result["seconds"])) for result in results if result["seconds"] > 0]
+    if len(points) < 2:
+        return 1.0
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return 1.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+def check_linear_scaling(results: List[Dict[str, Any]], max_exponent: float = MAX_SCALING_EXPONENT) -> float:
+    """Raise AssertionError unless chunking time scales near-linearly over results; returns the exponent."""
+    exponent = scaling_exponent(results)
+    sizes = ", ".join(f"{result['lines']:,} lines: {result['seconds']:.3f}s" for result in results)
+    assert exponent <= max_exponent, (
+        f"Chunking scales super-linearly (exponent {exponent:.2f} > {max_exponent}): {sizes}"
+    )
+    return exponent
+
+def check_adversarial_scaling(results: List[Dict[str, Any]], max_exponent: float = ADVERSARIAL_MAX_EXPONENT):
+    """
+    Raise AssertionError if the time of a stage (or line predicate) on an adversarial input
+    grows super-linearly with its size in characters. Inputs where the stage stays under
+    ADVERSARIAL_MIN_TIMED_SECONDS at every size are skipped as too fast to time reliably.
+    """
+    groups = {}
+    for result in results:
+        groups.setdefault((result["document"], result["stage"]), []).append(result)
+    slow = []
+    for (document, stage), group in groups.items():
+        if max(result["seconds"] for result in group) < ADVERSARIAL_MIN_TIMED_SECONDS:
+            continue
+        exponent = scaling_exponent(group, "characters")
+        if exponent > max_exponent:
+            sizes = ", ".join(f"{result['characters']:,}: {result['seconds']:.3f}s" for result in group)
+            slow.append(f"{document} {stage} (exponent {exponent:.2f}; {sizes})")
+    assert not slow, "Adversarial inputs scale super-linearly: " + "; ".join(slow)
+
+def run_suite(scales: Sequence[int] = SUITE_SCALES, output_file: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run the chunking benchmark suite on the Netflix sample and on synthetic filings at the
+    given scales, print a summary and write the results as JSON to output_file if given.
+    The near-linear scaling check is recorded in the results, not raised; see
+    check_linear_scaling.
+    """
+    documents = [measure_document("netflix", load_sample_filing(NETFLIX_SAMPLE, 1))]
+    synthetic = []
+    for scale in scales:
+        # Large inputs take long enough for a single run to be stable
+        result = measure_document(f"synthetic_x{scale}", make_synthetic_filing(scale), runs=3 if scale <= 10 else 1)
+        synthetic.append(result)
+        documents.append(result)
+    
+    exponent = scaling_exponent(synthetic)
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "tokenizer": get_tokenizer().name,
+        "documents": documents,
+        "scaling": {
+            "scales": list(scales),
+            "exponent": exponent,
+            "max_exponent": MAX_SCALING_EXPONENT,
+            "near_linear": exponent <= MAX_SCALING_EXPONENT
+        }
+    }
+    
+    print(f"{'document':<16} {'lines':>9} {'seconds':>9} {'lines/s':>11} {'MB/s':>7} {'peak MB':>8} "
+          f"{'chunks':>7} {'p50':>5} {'p99':>5} {'max':>5}")
+    for result in documents:
+        sizes = result["chunk_sizes"]
+        print(f"{result['document']:<16} {result['lines']:>9,} {result['seconds']:>9.3f} "
+              f"{result['lines_per_second']:>11,.0f} {result['mb_per_second']:>7.2f} "
+              f"{result['peak_memory_bytes'] / 1e6:>8.1f} {sizes['chunks']:>7} {sizes['p50']:>5} "
+              f"{sizes['p99']:>5} {sizes['max']:>5}")
+    print(f"Scaling exponent over synthetic x{', x'.join(str(scale) for scale in scales)}: {exponent:.2f} "
+          f"({'near-linear' if results['scaling']['near_linear'] else 'SUPER-LINEAR'})")
+    
+    if output_file:
+        output_dir = os.path.dirname(output_file)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with open(output_file, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to: {output_file}")
+    return results
+
+def print_result(result: Dict[str, Any]):
+    print(f"{result['stage']:<30} {result['lines']:>8} lines  {result['seconds']*1000:>9.1f} ms  "
+          f"{result['lines_per_second']:>12,.0f} lines/s  {result['mb_per_second']:>6.2f} MB/s")
+
+def main():
+    # Usage: python bench_chunking.py [input_file] [--repeat N] [--synthetic SCALE] [--parallel WORKERS]
+    #        python bench_chunking.py --suite [--scales 1,10,50] [--output FILE]
+    #        python bench_chunking.py --adversarial [--sizes 500000,1000000,4000000]
+    args = sys.argv[1:]
+    if "--adversarial" in args:
+        sizes = ADVERSARIAL_SIZES
+        if "--sizes" in args:
+            sizes = tuple(int(size) for size in args[args.index("--sizes") + 1].split(","))
+        bench_line_predicates()
+        print(f"Line predicates linear on adversarial lines up to {ADVERSARIAL_LINE_LENGTHS[-1]:,} characters")
+        results = run_adversarial_suite(sizes)
+        check_stage_limits(results)
+        check_adversarial_scaling(results)
+        print("All stages within their time limits")
+        return
+    if "--suite" in args:
+        scales = SUITE_SCALES
+        output_file = os.path.join("benchmark_results", f"chunking_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        if "--scales" in args:
+            scales = tuple(int(scale) for scale in args[args.index("--scales") + 1].split(","))
+        if "--output" in args:
+            output_file = args[args.index("--output") + 1]
+        run_suite(scales, output_file)
+        return
+    
+    repeat = 10
+    synthetic_scale = None
+    parallel_workers = None
+    if "--repeat" in args:
+        idx = args.index("--repeat")
+        repeat = int(args[idx + 1])
+        del args[idx:idx + 2]
+    if "--synthetic" in args:
+        idx = args.index("--synthetic")
+        synthetic_scale = int(args[idx + 1])
+        del args[idx:idx + 2]
+    if "--parallel" in args:
+        idx = args.index("--parallel")
+        parallel_workers = int(args[idx + 1])
+        del args[idx:idx + 2]
+    path = args[0] if args else NETFLIX_SAMPLE
+
+    if synthetic_scale:
+        text = make_synthetic_filing(synthetic_scale)
+        print(f"Benchmarking synthetic filing x{synthetic_scale}: {len(text):,} characters")
+    else:
+        text = load_sample_filing(path, repeat)
+        print(f"Benchmarking {os.path.basename(path)} x{repeat}: {len(text):,} characters")
+    print_result(bench_line_classifier(text))
+    print_result(bench_content_start(make_dense_toc_filing()))
+    print_result(bench_post_processing(text))
+    print_result(bench_chunker(text))
+    print_result(bench_table_merging(make_statement_chunks()))
+    if parallel_workers:
+        result = bench_parallel_chunking(text, parallel_workers)
+        print_result(result)
+        print(f"Serial {result['serial_seconds']:.3f}s, parallel {result['seconds']:.3f}s: "
+              f"{result['speedup']:.2f}x speedup, output {'identical' if result['identical'] else 'DIFFERENT'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import re
+import sys
+import json
+from typing import List, Dict, Any, Optional, Iterable
+
+CHUNK_FEATURES_VERSION = 1
+
+# Fiscal years a 10-K can mention; other four digit numbers are amounts or page numbers
+RE_YEAR = re.compile(r'\b(?:19[89]\d|20[0-4]\d)\b')
+
+# A currency amount: a symbol before a number, also across a LlamaParse cell border ("$ | 1,234")
+RE_CURRENCY_AMOUNT = re.compile(r'[$€£¥][ \t]*\|?[ \t]*\(?[ \t]*\d|\bUSD\b')
+
+RE_TABLE_LINE = re.compile(r'^[ \t]*\|', re.MULTILINE)
+
+# "segment" in running text, preceded by the segment names ("the North America and AWS segments")
+RE_SEGMENT_WORD = re.compile(r'\bsegments?\b')
+RE_SEGMENT_TOKEN = re.compile(r"[A-Za-z][\w&.'\-]*|,")
+SEGMENT_QUALIFIERS = {"reportable", "operating", "business", "geographic"}
+SEGMENT_STOPWORDS = {"Our", "The", "Each", "All", "Both", "These", "Those", "Such", "Other", "Two", "Three",
+                     "Four", "Company", "Company's", "In", "For", "Of", "Its", "This", "That", "A", "An"}
+# Characters before "segment" searched for names, and the limits of what is kept per chunk
+SEGMENT_CONTEXT = 120
+MAX_SEGMENT_NAME = 40
+MAX_SEGMENTS = 10
+
+def mentioned_years(text: str) -> List[str]:
+    """Distinct years mentioned in text, sorted."""
+    return sorted(set(RE_YEAR.findall(text)))
+
+def segment_names(text: str) -> List[str]:
+    """
+    Names of business segments in text, taken from the capitalized words right before
+    "segment(s)": "the North America, International, and AWS segments" gives North America,
+    International and AWS. Only a fixed window before each match is looked at, so the cost
+    is linear in the text length.
+    """
+    names = []
+    for match in RE_SEGMENT_WORD.finditer(text):
+        tokens = RE_SEGMENT_TOKEN.findall(text[max(0, match.start() - SEGMENT_CONTEXT):match.start()])
+        while tokens and tokens[-1].lower() in SEGMENT_QUALIFIERS:
+            tokens.pop()
+        name = []
+        for token in reversed(tokens):
+            if token[0].isupper() and token not in SEGMENT_STOPWORDS:
+                name.insert(0, token)
+                continue
+            if name:
+                names.append(" ".join(name))
+                name = []
+            if token not in (",", "and", "&"):
+                break
+        if name:
+            names.append(" ".join(name))
+    segments = []
+    for name in names:
+        if len(name) <= MAX_SEGMENT_NAME and name not in segments:
+            segments.append(name)
+    return sorted(segments[:MAX_SEGMENTS])
+
+def chunk_features(text: str) -> Dict[str, Any]:
+    """
+    Cheap features of a chunk, stored as Pinecone metadata and in the feature index so
+    retrieval can pre-filter: years mentioned, whether it has currency amounts or a
+    markdown table, and the business segments it names.
+    """
+    return {
+        "years": mentioned_years(text),
+        "has_currency": bool(RE_CURRENCY_AMOUNT.search(text)),
+        "has_table": bool(RE_TABLE_LINE.search(text)),
+        "segments": segment_names(text)
+    }
+
+def feature_keys(heading: Optional[str], subheading: Optional[str], features: Dict[str, Any]) -> List[str]:
+    """Feature index keys of a chunk, e.g. "heading:Item 7", "year:2023", "table", "segment:AWS"."""
+    keys = [f"heading:{heading or ''}", f"subheading:{(subheading or '').strip()}"]
+    keys.extend(f"year:{year}" for year in features["years"])
+    keys.append("table" if features["has_table"] else "prose")
+    if features["has_currency"]:
+        keys.append("currency")
+    keys.extend(f"segment:{segment}" for segment in features["segments"])
+    return keys
+
+class FeatureIndex:
+    """
+    Bitmap index of chunk features: for every feature key one bitmap (a Python int, bit i
+    set when chunk i has the feature). select() combines bitmaps with AND across features
+    and OR within a feature (e.g. any of several years), which costs a few big-int
+    operations instead of a scan over the chunks.
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.bitmaps: Dict[str, int] = {}
+
+    def add(self, identifier: str, keys: Iterable[str]):
+        bit = 1 << len(self.ids)
+        self.ids.append(identifier)
+        for key in keys:
+            self.bitmaps[key] = self.bitmaps.get(key, 0) | bit
+
+    def extend(self, other: "FeatureIndex"):
+        """Append the chunks of another index (e.g. another filing of the namespace)."""
+        shift = len(self.ids)
+        self.ids.extend(other.ids)
+        for key, bitmap in other.bitmaps.items():
+            self.bitmaps[key] = self.bitmaps.get(key, 0) | (bitmap << shift)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def any_of(self, prefix: str, values: Iterable[str]) -> int:
+        bitmap = 0
+        for value in values:
+            bitmap |= self.bitmaps.get(f"{prefix}{value}", 0)
+        return bitmap
+
+    def select(self, heading: Optional[str] = None, subheading: Optional[str] = None,
+               years: Optional[Iterable[str]] = None, has_table: Optional[bool] = None,
+               has_currency: Optional[bool] = None, segments: Optional[Iterable[str]] = None) -> int:
+        """Bitmap of the chunks matching every given condition (None means no condition)."""
+        bitmap = (1 << len(self.ids)) - 1
+        if heading is not None:
+            bitmap &= self.bitmaps.get(f"heading:{heading}", 0)
+        if subheading is not None:
+            bitmap &= self.bitmaps.get(f"subheading:{subheading.strip()}", 0)
+        if years is not None:
+            bitmap &= self.any_of("year:", years)
+        if has_table is not None:
+            bitmap &= self.bitmaps.get("table" if has_table else "prose", 0)
+        if has_currency is not None:
+            currency = self.bitmaps.get("currency", 0)
+            bitmap &= currency if has_currency else ~currency
+        if segments is not None:
+            bitmap &= self.any_of("segment:", segments)
+        return bitmap
+
+    def count(self, bitmap: int) -> int:
+        return bitmap.bit_count()
+
+    def chunk_ids(self, bitmap: int) -> List[str]:
+        """Chunk IDs of the set bits of a bitmap."""
+        return [identifier for position, identifier in enumerate(self.ids) if bitmap >> position & 1]
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"format": "chunk-features", "version": CHUNK_FEATURES_VERSION, "ids": self.ids,
+                       "bitmaps": {key: format(bitmap, "x") for key, bitmap in self.bitmaps.items()}},
+                      f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "FeatureIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format") != "chunk-features":
+            raise ValueError(f"{path} is not a chunk feature index")
+        index = cls()
+        index.ids = data["ids"]
+        index.bitmaps = {key: int(bitmap, 16) for key, bitmap in data["bitmaps"].items()}
+        return index
+
+def main():
+    # Usage: python chunk_features.py <chunk_store.jsonl>
+    # Prints how many chunks of a filing have each feature.
+    from chunk_store import features_path
+
+    if len(sys.argv) < 2:
+        print("Usage: python chunk_features.py <chunk_store.jsonl>")
+        sys.exit(1)
+    index = FeatureIndex.load(features_path(sys.argv[1]))
+    print(f"{features_path(sys.argv[1])}: {len(index)} chunks")
+    for key in sorted(index.bitmaps, key=lambda key: (key.split(":")[0], key)):
+        if not key.startswith(("heading:", "subheading:")):
+            print(f"{key}: {index.count(index.bitmaps[key])}")
+
+if __name__ == "__main__":
+    main()
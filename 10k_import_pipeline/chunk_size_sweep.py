@@ -0,0 +1,222 @@
+import os
+import re
+import sys
+import json
+import math
+import time
+import operator
+import platform
+from array import array
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+from import_2_chunking import iter_text_chunks, DEFAULT_MAX_CHUNK_SIZE, DEFAULT_MIN_CHUNK_SIZE
+from bench_chunking import load_sample_filing, percentile
+from chunk_features import chunk_features
+from embedding_batches import EMBED_BATCH_SIZE
+from near_duplicates import word_hash
+from table_compaction import compact_tables
+from token_counting import EMBEDDING_MAX_TOKENS, get_tokenizer, get_report_tokenizer
+
+# (max_tokens, min_tokens) settings of iter_post_processed_chunks compared by default
+SWEEP_SETTINGS = ((150, 50), (DEFAULT_MAX_CHUNK_SIZE, DEFAULT_MIN_CHUNK_SIZE), (450, 150), (600, 200))
+
+# Dimension of the Pinecone index (multilingual-e5-large); used for the stand-in vectors and index size
+VECTOR_DIMENSION = 1024
+VECTOR_BYTES = VECTOR_DIMENSION * 4
+
+SWEEP_TOP_K = 5
+
+# Questions on the Netflix sample, each with a phrase from the passage that answers it.
+# A question counts as recalled when one of the top-k chunks contains its phrase.
+NETFLIX_QUESTIONS = [
+    {"question": "How much did streaming revenues grow in 2023 and why?",
+     "evidence": "Streaming revenues for the year ended December 31, 2023 increased"},
+    {"question": "Why did cost of revenues increase compared to the prior year?",
+     "evidence": "The increase in cost of revenues"},
+    {"question": "What explains the change in the effective tax rate?",
+     "evidence": "The decrease in our effective tax rate"},
+    {"question": "Where is the company's corporate headquarters located?",
+     "evidence": "location of our corporate headquarters"},
+    {"question": "How many full-time employees does the company have and in which regions?",
+     "evidence": "full-time employees"},
+    {"question": "What are the company's primary uses of cash?",
+     "evidence": "Our primary uses of cash"},
+    {"question": "How large is the stock repurchase authorization from the Board of Directors?",
+     "evidence": "Board of Directors authorized the repurchase"},
+    {"question": "How much debt is outstanding in senior notes?",
+     "evidence": "senior notes outstanding"},
+    {"question": "Why did marketing expenses change in 2023?",
+     "evidence": "marketing expenses for the year ended December 31, 2023"},
+    {"question": "What do technology and development expenses consist of?",
+     "evidence": "Technology and development expenses consist primarily of"},
+    {"question": "On which market is the common stock traded?",
+     "evidence": "Our common stock is traded on the NASDAQ"}
+]
+
+RE_WORDS = re.compile(r'\w+')
+STOPWORDS = {"the", "a", "an", "and", "or", "of", "to", "in", "on", "for", "by", "with", "as", "at", "is",
+             "are", "was", "were", "be", "been", "our", "we", "us", "its", "it", "this", "that", "these",
+             "which", "what", "how", "why", "where", "does", "do", "did", "from", "has", "have", "had"}
+
+def stand_in_vector(text: str) -> array:
+    """
+    Offline stand-in for an embedding: a hashed bag of words (signed feature hashing of
+    the non-stopwords, log term frequency), L2-normalized, with the index dimension.
+    Lexical rather than semantic, so absolute recall is lower than with the real model,
+    but it ranks chunk size settings by how well chunks keep an answer together.
+    """
+    counts = {}
+    for word in RE_WORDS.findall(text.lower()):
+        if word not in STOPWORDS:
+            counts[word] = counts.get(word, 0) + 1
+    vector = array('f', bytes(VECTOR_BYTES))
+    for word, count in counts.items():
+        value = word_hash(word)
+        weight = 1.0 + math.log(count)
+        vector[value % VECTOR_DIMENSION] += weight if value >> 63 else -weight
+    norm = math.sqrt(sum(x * x for x in vector))
+    if norm:
+        for i in range(VECTOR_DIMENSION):
+            vector[i] /= norm
+    return vector
+
+def top_k(vectors: List[array], query: array, k: int) -> List[int]:
+    """Positions of the k vectors with the highest dot product with query (exhaustive search)."""
+    scores = [sum(map(operator.mul, vector, query)) for vector in vectors]
+    return sorted(range(len(scores)), key=scores.__getitem__, reverse=True)[:k]
+
+def normalize_whitespace(text: str) -> str:
+    return " ".join(text.split())
+
+def sweep_setting(texts: Sequence[str], max_tokens: int, min_tokens: int, questions: Sequence[Dict[str, str]],
+                  k: int = SWEEP_TOP_K, batch_size: int = EMBED_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Chunk texts with one size setting and measure what it costs and how well it retrieves:
+    chunk count, embedding requests and tokens (compact text, truncated like the model
+    does), index size (float32 vectors plus metadata), and the latency and recall@k of an
+    exhaustive search over stand-in vectors for the question set. Token counts are the
+    model's own when its tokenizer loads (see get_report_tokenizer), else word estimates.
+    """
+    tokenizer = get_tokenizer()
+    start = time.perf_counter()
+    chunks = [chunk for text in texts for chunk in iter_text_chunks(text, max_tokens, tokenizer, min_tokens=min_tokens)]
+    chunk_seconds = time.perf_counter() - start
+
+    embedded = [compact_tables(chunk.text) for chunk in chunks]
+    token_counts = get_report_tokenizer(tokenizer).count_batch(embedded)
+    metadata_bytes = 0
+    for chunk, text in zip(chunks, embedded):
+        metadata = {"top_level_heading": chunk.heading or "", "subheading": chunk.subheading or "",
+                    "chunk_text": text, **chunk_features(chunk.text)}
+        metadata_bytes += len(json.dumps(metadata, ensure_ascii=False).encode("utf-8"))
+
+    vectors = [stand_in_vector(text) for text in embedded]
+    searchable = [normalize_whitespace(chunk.text) for chunk in chunks]
+    latencies = []
+    recalled = 0
+    for question in questions:
+        start = time.perf_counter()
+        hits = top_k(vectors, stand_in_vector(question["question"]), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        evidence = normalize_whitespace(question["evidence"])
+        if any(evidence in searchable[hit] for hit in hits):
+            recalled += 1
+    latencies.sort()
+
+    sizes = sorted(token_counts)
+    return {
+        "max_tokens": max_tokens,
+        "min_tokens": min_tokens,
+        "chunks": len(chunks),
+        "chunk_seconds": chunk_seconds,
+        "mean_chunk_tokens": sum(sizes) / len(sizes) if sizes else 0.0,
+        "p90_chunk_tokens": percentile(sizes, 0.9),
+        "embedding_requests": math.ceil(len(chunks) / batch_size),
+        "embedding_tokens": sum(min(count, EMBEDDING_MAX_TOKENS) for count in token_counts),
+        "truncated_chunks": sum(1 for count in token_counts if count > EMBEDDING_MAX_TOKENS),
+        "vector_bytes": len(chunks) * VECTOR_BYTES,
+        "metadata_bytes": metadata_bytes,
+        "index_bytes": len(chunks) * VECTOR_BYTES + metadata_bytes,
+        "questions": len(questions),
+        "recall_at_k": recalled / len(questions) if questions else 0.0,
+        "k": k,
+        "latency_ms_p50": percentile(latencies, 0.5),
+        "latency_ms_p95": percentile(latencies, 0.95)
+    }
+
+def run_sweep(texts: Sequence[str], settings: Sequence[Tuple[int, int]] = SWEEP_SETTINGS,
+              questions: Sequence[Dict[str, str]] = NETFLIX_QUESTIONS, k: int = SWEEP_TOP_K,
+              output_file: Optional[str] = None) -> Dict[str, Any]:
+    """Run sweep_setting for every setting, print a table and write the results as JSON to output_file if given."""
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "tokenizer": get_tokenizer().name,
+        "estimated_tokens": not get_report_tokenizer().exact,
+        "vector_stand_in": f"hashed bag of words, {VECTOR_DIMENSION} dimensions",
+        "characters": sum(len(text) for text in texts),
+        "settings": [sweep_setting(texts, max_tokens, min_tokens, questions, k) for max_tokens, min_tokens in settings]
+    }
+    print_sweep_report(results)
+
+    if output_file:
+        output_dir = os.path.dirname(output_file)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with open(output_file, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to: {output_file}")
+    return results
+
+def print_sweep_report(results: Dict[str, Any]):
+    """Print the results produced by run_sweep, one row per setting."""
+    print(f"Chunk size sweep ({results['tokenizer']} tokenizer, {results['vector_stand_in']} stand-in)")
+    print(f"{'max/min':>9} {'chunks':>7} {'mean tok':>9} {'requests':>9} {'emb tokens':>11} {'trunc':>6} "
+          f"{'index MB':>9} {'recall@k':>9} {'p50 ms':>7} {'p95 ms':>7}")
+    for result in results["settings"]:
+        print(f"{result['max_tokens']:>5}/{result['min_tokens']:<3} {result['chunks']:>7} "
+              f"{result['mean_chunk_tokens']:>9.0f} {result['embedding_requests']:>9} "
+              f"{result['embedding_tokens']:>11,} {result['truncated_chunks']:>6} "
+              f"{result['index_bytes'] / 1e6:>9.2f} {result['recall_at_k']:>9.0%} "
+              f"{result['latency_ms_p50']:>7.1f} {result['latency_ms_p95']:>7.1f}")
+    if results.get("estimated_tokens"):
+        print("Token counts are word estimates; embedding tokens of table-heavy chunks are undercounted")
+
+def main():
+    # Usage: python chunk_size_sweep.py [markdown_file ...] [--settings 150:50,300:100] [--questions FILE]
+    #                                   [--top-k K] [--output FILE]
+    # Without files the Netflix sample and its question set are used. FILE holds a JSON
+    # list of {"question": ..., "evidence": ...} objects.
+    args = sys.argv[1:]
+    settings = SWEEP_SETTINGS
+    questions = NETFLIX_QUESTIONS
+    k = SWEEP_TOP_K
+    output_file = os.path.join("benchmark_results", f"chunk_sweep_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    if "--settings" in args:
+        idx = args.index("--settings")
+        settings = [tuple(int(value) for value in setting.split(":")) for setting in args[idx + 1].split(",")]
+        del args[idx:idx + 2]
+    if "--questions" in args:
+        idx = args.index("--questions")
+        with open(args[idx + 1], "r", encoding="utf-8") as f:
+            questions = json.load(f)
+        del args[idx:idx + 2]
+    if "--top-k" in args:
+        idx = args.index("--top-k")
+        k = int(args[idx + 1])
+        del args[idx:idx + 2]
+    if "--output" in args:
+        idx = args.index("--output")
+        output_file = args[idx + 1]
+        del args[idx:idx + 2]
+
+    texts = []
+    for path in args:
+        with open(path, "r", encoding="utf-8") as f:
+            texts.append(f.read())
+    texts = texts or [load_sample_filing()]
+    run_sweep(texts, settings, questions, k, output_file)
+
+if __name__ == "__main__":
+    main()
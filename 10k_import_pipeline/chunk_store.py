@@ -0,0 +1,286 @@
+import os
+import re
+import sys
+import json
+import mmap
+import time
+import hashlib
+from array import array
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Mapping
+
+from table_compaction import compact_tables
+from chunk_features import FeatureIndex, chunk_features, feature_keys
+
+# Default location of chunk stores, one directory per Pinecone namespace
+CHUNK_STORE_DIR = os.getenv("CHUNK_STORE_DIR", "chunk_store")
+
+CHUNK_STORE_VERSION = 1
+
+# Records are written with "id" as their first key, so IDs can be read without parsing the record
+RE_RECORD_ID = re.compile(rb'\{"id": "([^"]*)"')
+
+def chunk_id(chunk: Mapping[str, Any]) -> str:
+    """
+    Content ID of a chunk: a hash of its heading, subheading and text. Identical chunks
+    get the same ID in every run, which is what makes diffs between runs possible.
+    """
+    digest = hashlib.sha256()
+    for value in (chunk.get("heading"), chunk.get("subheading"), chunk.get("text")):
+        digest.update((value or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+def text_sha256(text: str) -> str:
+    """Hash of a parsed filing, stored in the chunk store header to tell whether it is stale."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_store_path(namespace: str, filing_key: str, store_dir: str = CHUNK_STORE_DIR) -> str:
+    """Path of the chunk store of a filing in a namespace."""
+    safe_key = "".join(c if c.isalnum() or c in "-_." else "_" for c in filing_key)
+    return os.path.join(store_dir, namespace or "default", f"{safe_key}.jsonl")
+
+def index_path(path: str) -> str:
+    return f"{path}.idx"
+
+def features_path(path: str) -> str:
+    return f"{path}.features"
+
+def indexed_path(path: str) -> str:
+    return f"{path}.indexed"
+
+def write_chunk_store(chunks: Iterable[Mapping[str, Any]], path: str,
+                      header: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Write chunks to a chunk store: a JSONL file with a header line and one record
+    (id, heading, subheading, text) per chunk, plus an index file with the byte offset
+    of every record as little-endian uint64, so any chunk can be read without scanning
+    the file. Both files are replaced atomically. Returns the number of chunks written.
+    Records of chunks with tables also get compact_text, the text with its tables
+    compacted (see table_compaction), which is what gets embedded and put into prompts.
+    Every record gets its features (see chunk_features), which are also written to a
+    bitmap feature index next to the store. A rewritten store is no longer marked as
+    indexed (see mark_indexed) until its chunks are indexed again.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    offsets = array('Q')
+    feature_index = FeatureIndex()
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        header_record = {"format": "chunk-store", "version": CHUNK_STORE_VERSION,
+                         "created": datetime.now().isoformat(timespec="seconds")}
+        header_record.update(header or {})
+        f.write(json.dumps(header_record).encode("utf-8") + b"\n")
+        for chunk in chunks:
+            offsets.append(f.tell())
+            record = {
+                "id": chunk_id(chunk),
+                "heading": chunk.get("heading"),
+                "subheading": chunk.get("subheading"),
+                "text": chunk.get("text")
+            }
+            compact = compact_tables(record["text"] or "")
+            if compact != record["text"]:
+                record["compact_text"] = compact
+            record["features"] = chunk_features(record["text"] or "")
+            feature_index.add(record["id"], feature_keys(record["heading"], record["subheading"], record["features"]))
+            f.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        offsets.append(f.tell())
+
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    temp_index_path = f"{index_path(path)}.tmp"
+    with open(temp_index_path, "wb") as f:
+        offsets.tofile(f)
+    temp_features_path = f"{features_path(path)}.tmp"
+    feature_index.save(temp_features_path)
+    if os.path.exists(indexed_path(path)):
+        os.remove(indexed_path(path))
+    os.replace(temp_path, path)
+    os.replace(temp_index_path, index_path(path))
+    os.replace(temp_features_path, features_path(path))
+    return len(offsets) - 1
+
+class ChunkStore:
+    """
+    Read-only view of a chunk store. The JSONL file is memory mapped and records are only
+    decoded when accessed, so opening a store costs one read of its offset index.
+    Supports len(), indexing, iteration and lookup by chunk ID.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        header_end = self.data.find(b"\n")
+        self.header = json.loads(self.data[:header_end])
+        if self.header.get("format") != "chunk-store":
+            self.close()
+            raise ValueError(f"{path} is not a chunk store")
+        self.offsets = self.load_offsets(header_end + 1)
+        self.ids = None
+
+    def load_offsets(self, first_offset: int) -> array:
+        """Read the offset index, or rebuild it from the newlines if it is missing or stale."""
+        offsets = array('Q')
+        try:
+            with open(index_path(self.path), "rb") as f:
+                offsets.frombytes(f.read())
+            if sys.byteorder != "little":
+                offsets.byteswap()
+        except OSError:
+            pass
+        if offsets and offsets[0] == first_offset and offsets[-1] == len(self.data):
+            return offsets
+
+        offsets = array('Q', [first_offset])
+        position = first_offset
+        while position < len(self.data):
+            position = self.data.find(b"\n", position) + 1 or len(self.data)
+            offsets.append(position)
+        return offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position: int) -> Dict[str, Any]:
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("chunk store index out of range")
+        return json.loads(self.data[self.offsets[position]:self.offsets[position + 1]])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for position in range(len(self)):
+            yield self[position]
+
+    def get(self, identifier: str) -> Optional[Dict[str, Any]]:
+        """The chunk with the given content ID, or None."""
+        if self.ids is None:
+            self.ids = {}
+            for position in range(len(self)):
+                match = RE_RECORD_ID.match(self.data, self.offsets[position])
+                if match:
+                    self.ids.setdefault(match.group(1).decode("ascii"), position)
+        position = self.ids.get(identifier)
+        return None if position is None else self[position]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self) -> "ChunkStore":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def load_chunk_store(path: str, source_text: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    All chunks of a store, or None if it does not exist or, when source_text is given,
+    was written for a different version of the filing.
+    """
+    if not os.path.exists(path):
+        return None
+    with ChunkStore(path) as store:
+        if source_text is not None and store.header.get("source_sha256") != text_sha256(source_text):
+            return None
+        return list(store)
+
+def mark_indexed(path: str) -> int:
+    """
+    Mark a chunk store as indexed, once every one of its chunks has a vector in its
+    namespace. Only marked stores are used to answer retrieval questions without Pinecone
+    (a store is written before its chunks are upserted, which may fail). Returns the
+    number of vectors the store accounts for.
+    """
+    with ChunkStore(path) as store:
+        vectors = len({chunk["id"] for chunk in store})
+    temp_path = f"{indexed_path(path)}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"vectors": vectors, "indexed": datetime.now().isoformat(timespec="seconds")}, f)
+    os.replace(temp_path, indexed_path(path))
+    return vectors
+
+def namespace_stores(namespace: str, store_dir: str = CHUNK_STORE_DIR, indexed: bool = True) -> List[str]:
+    """Paths of the chunk stores in a namespace; only those marked as indexed unless indexed is False."""
+    directory = os.path.join(store_dir, namespace or "default")
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.endswith(".jsonl") and (not indexed or os.path.exists(indexed_path(os.path.join(directory, name)))))
+
+def namespace_covered(namespace: str, index, store_dir: str = CHUNK_STORE_DIR) -> bool:
+    """
+    Whether the indexed chunk stores of a namespace account for every vector the Pinecone
+    index has in it, so they can answer for the namespace. They do not when it holds
+    filings indexed on another machine or by an older pipeline, or was changed since.
+    """
+    paths = namespace_stores(namespace, store_dir)
+    if not paths:
+        return False
+    try:
+        namespaces = index.describe_index_stats().namespaces or {}
+    except Exception as e:
+        print(f"Could not read the vector count of namespace {namespace}: {str(e)}")
+        return False
+    vectors = 0
+    for path in paths:
+        with open(indexed_path(path), "r", encoding="utf-8") as f:
+            vectors += json.load(f)["vectors"]
+    return namespace in namespaces and namespaces[namespace].vector_count == vectors
+
+def namespace_subheadings(namespace: str, headings: Iterable[str],
+                          store_dir: str = CHUNK_STORE_DIR) -> Optional[Dict[str, List[str]]]:
+    """
+    Subheadings under each of headings across the indexed chunk stores of a namespace, or
+    None if it has none. Callers check namespace_covered first, and otherwise query Pinecone.
+    """
+    paths = namespace_stores(namespace, store_dir)
+    if not paths:
+        return None
+    subheadings = {heading: set() for heading in headings}
+    for path in paths:
+        with ChunkStore(path) as store:
+            for chunk in store:
+                heading_subheadings = subheadings.get(chunk["heading"])
+                if heading_subheadings is not None and (chunk["subheading"] or "").strip():
+                    heading_subheadings.add(chunk["subheading"].strip())
+    return {heading: sorted(values) for heading, values in subheadings.items()}
+
+def namespace_feature_index(namespace: str, store_dir: str = CHUNK_STORE_DIR) -> Optional[FeatureIndex]:
+    """
+    Feature index of the chunks of the indexed chunk stores of a namespace, or None if it
+    has none or one of them has no feature index. Callers check namespace_covered first,
+    and otherwise search without feature filters.
+    """
+    paths = namespace_stores(namespace, store_dir)
+    if not paths or not all(os.path.exists(features_path(path)) for path in paths):
+        return None
+    combined = FeatureIndex()
+    for path in paths:
+        combined.extend(FeatureIndex.load(features_path(path)))
+    return combined
+
+def main():
+    # Usage: python chunk_store.py <chunk_store.jsonl> [chunk_id]
+    if len(sys.argv) < 2:
+        print("Usage: python chunk_store.py <chunk_store.jsonl> [chunk_id]")
+        sys.exit(1)
+    start = time.perf_counter()
+    with ChunkStore(sys.argv[1]) as store:
+        chunks = list(store)
+        seconds = time.perf_counter() - start
+        print(f"{sys.argv[1]}: {len(chunks)} chunks loaded in {seconds * 1000:.1f} ms")
+        for key in ("filing", "source_sha256", "created"):
+            if key in store.header:
+                print(f"{key}: {store.header[key]}")
+        if len(sys.argv) > 2:
+            chunk = store.get(sys.argv[2])
+            print(json.dumps(chunk, indent=2) if chunk else f"No chunk with ID {sys.argv[2]}")
+
+if __name__ == "__main__":
+    main()
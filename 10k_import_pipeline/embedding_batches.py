@@ -0,0 +1,153 @@
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Sequence
+
+from token_counting import EMBEDDING_MODEL, EMBEDDING_MAX_BATCH_SIZE
+from embedding_cache import EmbeddingCache
+
+# Inputs per embedding request (at most EMBEDDING_MAX_BATCH_SIZE) and requests in flight at once
+EMBED_BATCH_SIZE = EMBEDDING_MAX_BATCH_SIZE
+EMBED_CONCURRENCY = 4
+
+# Attempts per request before a batch is split, and the first backoff delay (doubled per retry)
+EMBED_MAX_ATTEMPTS = 3
+EMBED_RETRY_DELAY = 1.0
+
+# Failed requests in a row after which a run stops retrying and splitting (the service is down,
+# not an input bad); the remaining inputs fail fast
+EMBED_MAX_CONSECUTIVE_FAILURES = 10
+
+class EmbeddingStats:
+    """Request counts of one embed_texts run, updated by the worker threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.splits = 0
+        self.cached = 0
+        self.consecutive_failures = 0
+
+    def count(self, field: str):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def request_done(self, failed: bool):
+        with self.lock:
+            self.consecutive_failures = self.consecutive_failures + 1 if failed else 0
+
+    def outage(self) -> bool:
+        return self.consecutive_failures >= EMBED_MAX_CONSECUTIVE_FAILURES
+
+def request_embeddings(pc, texts: Sequence[str], input_type: str) -> List[Optional[List[float]]]:
+    """One embedding request; positions the response has no values for are None."""
+    response = pc.inference.embed(
+        model=EMBEDDING_MODEL,
+        inputs=list(texts),
+        parameters={"input_type": input_type, "truncate": "END"}
+    )
+    data = list(response.data) if response and response.data else []
+    values = [getattr(embedding, "values", None) or None for embedding in data[:len(texts)]]
+    return values + [None] * (len(texts) - len(values))
+
+def embed_batch(pc, texts: Sequence[str], input_type: str, stats: EmbeddingStats,
+                max_attempts: int = EMBED_MAX_ATTEMPTS, retry_delay: float = EMBED_RETRY_DELAY) -> List[Optional[List[float]]]:
+    """
+    Embed one batch with retries and exponential backoff. After a successful request only
+    the inputs that got no embedding are sent again. A batch whose request keeps failing is
+    split in halves, each embedded the same way, so one bad input only fails itself. Inputs
+    that still fail are None; after EMBED_MAX_CONSECUTIVE_FAILURES failed requests in a row
+    the run gives up on the remaining ones without further requests.
+    """
+    results: List[Optional[List[float]]] = [None] * len(texts)
+    pending = list(range(len(texts)))
+    error = None
+    for attempt in range(max_attempts):
+        if stats.outage():
+            break
+        if attempt:
+            stats.count("retries")
+            time.sleep(retry_delay * 2 ** (attempt - 1))
+        try:
+            stats.count("requests")
+            values = request_embeddings(pc, [texts[i] for i in pending], input_type)
+        except Exception as e:
+            stats.request_done(failed=True)
+            error = e
+            continue
+        stats.request_done(failed=False)
+        error = None
+        for position, value in zip(pending, values):
+            results[position] = value
+        pending = [position for position in pending if results[position] is None]
+        if not pending:
+            return results
+
+    if error is not None and len(pending) > 1 and not stats.outage():
+        stats.count("splits")
+        middle = len(pending) // 2
+        for half in (pending[:middle], pending[middle:]):
+            values = embed_batch(pc, [texts[i] for i in half], input_type, stats, max_attempts, retry_delay)
+            for position, value in zip(half, values):
+                results[position] = value
+    elif error is not None:
+        print(f"Error embedding {len(pending)} inputs: {str(error)}")
+    return results
+
+def embed_texts(pc, texts: Sequence[str], input_type: str = "passage", batch_size: int = EMBED_BATCH_SIZE,
+                concurrency: int = EMBED_CONCURRENCY, stats: Optional[EmbeddingStats] = None,
+                retry_delay: float = EMBED_RETRY_DELAY, cache: Optional[EmbeddingCache] = None) -> List[Optional[List[float]]]:
+    """
+    Embeddings of texts in order, None for inputs that failed. Texts are sent in batches
+    of batch_size (capped at the model's input limit), concurrency requests at a time.
+    With a cache only the texts it has no embedding for are sent, and their embeddings
+    are added to it; a cache that cannot be read or written is skipped.
+    """
+    batch_size = max(1, min(batch_size, EMBEDDING_MAX_BATCH_SIZE))
+    stats = stats or EmbeddingStats()
+    results = [None] * len(texts)
+    if cache is not None:
+        try:
+            results = cache.get_many(EMBEDDING_MODEL, input_type, texts)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error reading the embedding cache, embedding without it: {str(e)}")
+    missing = [position for position, values in enumerate(results) if values is None]
+    with stats.lock:
+        stats.cached += len(texts) - len(missing)
+    batches = [[texts[position] for position in missing[i:i + batch_size]] for i in range(0, len(missing), batch_size)]
+    if not batches:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(batches)))) as executor:
+        embedded = executor.map(lambda batch: embed_batch(pc, batch, input_type, stats, EMBED_MAX_ATTEMPTS, retry_delay),
+                                batches)
+        embeddings = [values for batch in embedded for values in batch]
+    for position, values in zip(missing, embeddings):
+        results[position] = values
+    if cache is not None:
+        try:
+            cache.put_many(EMBEDDING_MODEL, input_type, [texts[position] for position in missing], embeddings)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error writing the embedding cache: {str(e)}")
+    return results
+
+def embedding_report(texts: int, failed: int, stats: EmbeddingStats, seconds: float) -> Dict[str, Any]:
+    """Request counts and throughput of the embeddings of one filing."""
+    return {
+        "texts": texts,
+        "failed": failed,
+        "requests": stats.requests,
+        "retries": stats.retries,
+        "splits": stats.splits,
+        "cached": stats.cached,
+        "seconds": seconds,
+        "texts_per_second": texts / seconds if seconds else 0.0
+    }
+
+def print_embedding_report(report: Dict[str, Any]):
+    """Print a report produced by embedding_report."""
+    print(f"Embedding: {report['texts'] - report['failed']} of {report['texts']} texts "
+          f"({report['cached']} from the cache) in {report['requests']} requests "
+          f"({report['retries']} retries, {report['splits']} split batches), {report['seconds']:.1f}s, "
+          f"{report['texts_per_second']:.1f} texts/s")
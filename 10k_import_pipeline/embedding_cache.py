@@ -0,0 +1,320 @@
+import os
+import sys
+import mmap
+import time
+import struct
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Sequence
+
+try:
+    import fcntl
+except ImportError:
+    # No file locks on Windows: the cache is then only safe to share between threads
+    fcntl = None
+
+# Persistent embedding cache shared by indexing and the query paths; an empty path disables it
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+
+# Entries kept before the least recently used ones are evicted (about 4 KB each as float32)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "250000"))
+
+# Storage type of the vectors: "float32", or "float16" for half the size at about 3 significant digits
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")
+DTYPE_CODES = {"float32": "f", "float16": "e"}
+
+# Slots the vector file grows by at a time
+CACHE_GROW_SLOTS = 1024
+
+# Keys per SELECT; SQLite limits the variables of a statement
+CACHE_LOOKUP_BATCH = 500
+
+# Seconds a process waits for another one's SQLite write lock
+CACHE_BUSY_TIMEOUT = 30.0
+
+def cache_key(model: str, input_type: str, text: str) -> bytes:
+    """Content address of an embedding: the hash of model, input type and text."""
+    return hashlib.sha256(f"{model}\0{input_type}\0{text}".encode("utf-8")).digest()
+
+def vectors_path(path: str) -> str:
+    """Path of the vector file next to the cache database."""
+    return os.path.splitext(path)[0] + ".vectors"
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by cache_key. SQLite maps each key to a slot of a
+    memory-mapped vector file (fixed-size little-endian float32 or float16 records) and
+    keeps its last use; when max_entries is reached the least recently used entries are
+    evicted and their slots reused. Hits, misses, stores and evictions are counted since
+    the cache was opened. Safe to share between threads, and between processes through
+    a lock on the vector file: a writer holds it exclusively from allocating slots to
+    committing their keys, readers hold it shared from looking up slots to reading them,
+    so a slot is never read while it is reused.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+                 dtype: str = EMBEDDING_CACHE_DTYPE):
+        if dtype not in DTYPE_CODES:
+            raise ValueError(f"Unknown embedding cache dtype '{dtype}'. Available: {', '.join(DTYPE_CODES)}")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        self.connection = sqlite3.connect(path, timeout=CACHE_BUSY_TIMEOUT, check_same_thread=False)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key BLOB PRIMARY KEY,
+                slot INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS settings (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        self.dtype = dtype
+        self.dimension = None
+        self.record = None
+        self.load_settings()
+
+        self.file = open(vectors_path(path), "a+b")
+        self.map = None
+        self.remap()
+
+    def load_settings(self):
+        """Dtype and dimension of an existing cache; its vector file keeps the dtype it was created with."""
+        settings = dict(self.connection.execute("SELECT name, value FROM settings"))
+        if "dimension" in settings:
+            self.dtype = settings["dtype"]
+            self.dimension = int(settings["dimension"])
+            self.record = struct.Struct(f"<{self.dimension}{DTYPE_CODES[self.dtype]}")
+        else:
+            self.dimension = None
+            self.record = None
+
+    @contextmanager
+    def file_lock(self, exclusive: bool):
+        """Hold the lock on the vector file shared by all processes using the cache."""
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+    def sync_map(self):
+        """Remap the vector file if another process grew or cleared it since it was mapped."""
+        size = os.fstat(self.file.fileno()).st_size
+        if (self.map is None and size) or (self.map is not None and len(self.map) != size):
+            self.remap()
+
+    def remap(self, size: Optional[int] = None):
+        """Map the vector file, first growing it to size bytes if given."""
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if size is not None and size > os.fstat(self.file.fileno()).st_size:
+            self.file.truncate(size)
+        if os.fstat(self.file.fileno()).st_size:
+            self.map = mmap.mmap(self.file.fileno(), 0)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def get_many(self, model: str, input_type: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Cached embeddings of texts in order, None where there is none; hits count as a use."""
+        keys = [cache_key(model, input_type, text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        with self.lock:
+            slots = {}
+            with self.file_lock(exclusive=False):
+                if self.record is None:
+                    # Another process may have stored the first vectors since the cache was opened
+                    self.load_settings()
+                if self.record is not None:
+                    unique = list(dict.fromkeys(keys))
+                    for i in range(0, len(unique), CACHE_LOOKUP_BATCH):
+                        batch = unique[i:i + CACHE_LOOKUP_BATCH]
+                        slots.update(self.connection.execute(
+                            f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch))
+                if slots:
+                    self.sync_map()
+                for position, key in enumerate(keys):
+                    slot = slots.get(key)
+                    if slot is not None:
+                        offset = slot * self.record.size
+                        results[position] = list(self.record.unpack_from(self.map, offset))
+            if slots:
+                # Taking the write lock up front waits for other writers instead of failing
+                # with "database is locked" when upgrading from a read lock
+                now = time.time()
+                self.connection.execute("BEGIN IMMEDIATE")
+                self.connection.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                                            [(now, key) for key in slots])
+                self.connection.commit()
+            hits = sum(1 for values in results if values is not None)
+            self.hits += hits
+            self.misses += len(texts) - hits
+        return results
+
+    def put_many(self, model: str, input_type: str, texts: Sequence[str], embeddings: Sequence[Optional[List[float]]]):
+        """Store the embeddings of texts (None entries are skipped), evicting the least recently used if full."""
+        entries = {}
+        for text, values in zip(texts, embeddings):
+            if values is not None:
+                entries[cache_key(model, input_type, text)] = values
+        if not entries:
+            return
+        with self.lock, self.file_lock(exclusive=True):
+            # Slots are allocated from the committed state, which no other process can change
+            # until this transaction is committed
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.store(entries)
+                self.connection.commit()
+            except BaseException:
+                self.connection.rollback()
+                raise
+
+    def store(self, entries: Dict[bytes, List[float]]):
+        """Allocate slots for the new entries and write their vectors; called by put_many in a transaction."""
+        self.load_settings()
+        if self.record is None:
+            self.dimension = len(next(iter(entries.values())))
+            self.record = struct.Struct(f"<{self.dimension}{DTYPE_CODES[self.dtype]}")
+            self.connection.executemany("INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)",
+                                        [("dtype", self.dtype), ("dimension", str(self.dimension))])
+        entries = {key: values for key, values in entries.items() if len(values) == self.dimension}
+        existing = set()
+        keys = list(entries)
+        for i in range(0, len(keys), CACHE_LOOKUP_BATCH):
+            batch = keys[i:i + CACHE_LOOKUP_BATCH]
+            existing.update(key for (key,) in self.connection.execute(
+                f"SELECT key FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch))
+        new = [key for key in keys if key not in existing][:self.max_entries]
+        if not new:
+            return
+
+        count, next_slot = self.connection.execute("SELECT COUNT(*), COALESCE(MAX(slot) + 1, 0) FROM entries").fetchone()
+        free = []
+        overflow = count + len(new) - self.max_entries
+        if overflow > 0:
+            evicted = self.connection.execute(
+                "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (overflow,)).fetchall()
+            self.connection.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+            free = [slot for _, slot in evicted]
+            self.evictions += len(evicted)
+        slots = free + list(range(next_slot, next_slot + len(new) - len(free)))
+
+        self.sync_map()
+        needed = (max(slots) + 1) * self.record.size
+        if self.map is None or len(self.map) < needed:
+            grow = CACHE_GROW_SLOTS * self.record.size
+            self.remap((needed + grow - 1) // grow * grow)
+        for key, slot in zip(new, slots):
+            self.record.pack_into(self.map, slot * self.record.size, *entries[key])
+        self.map.flush()
+
+        now = time.time()
+        self.connection.executemany("INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                                    [(key, slot, now) for key, slot in zip(new, slots)])
+        self.stores += len(new)
+
+    def clear(self):
+        with self.lock, self.file_lock(exclusive=True):
+            self.connection.execute("DELETE FROM entries")
+            self.connection.execute("DELETE FROM settings")
+            self.connection.commit()
+            self.dimension = None
+            self.record = None
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+            self.file.truncate(0)
+
+    def close(self):
+        with self.lock:
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+            self.file.close()
+            self.connection.close()
+
+@lru_cache(maxsize=None)
+def get_embedding_cache(path: Optional[str] = None) -> Optional[EmbeddingCache]:
+    """
+    The shared cache at path (default EMBEDDING_CACHE_PATH), or None if caching is
+    disabled or the cache cannot be opened (e.g. in a read-only directory), so that
+    callers embed without it.
+    """
+    path = EMBEDDING_CACHE_PATH if path is None else path
+    if not path:
+        return None
+    try:
+        return EmbeddingCache(path)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Embedding cache at '{path}' unavailable, embedding without it: {str(e)}")
+        return None
+
+def cache_report(cache: EmbeddingCache) -> Dict[str, Any]:
+    """Size of the cache and its hit rate since it was opened."""
+    lookups = cache.hits + cache.misses
+    entries = len(cache)
+    return {
+        "path": cache.path,
+        "entries": entries,
+        "max_entries": cache.max_entries,
+        "dtype": cache.dtype,
+        "bytes": entries * cache.record.size if cache.record else 0,
+        "hits": cache.hits,
+        "misses": cache.misses,
+        "hit_rate": cache.hits / lookups if lookups else 0.0,
+        "stores": cache.stores,
+        "evictions": cache.evictions
+    }
+
+def print_cache_report(report: Dict[str, Any]):
+    """Print a report produced by cache_report."""
+    print(f"Embedding cache: {report['hits']} hits, {report['misses']} misses ({report['hit_rate']:.1%} hit rate), "
+          f"{report['stores']} stored, {report['evictions']} evicted; {report['entries']:,} of "
+          f"{report['max_entries']:,} entries ({report['dtype']}, {report['bytes'] / 1e6:.1f} MB)")
+
+def main():
+    # Usage: python embedding_cache.py [stats|clear] [--path FILE]
+    args = sys.argv[1:]
+    path = EMBEDDING_CACHE_PATH
+    if "--path" in args:
+        idx = args.index("--path")
+        path = args[idx + 1]
+        del args[idx:idx + 2]
+    command = args[0] if args else "stats"
+    if command not in ("stats", "clear"):
+        print("Usage: python embedding_cache.py [stats|clear] [--path FILE]")
+        sys.exit(1)
+    if not path or not os.path.exists(path):
+        print(f"No embedding cache at '{path}'")
+        return
+    cache = EmbeddingCache(path)
+    if command == "clear":
+        cache.clear()
+        print(f"Cleared {path}")
+    else:
+        print_cache_report(cache_report(cache))
+    cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+import os
+import re
+import sys
+import json
+from array import array
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Mapping, NamedTuple, Set
+
+from table_compaction import split_row, is_separator_row, join_value_cells, is_table_line
+from chunk_store import chunk_id
+
+# Default location of fact stores, one directory per Pinecone namespace
+FACT_STORE_DIR = os.getenv("FACT_STORE_DIR", "fact_store")
+
+FACT_STORE_VERSION = 1
+
+class Fact(NamedTuple):
+    """One value of a financial table: line item, period, value and unit, plus where it was found."""
+    filing: str
+    heading: str
+    subheading: str
+    line_item: str
+    period: str
+    value: float
+    unit: str
+    chunk_id: str
+
+# Fact fields stored as dictionary encoded strings (uint32 codes); value is stored as float64
+STRING_COLUMNS = ("filing", "heading", "subheading", "line_item", "period", "unit", "chunk_id")
+
+# A column header naming a period, e.g. "2023", "December 31, 2023", "Fiscal 2023", "2023 vs. 2022"
+RE_PERIOD_CELL = re.compile(r'(?i)(?:[a-z]+\.?\s+(?:\d{1,2},?\s+)?)?(?:fiscal\s+)?(?:19|20)\d{2}(?:\s+vs\.?\s+(?:19|20)\d{2})?')
+RE_YEAR = re.compile(r'\b(?:19|20)\d{2}\b')
+
+# A table value after join_value_cells, e.g. "$1,234", "(5,408)", "$(0.12)", "7%"
+RE_VALUE_CELL = re.compile(r'[$€£¥]?\(?[$€£¥]?-?\d[\d,]*(?:\.\d+)?\)?%?')
+
+# Footnote marker after a line item, e.g. "DVD revenues (1)"
+RE_FOOTNOTE = re.compile(r'\s*\(\d{1,2}\)$')
+
+# Scale note of a financial table, e.g. "(in thousands, except per share data)"
+RE_UNIT_NOTE = re.compile(r'(?i)\(in\s+(thousands|millions|billions)(,\s*except[^)]*)?\)?')
+
+def parse_value(cell: str) -> float:
+    """Numeric value of a RE_VALUE_CELL cell; parentheses mean a negative amount."""
+    digits = cell.strip("$€£¥%()").replace(",", "").lstrip("$€£¥")
+    value = float(digits)
+    return -value if "(" in cell else value
+
+def value_unit(cell: str, line_item: str, currency: bool, scale: Optional[str], scale_has_exceptions: bool) -> str:
+    """
+    Unit of a value: "%" for percentages, else the currency and the table's scale (e.g.
+    "USD millions"). Filings only put "$" before the first value of a row, so currency
+    says whether any value of the row has it.
+    """
+    if cell.endswith("%"):
+        return "%"
+    parts = []
+    if currency:
+        parts.append("USD")
+    # "(in thousands, except per share data)": per share/member amounts are not scaled
+    if scale and not (scale_has_exceptions and " per " in f" {line_item.lower()} "):
+        parts.append(scale)
+    return " ".join(parts)
+
+def is_period_row(cells: List[str]) -> bool:
+    """Whether a row holds column periods: every non-empty cell after an optional label is a period."""
+    values = [cell for cell in cells if cell]
+    if values and not RE_PERIOD_CELL.fullmatch(values[0]):
+        values = values[1:]
+    return bool(values) and all(RE_PERIOD_CELL.fullmatch(cell) for cell in values)
+
+def table_facts(lines: List[str], scale: Optional[str], scale_has_exceptions: bool) -> List[Dict[str, Any]]:
+    """
+    Facts (line_item, period, value, unit) of one markdown table. Values are matched to
+    the periods of the closest period row above them: by column in tables with a header
+    (rows above the separator), by order in LlamaParse layout grids whose columns do not
+    line up (see table_compaction). Rows without a label or a period are skipped.
+    """
+    rows = [split_row(line) for line in lines]
+    separator = next((i for i, cells in enumerate(rows) if is_separator_row(cells)), None)
+    positioned = separator is not None and any(any(cells) for cells in rows[:separator])
+
+    facts = []
+    periods = None
+    for index, cells in enumerate(rows):
+        if index == separator or not any(cells):
+            continue
+        note = RE_UNIT_NOTE.search(" ".join(cells))
+        if note:
+            scale, scale_has_exceptions = note.group(1).lower(), bool(note.group(2))
+        cells = join_value_cells(cells)
+        if is_period_row(cells):
+            if positioned:
+                periods = {column: cell for column, cell in enumerate(cells) if RE_PERIOD_CELL.fullmatch(cell)}
+            else:
+                periods = [cell for cell in cells if RE_PERIOD_CELL.fullmatch(cell)]
+            continue
+        if periods is None:
+            continue
+
+        label_column = next((column for column, cell in enumerate(cells) if cell), None)
+        label = cells[label_column]
+        if RE_VALUE_CELL.fullmatch(label):
+            continue
+        values = [(column, cell) for column, cell in enumerate(cells)
+                  if column > label_column and RE_VALUE_CELL.fullmatch(cell)]
+        if positioned:
+            pairs = [(periods[column], cell) for column, cell in values if column in periods]
+        else:
+            pairs = list(zip(periods, (cell for _, cell in values)))
+        line_item = RE_FOOTNOTE.sub("", label).rstrip(":")
+        currency = any("$" in cell for _, cell in values)
+        for period, cell in pairs:
+            facts.append({"line_item": line_item, "period": period, "value": parse_value(cell),
+                          "unit": value_unit(cell, label, currency, scale, scale_has_exceptions)})
+    return facts
+
+def extract_facts(chunk: Mapping[str, Any], filing: str = "") -> List[Fact]:
+    """
+    Facts of every markdown table in a chunk. The chunker keeps tables intact
+    (split_chunk_preserve_tables), so a table is never split across chunks. A scale note
+    ("(in millions)") applies to the table it is in or the tables after it in the chunk.
+    """
+    text = chunk.get("text") or ""
+    if '|' not in text:
+        return []
+    heading = chunk.get("heading") or ""
+    subheading = chunk.get("subheading") or ""
+    identifier = chunk.get("id") or chunk_id(chunk)
+
+    facts = []
+    scale, scale_has_exceptions = None, False
+    table = []
+    for line in text.split('\n') + [""]:
+        if is_table_line(line):
+            table.append(line)
+            continue
+        if table:
+            for fact in table_facts(table, scale, scale_has_exceptions):
+                facts.append(Fact(filing, heading, subheading, fact["line_item"], fact["period"],
+                                  fact["value"], fact["unit"], identifier))
+            table = []
+        note = RE_UNIT_NOTE.search(line)
+        if note:
+            scale, scale_has_exceptions = note.group(1).lower(), bool(note.group(2))
+    return facts
+
+def fact_store_dir(namespace: str, store_dir: str = FACT_STORE_DIR) -> str:
+    """Directory of the fact store of a namespace."""
+    return os.path.join(store_dir, namespace or "default")
+
+class FactStore:
+    """
+    Columnar store of the facts of all filings in a namespace. Every Fact field is one
+    column file: strings are dictionary encoded (uint32 codes into a per-column list of
+    distinct values, kept in facts.json) and values are float64, all little-endian.
+    Lookups filter on the small dictionaries first and then scan only the code columns.
+    """
+
+    def __init__(self, namespace: str, store_dir: str = FACT_STORE_DIR):
+        self.directory = fact_store_dir(namespace, store_dir)
+        self.dictionaries = {name: [] for name in STRING_COLUMNS}
+        self.columns = {name: array('I') for name in STRING_COLUMNS}
+        self.columns["value"] = array('d')
+        schema_path = os.path.join(self.directory, "facts.json")
+        if not os.path.exists(schema_path):
+            return
+        with open(schema_path, "r", encoding="utf-8") as f:
+            schema = json.load(f)
+        self.dictionaries = schema["dictionaries"]
+        for name, column in self.columns.items():
+            with open(os.path.join(self.directory, f"{name}.bin"), "rb") as f:
+                column.frombytes(f.read())
+            if sys.byteorder != "little":
+                column.byteswap()
+            if len(column) != schema["rows"]:
+                raise ValueError(f"Fact store column {name} has {len(column)} rows, expected {schema['rows']}")
+
+    def __len__(self) -> int:
+        return len(self.columns["value"])
+
+    def fact(self, row: int) -> Fact:
+        values = {name: self.dictionaries[name][self.columns[name][row]] for name in STRING_COLUMNS}
+        return Fact(value=self.columns["value"][row], **values)
+
+    def __iter__(self) -> Iterator[Fact]:
+        for row in range(len(self)):
+            yield self.fact(row)
+
+    def rows_where(self, column: str, values: Set[str]) -> List[int]:
+        """Rows whose string column holds one of values."""
+        codes = {code for code, value in enumerate(self.dictionaries[column]) if value in values}
+        if not codes:
+            return []
+        return [row for row, code in enumerate(self.columns[column]) if code in codes]
+
+    def replace_filing(self, filing: str, facts: Iterable[Fact]):
+        """Replace the facts of a filing (the other filings' facts are kept) and save the store."""
+        kept = [fact for fact in self if fact.filing != filing]
+        self.dictionaries = {name: [] for name in STRING_COLUMNS}
+        self.columns = {name: array('I') for name in STRING_COLUMNS}
+        self.columns["value"] = array('d')
+        codes = {name: {} for name in STRING_COLUMNS}
+        for fact in kept + list(facts):
+            for name in STRING_COLUMNS:
+                value = getattr(fact, name)
+                code = codes[name].get(value)
+                if code is None:
+                    code = codes[name][value] = len(self.dictionaries[name])
+                    self.dictionaries[name].append(value)
+                self.columns[name].append(code)
+            self.columns["value"].append(fact.value)
+        self.save()
+
+    def save(self):
+        """Write all column files, then the schema; every file is replaced atomically."""
+        os.makedirs(self.directory, exist_ok=True)
+        for name, column in self.columns.items():
+            path = os.path.join(self.directory, f"{name}.bin")
+            if sys.byteorder != "little":
+                column = array(column.typecode, column)
+                column.byteswap()
+            with open(f"{path}.tmp", "wb") as f:
+                column.tofile(f)
+            os.replace(f"{path}.tmp", path)
+        schema_path = os.path.join(self.directory, "facts.json")
+        with open(f"{schema_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"format": "fact-store", "version": FACT_STORE_VERSION, "rows": len(self),
+                       "columns": list(STRING_COLUMNS) + ["value"], "dictionaries": self.dictionaries}, f)
+        os.replace(f"{schema_path}.tmp", schema_path)
+
+def filing_fact_count(namespace: str, filing: str, store_dir: str = FACT_STORE_DIR) -> int:
+    """Number of facts of a filing in its namespace's fact store (0 if there is no store)."""
+    return len(FactStore(namespace, store_dir).rows_where("filing", {filing}))
+
+def write_filing_facts(chunks: Iterable[Mapping[str, Any]], namespace: str, filing: str,
+                       store_dir: str = FACT_STORE_DIR) -> int:
+    """Extract the table facts of a filing's chunks into its namespace's fact store. Returns the fact count."""
+    facts = [fact for chunk in chunks for fact in extract_facts(chunk, filing)]
+    FactStore(namespace, store_dir).replace_filing(filing, facts)
+    return len(facts)
+
+# Words that do not identify a line item
+LOOKUP_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "by", "for", "from", "in", "include", "including", "its", "of",
+    "on", "or", "the", "their", "to", "total", "with", "e.g", "data", "last", "past", "year", "years",
+    "identify", "quantify", "provide", "extract", "company", "company's", "main", "each", "all"
+}
+RE_LOOKUP_WORD = re.compile(r"[a-z][a-z&'.\-]*")
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5}
+RE_RECENT_YEARS = re.compile(r'(?i)\b(?:last|past|previous|recent)\s+(\d|one|two|three|four|five)\s+(?:fiscal\s+)?years?\b')
+
+# Lookups matching more facts than this are too broad to answer without vector search
+MAX_LOOKUP_FACTS = 200
+
+# Words asking for reasons, context or outlook rather than reported numbers; questions
+# with any of them always need vector search, facts only add to its results
+NARRATIVE_WORDS = {
+    "why", "explain", "describe", "discuss", "driver", "drive", "driven", "factor", "reason", "cause",
+    "risk", "affect", "impact", "influence", "future", "outlook", "expect", "strategy", "strategie",
+    "trend", "behind", "context", "challenge", "opportunity", "opportunitie", "competition", "competitive"
+}
+
+# Words of a question that ask for a number without naming what it is
+QUESTION_WORDS = {"what", "was", "were", "how", "much", "many", "is", "did", "does", "value", "amount",
+                  "report", "reported", "figure", "over", "during", "between", "fiscal"} | set(NUMBER_WORDS)
+
+# Share of the remaining question words the matched line items must cover for the facts
+# to answer the question on their own
+MIN_LOOKUP_COVERAGE = 0.75
+
+def lookup_words(text: str) -> Set[str]:
+    """Normalized content words of text: lowercase, singular, without stopwords."""
+    words = set()
+    for word in RE_LOOKUP_WORD.findall(text.lower()):
+        word = word.strip(".'-")
+        if word.endswith("'s"):
+            word = word[:-2]
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        if word and word not in LOOKUP_STOPWORDS:
+            words.add(word)
+    return words
+
+def period_year(period: str) -> Optional[int]:
+    """The year of a single-period column header, None for comparisons like "2023 vs. 2022"."""
+    years = RE_YEAR.findall(period)
+    return int(years[0]) if len(years) == 1 else None
+
+def lookup_facts(namespace: str, question: str, store_dir: str = FACT_STORE_DIR,
+                 limit: int = MAX_LOOKUP_FACTS) -> List[Fact]:
+    """
+    Facts answering a factual question directly: facts whose line item words all occur
+    in the question (the most specific line items only, so "streaming revenues" does not
+    also return "Revenues"), restricted to the years the question names (e.g. "2023", "last 3
+    years"). Returns [] when the namespace has no fact store, nothing matches, or more
+    than limit facts match, so callers can fall back to vector search.
+    """
+    store = FactStore(namespace, store_dir)
+    if not len(store):
+        return []
+    question_words = lookup_words(question)
+    matches = {item: lookup_words(item) for item in store.dictionaries["line_item"]}
+    matches = {item: words for item, words in matches.items() if words and words <= question_words}
+    line_items = {item for item, words in matches.items()
+                  if not any(words < other for other in matches.values())}
+    facts = [store.fact(row) for row in store.rows_where("line_item", line_items)]
+
+    years = {int(year) for year in RE_YEAR.findall(question)}
+    recent = RE_RECENT_YEARS.search(question)
+    if not years and recent:
+        count = NUMBER_WORDS.get(recent.group(1).lower()) or int(recent.group(1))
+        available = sorted({period_year(fact.period) for fact in facts} - {None}, reverse=True)
+        years = set(available[:count])
+    if years:
+        facts = [fact for fact in facts if period_year(fact.period) in years]
+
+    if len(facts) > limit:
+        return []
+    return sorted(facts, key=lambda fact: (fact.line_item, fact.filing, fact.heading, fact.subheading, fact.period))
+
+def answers_question(question: str, facts: List[Fact], namespace: str = "") -> bool:
+    """
+    Whether facts found by lookup_facts answer the question on their own: it asks for no
+    reasons or outlook (NARRATIVE_WORDS), and their line items cover at least
+    MIN_LOOKUP_COVERAGE of its content words, not counting question words and the company
+    (namespace). "What risks could affect future revenues?" matches the line item
+    "Revenues" but is not answered by it.
+    """
+    if not facts:
+        return False
+    question_words = lookup_words(question) - QUESTION_WORDS - lookup_words(namespace)
+    if question_words & NARRATIVE_WORDS:
+        return False
+    covered = set().union(*(lookup_words(fact.line_item) for fact in facts)) & question_words
+    return len(covered) >= MIN_LOOKUP_COVERAGE * len(question_words)
+
+def format_value(fact: Fact) -> str:
+    value = f"{fact.value:,.2f}".rstrip("0").rstrip(".")
+    if fact.unit == "%":
+        return f"{value}%"
+    return f"{value} {fact.unit}" if fact.unit else value
+
+def format_facts(facts: List[Fact]) -> str:
+    """Facts as text for a prompt: one line per line item and source table, values by period."""
+    lines = []
+    groups = {}
+    for fact in facts:
+        groups.setdefault((fact.line_item, fact.filing, fact.heading, fact.subheading), []).append(fact)
+    for (line_item, filing, heading, subheading), group in groups.items():
+        values = "; ".join(f"{fact.period}: {format_value(fact)}" for fact in group)
+        source = " - ".join(part for part in (filing, heading, subheading) if part)
+        lines.append(f"{line_item}: {values} [{source}]")
+    return "\n".join(lines)
+
+def main():
+    # Usage: python fact_store.py build <chunk_store.jsonl> <namespace> [--filing KEY]
+    #        python fact_store.py query <namespace> <question>
+    args = sys.argv[1:]
+    if len(args) < 3 or args[0] not in ("build", "query"):
+        print("Usage: python fact_store.py build <chunk_store.jsonl> <namespace> [--filing KEY]")
+        print("       python fact_store.py query <namespace> <question>")
+        sys.exit(1)
+
+    if args[0] == "query":
+        question = " ".join(args[2:])
+        facts = lookup_facts(args[1], question)
+        print(format_facts(facts) if facts else "No facts found; the question needs vector search")
+        if facts and not answers_question(question, facts, args[1]):
+            print("The facts only partly answer the question; they are added to the vector search results")
+        return
+
+    from chunk_store import ChunkStore
+    filing = None
+    if "--filing" in args:
+        idx = args.index("--filing")
+        filing = args[idx + 1]
+        del args[idx:idx + 2]
+    with ChunkStore(args[1]) as store:
+        filing = filing or store.header.get("filing") or os.path.splitext(os.path.basename(args[1]))[0]
+        count = write_filing_facts(store, args[2], filing)
+    print(f"{count} facts of {filing} written to: {fact_store_dir(args[2])}")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,21 @@
 import re
 import json
-from typing import List, Dict, Optional, Tuple, Any
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple, Any, Iterable, Iterator, NamedTuple
 from datetime import datetime
 import os
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-# If we want to limit chunk size (approximate character-based threshold)
+from token_counting import Tokenizer, TOKENS_PER_WORD, EMBEDDING_TOKEN_BUDGET, get_tokenizer
+from chunk_store import write_chunk_store, text_sha256
+
+# Chunk size limits of post-processing in estimated tokens: chunks are split above the
+# maximum and merged with their neighbours below the minimum (see chunk_size_sweep)
 DEFAULT_MAX_CHUNK_SIZE = 300
+DEFAULT_MIN_CHUNK_SIZE = 100
 
 # Regex pattern for matching Table of Contents heading (case insensitive)
 RE_TABLE_OF_CONTENTS = re.compile(r"(?:TABLE\s+OF\s+CONTENTS|INDEX)", re.IGNORECASE)
@@ -49,6 +59,27 @@ STANDARD_10K_HEADINGS = [
 # Regex pattern to detect tables. We try to capture blocks of lines starting with "|"
 RE_TABLE_LINE = re.compile(r"^\|.*\|$")
 
+# Lookup table from item number (e.g. "1A") to its standard heading
+ITEM_HEADING_LOOKUP = {
+    heading.split(".", 1)[0][len("Item "):]: heading for heading in STANDARD_10K_HEADINGS
+}
+
+# Precompiled matcher for "Item X" at the start of a (stripped) line, with optional markdown prefix
+RE_ITEM_LINE = re.compile(r"(?:#+\s*)?item\s+(\d+[A-Za-z]?)", re.IGNORECASE)
+
+# Line classification flags computed once per line by classify_lines().
+# A line can carry several flags, e.g. a "# Item 7. ..." line is both an
+# item heading (for the Item split) and a subheading candidate (for the
+# subheading split inside the Item block).
+LINE_BODY = 0
+LINE_BLANK = 1
+LINE_TABLE_ROW = 2          # starts with '|'
+LINE_SUBHEADING = 4         # markdown heading that is not ignored by should_ignore_heading
+LINE_ITEM_HEADING = 8       # standard item heading with a title (more than 3 words)
+LINE_TOC_ENTRY = 16         # bare standard item reference, e.g. "Item 7." or "Item 1A. 23"
+LINE_FORWARD_LOOKING = 32   # "# Forward-Looking Statements"
+LINE_ITEM_REFERENCE = LINE_ITEM_HEADING | LINE_TOC_ENTRY
+
 def extract_document_metadata(text: str) -> Dict[str, str]:
     """
     Extract some metadata from the document header.
@@ -71,19 +102,129 @@ def extract_document_metadata(text: str) -> Dict[str, str]:
             metadata["document_type"] = doc_type_part
     return metadata
 
+# Page number at the end of a TOC entry. A single \s is enough: with \s+ a search backtracks
+# through every suffix of a long whitespace run, which is quadratic in the run length.
+RE_TOC_PAGE_NUMBER = re.compile(r'\s\d+$')
+
 def is_likely_toc_entry(line: str) -> bool:
     """
     Check if a line looks like a TOC entry (item heading followed by a page number).
     """
     line = line.strip()
     # Check if line ends with a number after some whitespace
-    if re.search(r'\s+\d+$', line):
+    if RE_TOC_PAGE_NUMBER.search(line):
         # Check if it starts with an item heading
         item_info = detect_item_heading(line)
         if item_info and item_info['full_heading'] in STANDARD_10K_HEADINGS:
             return True
     return False
 
+# Number of lines after the XBRL preamble that are searched for a table of contents
+TOC_SEARCH_LINES = 200
+# A table of contents has at least TOC_MIN_ENTRIES item references within TOC_MAX_SPAN lines
+TOC_MIN_ENTRIES = 5
+TOC_MAX_SPAN = 50
+
+class DocumentLayout(NamedTuple):
+    """Line numbers of the parts of a filing found by ContentStartDetector."""
+    preamble_end: int             # first line after the XBRL preamble
+    toc_start: Optional[int]      # first item reference of the table of contents, if one was found
+    toc_end: Optional[int]        # last item reference before the content start
+    content_start: int            # first line of real content
+
+class ContentStartDetector:
+    """
+    Single forward pass over classified lines that finds the end of the XBRL preamble,
+    the table of contents and the start of the real content together. Feed lines in
+    order with feed(); once it returns True the content start is known and no more
+    lines are needed. Each line is looked at once, so detection is linear in the
+    number of lines fed even for filings with dense TOCs or repeated cross-reference
+    lists.
+    
+    States:
+        PREAMBLE:       skipping blank, XBRL ("http://", "Member") lines up to a "---" separator
+        TOC_SEARCH:     counting item references in the first TOC_SEARCH_LINES lines
+        CONTENT_SEARCH: TOC found; looking for Forward-Looking Statements or the real Item 1. Business
+        DONE:           content start known
+    """
+    PREAMBLE, TOC_SEARCH, CONTENT_SEARCH, DONE = range(4)
+    
+    def __init__(self):
+        self.state = self.PREAMBLE
+        self.preamble_end = None
+        self.toc_start = None
+        self.toc_end = None
+        self.content_start = None
+        self.reference_count = 0
+    
+    def feed(self, index: int, line: str, kind: int) -> bool:
+        """Process line number index; returns True once the content start is known."""
+        state = self.state
+        # Checked first: after the TOC, this state sees almost every line of the filing
+        if state == self.CONTENT_SEARCH:
+            if kind & LINE_FORWARD_LOOKING or (
+                    kind & LINE_ITEM_HEADING and
+                    detect_item_heading(line)['full_heading'] == "Item 1. Business"):
+                self.content_start = index
+                self.state = self.DONE
+                return True
+            if kind & LINE_ITEM_REFERENCE:
+                self.toc_end = index
+            return False
+        
+        if state == self.PREAMBLE:
+            line_strip = line.strip()
+            if line_strip == "---":
+                self.preamble_end = index + 1
+                self.state = self.TOC_SEARCH
+                return False
+            if not line_strip or "http://" in line_strip or "Member" in line_strip:
+                return False
+            self.preamble_end = index
+            self.state = state = self.TOC_SEARCH
+        
+        if state == self.TOC_SEARCH:
+            if index >= self.preamble_end + TOC_SEARCH_LINES:
+                return self.finish()
+            if kind & LINE_ITEM_REFERENCE:
+                if self.toc_start is None:
+                    self.toc_start = index
+                elif index - self.toc_start > TOC_MAX_SPAN:
+                    # The span only grows from here, so no TOC will be found
+                    return self.finish()
+                self.reference_count += 1
+                self.toc_end = index
+                if self.reference_count >= TOC_MIN_ENTRIES:
+                    self.state = self.CONTENT_SEARCH
+            return False
+        
+        return True
+    
+    def finish(self) -> bool:
+        """
+        Stop with no (further) content start search: content starts right after the
+        preamble, or at the first line if the input was all preamble.
+        """
+        if self.state != self.DONE:
+            if self.state != self.CONTENT_SEARCH:
+                self.toc_start = self.toc_end = None
+            self.content_start = self.preamble_end or 0
+            self.state = self.DONE
+        return True
+    
+    def layout(self) -> DocumentLayout:
+        """The layout found so far; call after the last feed() or finish()."""
+        self.finish()
+        return DocumentLayout(self.preamble_end or 0, self.toc_start, self.toc_end, self.content_start)
+
+def find_document_layout(lines: List[str], kinds: List[int]) -> DocumentLayout:
+    """Run ContentStartDetector over already split and classified lines."""
+    detector = ContentStartDetector()
+    for index, line in enumerate(lines):
+        if detector.feed(index, line, kinds[index]):
+            break
+    return detector.layout()
+
 def find_start_of_content(text: str) -> int:
     """
     Find where the actual content starts by:
@@ -92,43 +233,13 @@ def find_start_of_content(text: str) -> int:
     Returns the index where content should start.
     """
     lines = text.split('\n')
-    
-    # Find first non-XBRL line
-    start_idx = 0
-    for i, line in enumerate(lines):
-        line = line.strip()
-        if line == "---":
-            start_idx = i + 1
-            break
-        if not line or "http://" in line or "Member" in line:
-            continue
-        start_idx = i
-        break
-    
-    # Look for dense item headings in the first portion (indicating TOC)
-    item_heading_positions = []
-    for i in range(start_idx, min(start_idx + 200, len(lines))):
-        line = lines[i].strip()
-        item_info = detect_item_heading(line)
-        if item_info and item_info['full_heading'] in STANDARD_10K_HEADINGS:
-            item_heading_positions.append(i)
-            # If we find at least 5 item headings within 50 lines, it's likely the TOC
-            if len(item_heading_positions) >= 5 and item_heading_positions[-1] - item_heading_positions[0] <= 50:
-                # Found TOC, now look for start of content
-                for j in range(i + 1, len(lines)):
-                    line = lines[j].strip()
-                    # Check for Forward-Looking Statements
-                    if line.lower() == "# forward-looking statements":
-                        return j
-                    # Check for real Item 1. Business (not just TOC entry)
-                    item_info = detect_item_heading(line)
-                    if (item_info and 
-                        item_info['full_heading'] == "Item 1. Business" and 
-                        len(line.split()) > 3):  # More than just "Item 1. Business"
-                        return j
-    
-    # If we didn't find TOC or content start, return original start
-    return start_idx
+    return find_content_start_line(lines, classify_lines(lines))
+
+def find_content_start_line(lines: List[str], kinds: List[int]) -> int:
+    """
+    Same as find_start_of_content, but works on already split and classified lines.
+    """
+    return find_document_layout(lines, kinds).content_start
 
 def normalize_text(text: str) -> str:
     """
@@ -148,54 +259,59 @@ def detect_item_heading(line: str) -> Optional[Dict[str, str]]:
     """
     If line matches 'Item X. [title]', parse it out.
     Returns dictionary with item_number, item_title, full_heading if matched.
-    More flexible with formatting but still reliable.
+    Only item numbers present in STANDARD_10K_HEADINGS are accepted; the title
+    is always taken from the standard heading.
     """
-    # Remove any markdown heading prefix for matching
-    clean_line = re.sub(r'^#+\s*', '', line.strip())
-    
-    # Basic pattern to match "Item X." at start (case insensitive)
-    m = re.match(r'(?i)item\s+(\d+[A-Za-z]?)\.?\s*(.*)', clean_line)
+    m = RE_ITEM_LINE.match(line.strip())
     if not m:
         return None
 
-    # group(1) is the item number, group(2) is the item title
-    item_number = m.group(1).upper().strip()
-    item_title = m.group(2).strip()
-    
-    # Find matching standard heading by normalizing both strings
-    normalized_title = normalize_text(item_title)
-    
-    # First try exact match with standard headings
-    standard_heading = None
-    for heading in STANDARD_10K_HEADINGS:
-        if f"Item {item_number}." in heading:
-            standard_heading = heading
-            break
-    
-    if standard_heading:
-        # Use the standard heading's title
-        item_title = standard_heading.split(".", 1)[1].strip()
-    else:
-        # If no exact match but we have a valid item number, use the standard heading
-        for heading in STANDARD_10K_HEADINGS:
-            if f"Item {item_number}." in heading:
-                item_title = heading.split(".", 1)[1].strip()
-                break
-    
-    full_heading = f"Item {item_number}. {item_title}".strip()
-    
-    # Additional validation: if this is meant to be a standard item heading
-    # but doesn't match our standard list exactly, it might be a false positive
-    if item_number.isdigit() or (len(item_number) > 1 and item_number[:-1].isdigit()):
-        if not any(h.startswith(f"Item {item_number}.") for h in STANDARD_10K_HEADINGS):
-            return None
-    
+    item_number = m.group(1).upper()
+    full_heading = ITEM_HEADING_LOOKUP.get(item_number)
+    if full_heading is None:
+        return None
+
     return {
         "item_number": item_number,
-        "item_title": item_title,
+        "item_title": full_heading.split(".", 1)[1].strip(),
         "full_heading": full_heading
     }
 
+def classify_line(line: str) -> int:
+    """
+    Classify a single line into a combination of LINE_* flags.
+    """
+    line_strip = line.strip()
+    if not line_strip:
+        return LINE_BLANK
+
+    first = line_strip[0]
+    if first == '|':
+        return LINE_TABLE_ROW
+
+    kind = LINE_BODY
+    if first == '#':
+        if line_strip.lower() == "# forward-looking statements":
+            kind |= LINE_FORWARD_LOOKING
+        if not should_ignore_heading(line_strip.strip('#').strip()):
+            kind |= LINE_SUBHEADING
+
+    m = RE_ITEM_LINE.match(line_strip)
+    if m and m.group(1).upper() in ITEM_HEADING_LOOKUP:
+        if len(line_strip.split()) > 3:
+            kind |= LINE_ITEM_HEADING
+        else:
+            kind |= LINE_TOC_ENTRY
+
+    return kind
+
+def classify_lines(lines: List[str]) -> List[int]:
+    """
+    Classify every line once so the chunking stages can share the result
+    instead of re-running the heading and table checks per stage.
+    """
+    return [classify_line(line) for line in lines]
+
 def detect_subheading(line: str) -> Optional[str]:
     """
     If line matches a sub-heading in markdown (#, ##, etc.), return the text.
@@ -377,32 +493,106 @@ def chunkify_by_items(text: str, toc_item_headings: List[str] = None) -> List[Di
     
     return chunks
 
+# Compiled matchers used by should_ignore_heading (all applied to the lowercased heading)
+
+# Important financial statement headings that are never ignored
+RE_KEEP_FINANCIAL_HEADING = re.compile(
+    r"consolidated\s+statements?\s+of\s+(?:income|operations|comprehensive\s+income|financial\s+position|cash\s+flows|shareholders\'\s+equity)"
+    r"|report\s+of\s+independent\s+registered\s+public\s+accounting\s+firm"
+    r"|notes\s+to\s+(?:the\s+)?consolidated\s+financial\s+statements"
+    r"|opinions\s+on\s+the\s+financial\s+statements"
+    r"|basis\s+for\s+opinions"
+    r"|critical\s+audit\s+matters",
+    re.IGNORECASE
+)
+
+# PART headings in any format (e.g., "PART I", "Part II", "PART 1", etc.)
+RE_PART_HEADING = re.compile(r"^part\s*(?:[IVXivx]+|\d+)(?:\s|$)", re.IGNORECASE)
+
+# Repetition of a standard item heading, e.g. "ITEM 7. MANAGEMENT'S DISCUSSION"
+RE_ITEM_REPETITION = re.compile(r"^item\s+(\d+[A-Za-z]?)\.?\s+")
+
+# Financial metadata lines that LlamaParse turns into headings
+RE_FINANCIAL_METADATA_HEADING = re.compile(
+    r"^(?:\(in\s+(?:millions|thousands|billions)\)"
+    r"|\(in\s+(?:millions|thousands|billions),\s+except.*\)"
+    r"|see\s+accompanying\s+notes"
+    r"|see\s+notes?\s+to"
+    r"|weighted\s+average"
+    r"|year[s]?\s+ended"
+    r"|as\s+of\s+(?:and\s+for)?"
+    r"|for\s+the\s+(?:three|six|nine|twelve)\s+months?\s+ended"
+    r"|for\s+the\s+years?\s+ended"
+    r"|for\s+the\s+periods?\s+(?:ended|presented)"
+    r"|consolidated\s+balance\s+sheets?\s+data"
+    r"|selected\s+(?:consolidated\s+)?financial\s+data"
+    r"|supplementary\s+financial\s+information)",
+    re.IGNORECASE
+)
+
+# Date-only headings
+RE_DATE_HEADING = re.compile(
+    r"^(?:(?:january|february|march|april|may|june|july|august|september|october|november|december)\s+\d{1,2},?\s+\d{4}$"
+    r"|(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\s+\d{1,2},?\s+\d{4}$"
+    r"|\d{4}$"
+    r"|(?:fiscal\s+year|fy)\s+\d{4}$)",
+    re.IGNORECASE
+)
+
+# Headings starting with any of these phrases are ignored (str.startswith accepts a tuple)
+IGNORE_HEADING_PREFIXES = (
+    'the following table',
+    'the following tables',
+    'notes to',
+    'note:',
+    'notes:',
+    'continued from',
+    'continued on',
+    'amount',
+    'amounts',
+    'reported as',
+    'current portion',
+    'balance at',
+    'balance as of',
+    'year ended',
+    'period ended',
+    'none',
+    'for example',
+    'such as',
+    'including',
+    'this section',
+    'discussion of'
+)
+
+STANDARD_10K_HEADINGS_LOWER = [heading.lower() for heading in STANDARD_10K_HEADINGS]
+
+# Upper bound on distinct headings memoized by should_ignore_heading
+IGNORE_HEADING_CACHE_SIZE = 8192
+
 def should_ignore_heading(heading: str) -> bool:
     """
     Determine if a heading should be ignored for chunking purposes.
+    Results are memoized per stripped heading, since filings repeat the same
+    table headings ("Year Ended", "(in millions)", ...) thousands of times.
     """
-    if not heading or not heading.strip():
+    if not heading:
+        return True
+    return classify_heading_text(heading.strip())
+
+@lru_cache(maxsize=IGNORE_HEADING_CACHE_SIZE)
+def classify_heading_text(original_heading: str) -> bool:
+    """
+    Uncached body of should_ignore_heading; expects an already stripped heading.
+    """
+    if not original_heading:
         return True
-        
-    # Store original heading for case-sensitive checks
-    original_heading = heading.strip()
     
     # Remove any markdown heading markers and clean the text
-    heading = re.sub(r'^#+\s*', '', original_heading.strip()).lower()
+    heading = re.sub(r'^#+\s*', '', original_heading).lower()
     
     # Never ignore certain important financial statement headings
-    financial_statement_patterns = [
-        r'(?i)consolidated\s+statements?\s+of\s+(?:income|operations|comprehensive\s+income|financial\s+position|cash\s+flows|shareholders\'\s+equity)',
-        r'(?i)report\s+of\s+independent\s+registered\s+public\s+accounting\s+firm',
-        r'(?i)notes\s+to\s+(?:the\s+)?consolidated\s+financial\s+statements',
-        r'(?i)opinions\s+on\s+the\s+financial\s+statements',
-        r'(?i)basis\s+for\s+opinions',
-        r'(?i)critical\s+audit\s+matters'
-    ]
-    
-    for pattern in financial_statement_patterns:
-        if re.search(pattern, heading, re.IGNORECASE):
-            return False  # Don't ignore these important headings
+    if RE_KEEP_FINANCIAL_HEADING.search(heading):
+        return False
     
     # Ignore "None" as a heading
     if heading == "none":
@@ -412,85 +602,35 @@ def should_ignore_heading(heading: str) -> bool:
     if RE_TABLE_OF_CONTENTS.search(heading):
         return True
     
-    # Ignore PART headings in any format (e.g., "PART I", "Part II", "PART 1", etc.)
-    if re.match(r'^part\s*(?:[IVXivx]+|\d+)(?:\s|$)', heading, re.IGNORECASE):
+    # Ignore PART headings
+    if RE_PART_HEADING.match(heading):
         return True
     
     # Ignore if it's a standard item heading (these should be handled by item heading logic)
-    if heading.startswith('item ') and any(h.lower().startswith(heading) for h in STANDARD_10K_HEADINGS):
+    if heading.startswith('item ') and any(h.startswith(heading) for h in STANDARD_10K_HEADINGS_LOWER):
         return True
         
     # Ignore if it's just a repetition of a standard item heading
-    if re.match(r'^item\s+\d+[A-Za-z]?\.?\s+', heading):
-        item_match = re.match(r'^item\s+(\d+[A-Za-z]?)\.?', heading)
-        if item_match:
-            item_num = item_match.group(1)
-            for std_heading in STANDARD_10K_HEADINGS:
-                std_heading_lower = std_heading.lower()
-                if (std_heading_lower.startswith(f'item {item_num.lower()}') and 
-                    original_heading.isupper() and 
-                    heading.replace(' ', '') in std_heading_lower.replace(' ', '')):
-                    return True
+    item_match = RE_ITEM_REPETITION.match(heading)
+    if item_match and original_heading.isupper():
+        item_num = item_match.group(1)
+        compact_heading = heading.replace(' ', '')
+        for std_heading_lower in STANDARD_10K_HEADINGS_LOWER:
+            if (std_heading_lower.startswith(f'item {item_num.lower()}') and 
+                compact_heading in std_heading_lower.replace(' ', '')):
+                return True
     
     # Ignore financial metadata patterns
-    financial_metadata_patterns = [
-        r'^\(in\s+(?:millions|thousands|billions)\)',
-        r'^\(in\s+(?:millions|thousands|billions),\s+except.*\)',
-        r'^see\s+accompanying\s+notes',
-        r'^see\s+notes?\s+to',
-        r'^weighted\s+average',
-        r'^year[s]?\s+ended',
-        r'^as\s+of\s+(?:and\s+for)?',
-        r'^for\s+the\s+(?:three|six|nine|twelve)\s+months?\s+ended',
-        r'^for\s+the\s+years?\s+ended',
-        r'^for\s+the\s+periods?\s+(?:ended|presented)',
-        r'^consolidated\s+balance\s+sheets?\s+data',
-        r'^selected\s+(?:consolidated\s+)?financial\s+data',
-        r'^supplementary\s+financial\s+information'
-    ]
-    
-    if any(re.match(pattern, heading, re.IGNORECASE) for pattern in financial_metadata_patterns):
+    if RE_FINANCIAL_METADATA_HEADING.match(heading):
         return True
     
     # Ignore date patterns
-    date_patterns = [
-        r'^(?:january|february|march|april|may|june|july|august|september|october|november|december)\s+\d{1,2},?\s+\d{4}$',
-        r'^(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\s+\d{1,2},?\s+\d{4}$',
-        r'^\d{4}$',
-        r'^(?:fiscal\s+year|fy)\s+\d{4}$'
-    ]
-    
-    if any(re.match(pattern, heading, re.IGNORECASE) for pattern in date_patterns):
+    if RE_DATE_HEADING.match(heading):
         return True
         
     # Ignore headings that start with specific phrases
-    ignore_starts = [
-        'the following table',
-        'the following tables',
-        'notes to',
-        'note:',
-        'notes:',
-        'continued from',
-        'continued on',
-        'amount',
-        'amounts',
-        'reported as',
-        'current portion',
-        'balance at',
-        'balance as of',
-        'year ended',
-        'period ended',
-        'none',
-        'for example',
-        'such as',
-        'including',
-        'this section',
-        'discussion of'
-    ]
-    
-    for start in ignore_starts:
-        if heading.startswith(start):
-            return True
+    if heading.startswith(IGNORE_HEADING_PREFIXES):
+        return True
             
     # Ignore if it's just parenthetical content
     if heading.startswith('(') and heading.endswith(')'):
@@ -506,71 +646,355 @@ def should_ignore_heading(heading: str) -> bool:
         
     return False
 
-def split_by_subheadings(text: str) -> List[Dict[str, str]]:
+class SourceBuffer:
+    """
+    A slice of the source document shared by every chunk cut from it.
+    offset is the character offset of text[0] in the document, or None for
+    text that does not come from the document (separators, ad-hoc chunks).
+    """
+    __slots__ = ('text', 'offset')
+
+    def __init__(self, text: str, offset: Optional[int] = None):
+        self.text = text
+        self.offset = offset
+
+# Separators inserted when chunk pieces are joined without a matching gap in the source
+SEPARATOR_BUFFERS = {separator: SourceBuffer(separator) for separator in ('\n', '\n\n', ' ')}
+
+# A piece is a (SourceBuffer, start, end) triple; a chunk's text is the concatenation of its pieces.
+Piece = Tuple[SourceBuffer, int, int]
+
+def pieces_text(pieces: List[Piece]) -> str:
+    """Materialize the text of a list of pieces."""
+    if len(pieces) == 1:
+        buffer, start, end = pieces[0]
+        return buffer.text[start:end]
+    return ''.join([buffer.text[start:end] for buffer, start, end in pieces])
+
+def slice_pieces(pieces: List[Piece], start: int, end: int) -> List[Piece]:
+    """Return the pieces covering text[start:end] of the text formed by pieces."""
+    result = []
+    position = 0
+    for buffer, piece_start, piece_end in pieces:
+        length = piece_end - piece_start
+        if position + length > start and position < end:
+            result.append((buffer,
+                           piece_start + max(start - position, 0),
+                           piece_start + min(end - position, length)))
+        position += length
+        if position >= end:
+            break
+    return result
+
+def join_pieces(parts: List[List[Piece]], separator: str) -> List[Piece]:
+    """
+    Piece-level equivalent of separator.join(texts). When two parts are separated by
+    exactly the separator in the same source buffer they are coalesced into one piece.
+    """
+    separator_piece = (SEPARATOR_BUFFERS[separator], 0, len(separator))
+    result = []
+    for index, part in enumerate(parts):
+        if index:
+            if result and part:
+                buffer, start, end = result[-1]
+                next_buffer, next_start, next_end = part[0]
+                if (next_buffer is buffer and buffer.offset is not None and
+                        next_start - end == len(separator) and buffer.text[end:next_start] == separator):
+                    result[-1] = (buffer, start, next_end)
+                    result.extend(part[1:])
+                    continue
+            result.append(separator_piece)
+        result.extend(part)
+    return result
+
+def strip_pieces(pieces: List[Piece]) -> List[Piece]:
+    """Piece-level equivalent of text.strip(); returns [] for all-whitespace text."""
+    pieces = list(pieces)
+    # Leading whitespace
+    while pieces:
+        buffer, start, end = pieces[0]
+        if start < end and not buffer.text[start].isspace():
+            break
+        stripped = buffer.text[start:end].lstrip()
+        if stripped:
+            pieces[0] = (buffer, end - len(stripped), end)
+            break
+        pieces.pop(0)
+    # Trailing whitespace
+    while pieces:
+        buffer, start, end = pieces[-1]
+        if start < end and not buffer.text[end - 1].isspace():
+            break
+        stripped = buffer.text[start:end].rstrip()
+        if stripped:
+            pieces[-1] = (buffer, start, start + len(stripped))
+            break
+        pieces.pop()
+    return pieces
+
+class LabelTable:
+    """Interns heading and subheading strings so chunks only store small integer IDs."""
+    __slots__ = ('labels', 'ids')
+
+    def __init__(self):
+        self.labels = []
+        self.ids = {}
+
+    def intern(self, label: Optional[str]) -> int:
+        """Return the ID for label (-1 for None), adding it to the table if needed."""
+        if label is None:
+            return -1
+        label_id = self.ids.get(label)
+        if label_id is None:
+            label_id = len(self.labels)
+            self.labels.append(label)
+            self.ids[label] = label_id
+        return label_id
+
+    def label(self, label_id: int) -> Optional[str]:
+        return None if label_id < 0 else self.labels[label_id]
+
+CHUNK_KEYS = ('heading', 'subheading', 'text')
+
+class Chunk(Mapping):
+    """
+    Compact chunk that references its text as pieces of shared source buffers
+    instead of holding its own copy. Text is only materialized on access
+    (chunk.text / chunk['text']), e.g. when embedding or writing.
+    Read access works like the chunk dicts used elsewhere: chunk['heading'],
+    chunk.get('subheading'), dict(chunk).
+    """
+    __slots__ = ('labels', 'heading_id', 'subheading_id', 'pieces', 'word_count', 'table_features')
+
+    def __init__(self, labels: LabelTable, heading_id: int, subheading_id: int,
+                 pieces: List[Piece], word_count: Optional[int] = None):
+        self.labels = labels
+        self.heading_id = heading_id
+        self.subheading_id = subheading_id
+        self.pieces = pieces
+        # Cached word count (see chunk_word_count)
+        self.word_count = word_count
+        # Cached TableFeatures (see chunk_table_features)
+        self.table_features = None
+
+    @property
+    def heading(self) -> Optional[str]:
+        return self.labels.label(self.heading_id)
+
+    @heading.setter
+    def heading(self, value: Optional[str]):
+        self.heading_id = self.labels.intern(value)
+
+    @property
+    def subheading(self) -> Optional[str]:
+        return self.labels.label(self.subheading_id)
+
+    @subheading.setter
+    def subheading(self, value: Optional[str]):
+        self.subheading_id = self.labels.intern(value)
+
+    @property
+    def text(self) -> str:
+        return pieces_text(self.pieces)
+
+    @text.setter
+    def text(self, value: str):
+        self.pieces = [(SourceBuffer(value), 0, len(value))] if value else []
+        self.word_count = None
+        self.table_features = None
+
+    def source_spans(self) -> List[Tuple[int, int]]:
+        """Document (start, end) character offsets of the text taken from the source."""
+        spans = []
+        for buffer, start, end in self.pieces:
+            if buffer.offset is None or start == end:
+                continue
+            span = (buffer.offset + start, buffer.offset + end)
+            if spans and spans[-1][1] == span[0]:
+                spans[-1] = (spans[-1][0], span[1])
+            else:
+                spans.append(span)
+        return spans
+
+    def __getitem__(self, key: str):
+        if key in CHUNK_KEYS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value):
+        if key not in CHUNK_KEYS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __iter__(self):
+        return iter(CHUNK_KEYS)
+
+    def __len__(self) -> int:
+        return len(CHUNK_KEYS)
+
+    def __repr__(self) -> str:
+        return f"Chunk(heading={self.heading!r}, subheading={self.subheading!r}, text={self.text[:60]!r})"
+
+def as_chunk(chunk: Dict[str, Any], labels: Optional[LabelTable] = None) -> Chunk:
+    """Convert a chunk dict ('heading', 'subheading', 'text') into a Chunk; Chunks pass through."""
+    if isinstance(chunk, Chunk):
+        return chunk
+    labels = labels if labels is not None else LabelTable()
+    text = chunk['text']
+    return Chunk(
+        labels,
+        labels.intern(chunk.get('heading')),
+        labels.intern(chunk.get('subheading')),
+        [(SourceBuffer(text), 0, len(text))] if text else [],
+        chunk.get('word_count')
+    )
+
+def split_by_subheadings(text: str) -> List[Chunk]:
     """Split text into chunks based on markdown headings that are not TOC or Part headers."""
-    chunks = []
-    current_lines = []
-    current_subheading = None
-    in_table = False
-    table_buffer = []
-    
     lines = text.split('\n')
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
+    return split_lines_by_subheadings(lines, classify_lines(lines))
+
+def split_lines_by_subheadings(lines: List[str], kinds: List[int]) -> List[Chunk]:
+    """
+    Same as split_by_subheadings, but works on already split and classified lines.
+    """
+    splitter = SubheadingSplitter()
+    chunks = []
+    offset = 0
+    for line, kind in zip(lines, kinds):
+        chunks.extend(splitter.feed(line, kind, offset))
+        offset += len(line) + 1
+    chunks.extend(splitter.close())
+    return chunks
+
+class SubheadingSplitter:
+    """
+    Incremental version of split_by_subheadings: lines are fed one at a time and
+    each subheading section is returned as soon as the next subheading closes it.
+    Only the current section (plus one pending blank line inside a table) is held.
+    Chunks reference the document buffer when one is given (offsets of fed lines must
+    then be offsets into it); otherwise the section's source lines are joined into one
+    SourceBuffer shared by its chunks.
+    """
+
+    def __init__(self, heading: Optional[str] = None, labels: Optional[LabelTable] = None,
+                 document: Optional[SourceBuffer] = None):
+        self.labels = labels if labels is not None else LabelTable()
+        self.heading_id = self.labels.intern(heading)
+        self.document = document
+        # Every source line since the last subheading, with its document offset
+        self.raw_lines = []
+        self.raw_offsets = []
+        # Indices into raw_lines that make up the section text
+        self.current_lines = []
+        self.current_subheading = None
+        self.in_table = False
+        self.table_buffer = []
+        # Blank line inside a table; whether it ends the table depends on the next line
+        self.pending_blank = None
+
+    def record(self, line: str, offset: int) -> int:
+        """Add a source line to the section buffer and return its index."""
+        self.raw_lines.append(line)
+        self.raw_offsets.append(offset)
+        return len(self.raw_lines) - 1
+
+    def skip(self, line: str, offset: int):
+        """Record a source line that is dropped from the text (e.g. a TOC entry)."""
+        self.record(line, offset)
+
+    def feed(self, line: str, kind: int, offset: int = 0) -> List[Chunk]:
+        """Consume one classified line and return any sections it closed."""
+        if self.pending_blank is not None:
+            # Empty line after table - the table is complete unless the next line is a table row
+            if kind & LINE_TABLE_ROW:
+                self.table_buffer.append(self.pending_blank)
+            else:
+                self.in_table = False
+                self.current_lines.extend(self.table_buffer)
+                self.table_buffer = []
+            self.pending_blank = None
+        
+        if not kind & LINE_SUBHEADING or self.in_table:
+            # Every line except a subheading closing the section is part of its source
+            index = len(self.raw_lines)
+            self.raw_lines.append(line)
+            self.raw_offsets.append(offset)
         
         # Check for table start/end
-        if line.startswith('|'):
-            in_table = True
-            table_buffer.append(lines[i])
-        elif in_table and not line:
-            # Empty line after table - check if table is complete
-            if i + 1 < len(lines) and not lines[i + 1].strip().startswith('|'):
-                in_table = False
-                current_lines.extend(table_buffer)
-                table_buffer = []
-            else:
-                table_buffer.append(lines[i])
-        elif in_table:
-            table_buffer.append(lines[i])
+        if kind & LINE_TABLE_ROW:
+            self.in_table = True
+            self.table_buffer.append(index)
+        elif self.in_table and kind & LINE_BLANK:
+            self.pending_blank = index
+        elif self.in_table:
+            self.table_buffer.append(index)
         # Handle headings
-        elif line.startswith('#'):
-            heading_text = line.strip('#').strip()
-            if not should_ignore_heading(heading_text):
-                # If we have content from a previous subheading, save it
-                if current_lines or table_buffer:
-                    # Include any buffered table content
-                    if table_buffer:
-                        current_lines.extend(table_buffer)
-                        table_buffer = []
-                        in_table = False
-                    
-                    chunks.append({
-                        "subheading": current_subheading,
-                        "text": '\n'.join(current_lines).strip()
-                    })
-                    current_lines = []
+        elif kind & LINE_SUBHEADING:
+            closed = []
+            # If we have content from a previous subheading, save it
+            if self.current_lines or self.table_buffer:
+                # Include any buffered table content
+                if self.table_buffer:
+                    self.current_lines.extend(self.table_buffer)
+                    self.table_buffer = []
+                    self.in_table = False
                 
-                # Set the new subheading
-                current_subheading = heading_text
-            else:
-                # If it's an ignored heading, treat it as regular content
-                current_lines.append(lines[i])
+                closed.append(self.build_section())
+            self.raw_lines = []
+            self.raw_offsets = []
+            self.current_lines = []
+            
+            # Set the new subheading
+            self.current_subheading = line.strip().strip('#').strip()
+            return closed
         else:
-            # Regular content line
-            current_lines.append(lines[i])
-        i += 1
-    
-    # Don't forget the last chunk and any remaining table content
-    if table_buffer:
-        current_lines.extend(table_buffer)
-    if current_lines:
-        chunks.append({
-            "subheading": current_subheading,
-            "text": '\n'.join(current_lines).strip()
-        })
-    
-    return chunks
+            # Regular content line (including ignored headings)
+            self.current_lines.append(index)
+        return []
+
+    def close(self) -> List[Chunk]:
+        """Flush the last section and any remaining table content."""
+        if self.pending_blank is not None:
+            self.table_buffer.append(self.pending_blank)
+            self.pending_blank = None
+        if self.table_buffer:
+            self.current_lines.extend(self.table_buffer)
+            self.table_buffer = []
+        closed = []
+        if self.current_lines:
+            closed.append(self.build_section())
+        self.raw_lines = []
+        self.raw_offsets = []
+        self.current_lines = []
+        return closed
+
+    def build_section(self) -> Chunk:
+        """Build the chunk for the current section: its lines joined by newlines, stripped."""
+        if self.document is not None:
+            buffer = self.document
+            base = 0
+        else:
+            # Source lines are contiguous, so their offsets map directly into the joined buffer
+            base = self.raw_offsets[0]
+            buffer = SourceBuffer('\n'.join(self.raw_lines), base)
+        
+        pieces = []
+        previous = None
+        for index in self.current_lines:
+            start = self.raw_offsets[index] - base
+            end = start + len(self.raw_lines[index])
+            if previous is not None and index == previous + 1:
+                # Adjacent source lines: the newline between them is already in the buffer
+                pieces[-1] = (buffer, pieces[-1][1], end)
+            else:
+                if previous is not None:
+                    pieces.append((SEPARATOR_BUFFERS['\n'], 0, 1))
+                pieces.append((buffer, start, end))
+            previous = index
+        
+        return Chunk(self.labels, self.heading_id, self.labels.intern(self.current_subheading),
+                     strip_pieces(pieces))
 
 def save_chunks_to_file(chunks: List[Dict[str, Any]], output_file: str):
     """Save chunks to a file in a readable format."""
@@ -634,35 +1058,85 @@ def is_table_row(line: str) -> bool:
     """Check if a line is part of a markdown table."""
     return bool(line.strip().startswith('|') and line.strip().endswith('|'))
 
+def count_words(text: str) -> int:
+    """Count whitespace-separated words, the unit our token estimate is based on."""
+    return len(text.split())
+
+def tokens_from_words(word_count: int) -> int:
+    """Convert a word count into the estimated number of tokens."""
+    # Assume average of 1.3 tokens per word for multilingual text
+    return int(word_count * TOKENS_PER_WORD)
+
 def count_tokens(text: str) -> int:
     """
     Estimate the number of tokens in a text.
     This is a simple approximation - actual token count may vary with the tokenizer.
     """
-    # Simple approximation: split on whitespace and punctuation
-    words = text.split()
-    # Assume average of 1.3 tokens per word for multilingual text
-    return int(len(words) * 1.3)
+    return tokens_from_words(count_words(text))
+
+def chunk_word_count(chunk: Chunk) -> int:
+    """
+    Return the word count of a chunk, computing and caching it on first use.
+    Word counts are additive when chunk texts are joined with whitespace, so merges and
+    splits can update the cache without re-scanning the text.
+    """
+    if chunk.word_count is None:
+        chunk.word_count = count_words(chunk.text)
+    return chunk.word_count
+
+def chunk_tokens(chunk: Chunk) -> int:
+    """Estimated token count of a chunk, using its cached word count."""
+    return tokens_from_words(chunk_word_count(chunk))
 
-def split_chunk_preserve_tables(chunk: Dict[str, str], max_tokens: int = 300) -> List[Dict[str, str]]:
+def append_chunk_text(chunk: Chunk, other: Chunk):
+    """Append other's text to chunk (newline separated) and update the cached word count and table features."""
+    word_count = chunk_word_count(chunk) + chunk_word_count(other)
+    if chunk.table_features is not None and other.table_features is not None:
+        table_features = combine_table_features(chunk.table_features, other.table_features)
+    else:
+        table_features = None
+    chunk.pieces = join_pieces([chunk.pieces, other.pieces], '\n')
+    chunk.word_count = word_count
+    chunk.table_features = table_features
+
+# Sentence boundary used when a single paragraph is too large
+RE_SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
+
+def split_chunk_preserve_tables(chunk: Chunk, max_tokens: int = 300) -> List[Chunk]:
     """
     Split a chunk if it exceeds max_tokens while preserving table structures.
     Returns a list of new chunks, each with the same heading/subheading as the original.
     Prefers splitting at paragraph breaks and avoids splitting after colons.
+    New chunks reference the original chunk's source pieces instead of copying text.
     """
+    chunk = as_chunk(chunk)
+    text = chunk.text
+    
     # Skip empty chunks
-    if not chunk['text'].strip():
+    if not text.strip():
         return []
         
-    if count_tokens(chunk['text']) <= max_tokens:
+    if chunk_tokens(chunk) <= max_tokens:
         return [chunk]
     
+    def new_chunk(parts: List[List[Piece]], separator: str, word_count: int) -> Chunk:
+        return Chunk(chunk.labels, chunk.heading_id, chunk.subheading_id,
+                     strip_pieces(join_pieces(parts, separator)), word_count)
+    
+    # Paragraphs with the pieces of the chunk they cover
+    paragraphs = text.split('\n\n')
+    paragraph_pieces = []
+    position = 0
+    for paragraph in paragraphs:
+        paragraph_pieces.append(slice_pieces(chunk.pieces, position, position + len(paragraph)))
+        position += len(paragraph) + 2
+    
     new_chunks = []
-    paragraphs = chunk['text'].split('\n\n')
+    # (text, pieces) of the paragraphs accumulated for the next chunk
     current_paragraphs = []
     current_tokens = 0
-    in_table = False
-    table_lines = []
+    # Exact word count of current_paragraphs (current_tokens is the splitting budget)
+    current_words = 0
     
     i = 0
     while i < len(paragraphs):
@@ -673,25 +1147,25 @@ def split_chunk_preserve_tables(chunk: Dict[str, str], max_tokens: int = 300) ->
             i += 1
             continue
             
+        paragraph_words = count_words(paragraph)
+        
         # Check if this paragraph contains a table
         lines = paragraph.split('\n')
         if any(is_table_row(line) for line in lines):
             # Handle table paragraph
-            table_tokens = count_tokens(paragraph)
+            table_tokens = tokens_from_words(paragraph_words)
             if current_tokens + table_tokens > max_tokens and current_paragraphs:
                 # Create new chunk with accumulated paragraphs
-                new_chunks.append({
-                    'heading': chunk.get('heading'),
-                    'subheading': chunk.get('subheading'),
-                    'text': '\n\n'.join(current_paragraphs).strip()
-                })
+                new_chunks.append(new_chunk([p for _, p in current_paragraphs], '\n\n', current_words))
                 current_paragraphs = []
                 current_tokens = 0
-            current_paragraphs.append(paragraph)
+                current_words = 0
+            current_paragraphs.append((paragraph, paragraph_pieces[i]))
             current_tokens += table_tokens
+            current_words += paragraph_words
         else:
             # Regular paragraph
-            paragraph_tokens = count_tokens(paragraph)
+            paragraph_tokens = tokens_from_words(paragraph_words)
             
             # Check if this paragraph ends with a colon
             ends_with_colon = paragraph.rstrip().endswith(':')
@@ -700,72 +1174,296 @@ def split_chunk_preserve_tables(chunk: Dict[str, str], max_tokens: int = 300) ->
             if current_tokens + paragraph_tokens > max_tokens:
                 if current_paragraphs:
                     # Don't split if last paragraph ended with a colon
-                    last_para = current_paragraphs[-1] if current_paragraphs else ""
+                    last_para = current_paragraphs[-1][0] if current_paragraphs else ""
                     if last_para.rstrip().endswith(':'):
                         # Try to include this paragraph even if it exceeds the limit
-                        current_paragraphs.append(paragraph)
+                        current_paragraphs.append((paragraph, paragraph_pieces[i]))
+                        current_words += paragraph_words
                     else:
                         # Create new chunk with accumulated paragraphs
-                        new_chunks.append({
-                            'heading': chunk.get('heading'),
-                            'subheading': chunk.get('subheading'),
-                            'text': '\n\n'.join(current_paragraphs).strip()
-                        })
-                        current_paragraphs = [paragraph]
+                        new_chunks.append(new_chunk([p for _, p in current_paragraphs], '\n\n', current_words))
+                        current_paragraphs = [(paragraph, paragraph_pieces[i])]
                         current_tokens = paragraph_tokens
+                        current_words = paragraph_words
                 else:
                     # If a single paragraph is too large, we need to split it by sentences
-                    sentences = re.split(r'(?<=[.!?])\s+', paragraph)
+                    sentences = []
+                    start = 0
+                    for match in RE_SENTENCE_BREAK.finditer(paragraph):
+                        sentences.append((paragraph[start:match.start()],
+                                          slice_pieces(paragraph_pieces[i], start, match.start())))
+                        start = match.end()
+                    sentences.append((paragraph[start:], slice_pieces(paragraph_pieces[i], start, len(paragraph))))
+                    
                     current_sentence_group = []
                     current_sentence_tokens = 0
+                    current_sentence_words = 0
                     
-                    for j, sentence in enumerate(sentences):
-                        sentence_tokens = count_tokens(sentence)
-                        
-                        # Check if this sentence ends with a colon
-                        ends_with_colon = sentence.rstrip().endswith(':')
+                    for sentence, sentence_pieces in sentences:
+                        sentence_words = count_words(sentence)
+                        sentence_tokens = tokens_from_words(sentence_words)
                         
                         if current_sentence_tokens + sentence_tokens > max_tokens and current_sentence_group:
                             # Don't split if last sentence ended with a colon
-                            if not current_sentence_group[-1].rstrip().endswith(':'):
-                                new_chunks.append({
-                                    'heading': chunk.get('heading'),
-                                    'subheading': chunk.get('subheading'),
-                                    'text': ' '.join(current_sentence_group).strip()
-                                })
+                            if not current_sentence_group[-1][0].rstrip().endswith(':'):
+                                new_chunks.append(new_chunk([p for _, p in current_sentence_group], ' ', current_sentence_words))
                                 current_sentence_group = []
                                 current_sentence_tokens = 0
-                        current_sentence_group.append(sentence)
+                                current_sentence_words = 0
+                        current_sentence_group.append((sentence, sentence_pieces))
                         current_sentence_tokens += sentence_tokens
+                        current_sentence_words += sentence_words
                     
                     if current_sentence_group:
-                        current_paragraphs = [' '.join(current_sentence_group)]
+                        current_paragraphs = [(
+                            ' '.join(t for t, _ in current_sentence_group),
+                            join_pieces([p for _, p in current_sentence_group], ' ')
+                        )]
                         current_tokens = current_sentence_tokens
+                        current_words = current_sentence_words
             else:
-                current_paragraphs.append(paragraph)
+                current_paragraphs.append((paragraph, paragraph_pieces[i]))
                 current_tokens += paragraph_tokens
+                current_words += paragraph_words
                 
                 # If this paragraph ends with a colon, try to include the next paragraph
                 if ends_with_colon and i + 1 < len(paragraphs):
                     next_paragraph = paragraphs[i + 1]
-                    next_tokens = count_tokens(next_paragraph)
+                    next_words = count_words(next_paragraph)
+                    next_tokens = tokens_from_words(next_words)
                     if current_tokens + next_tokens <= max_tokens * 1.2:  # Allow slight overflow
-                        current_paragraphs.append(next_paragraph)
+                        current_paragraphs.append((next_paragraph, paragraph_pieces[i + 1]))
                         current_tokens += next_tokens
+                        current_words += next_words
                         i += 1  # Skip the next paragraph since we included it
         
         i += 1
     
     # Don't forget the last chunk
     if current_paragraphs:
-        new_chunks.append({
-            'heading': chunk.get('heading'),
-            'subheading': chunk.get('subheading'),
-            'text': '\n\n'.join(current_paragraphs).strip()
-        })
+        new_chunks.append(new_chunk([p for _, p in current_paragraphs], '\n\n', current_words))
     
-    # Filter out any empty chunks
-    return [chunk for chunk in new_chunks if chunk['text'].strip()]
+    # Filter out any empty chunks (stripped pieces are empty only for blank text)
+    return [new for new in new_chunks if new.pieces]
+
+# Separator row under a markdown table header, e.g. |---|:---:|
+RE_TABLE_SEPARATOR = re.compile(r'\|[\s\-:]+\|')
+
+# A line matching any of these looks like financial statement content. Kept as
+# separate patterns: each can use a fast literal scan, which a single alternation cannot.
+FINANCIAL_LINE_PATTERNS = tuple(re.compile(pattern) for pattern in (
+    # Currency amounts
+    r'\$\s*\d+(?:,\d{3})*(?:\.\d+)?',
+    # Parenthetical amounts
+    r'\(\$?\s*\d+(?:,\d{3})*(?:\.\d+)?\)',
+    # Common financial statement headers
+    r'(?i)^(?:assets|liabilities|equity|revenue|expenses|income|cash flows)',
+    # Date ranges
+    r'(?i)(?:year|quarter|period)s?\s+ended?\s+(?:january|february|march|april|may|june|july|august|september|october|november|december)\s+\d{1,2},\s+\d{4}',
+    # Notes references
+    r'\([0-9A-Z]\)',
+    # Financial metrics
+    r'(?i)(?:total|net|gross|operating|consolidated)\s+(?:revenue|income|loss|assets|liabilities|equity|earnings)'
+))
+
+def is_financial_line(line: str) -> bool:
+    """Whether a line matches any financial statement pattern."""
+    for pattern in FINANCIAL_LINE_PATTERNS:
+        if pattern.search(line):
+            return True
+    return False
+
+# Table metadata that makes a small chunk a table header or footer. Every branch
+# starts with a literal character so the regex engine can skip ahead quickly.
+RE_TABLE_METADATA = re.compile(
+    r'\([Ii]n (?:thousands|millions|billions)'
+    r'|Notes? to|notes? to'
+    r'|Continued|continued'
+    r'|Year[s]? [Ee]nded|year[s]? [Ee]nded'
+    r'|As of|as of'
+    r'|See accompanying notes|see accompanying notes'
+)
+
+# Chunks with fewer lines than this are checked for table metadata
+SMALL_CHUNK_LINES = 4
+
+class TableFeatures(NamedTuple):
+    """Table-related features of a chunk's text, computed in one pass by table_features."""
+    # Lines in the text (len(text.split('\n')))
+    line_count: int
+    # Non-blank lines of the stripped text
+    non_empty_lines: int
+    # Lines that are markdown table rows (| ... |)
+    table_row_count: int
+    # Whether a table header separator row is present
+    separator_found: bool
+    # Lines matching a financial statement pattern; None for well-formed tables, which are
+    # table content regardless, so the (comparatively slow) pattern scan is skipped
+    financial_lines: Optional[int]
+    # Column headers of the first table with a separator row, () if none
+    headers: Tuple[str, ...]
+    # Number of '|' in the first/last line if it starts with '|', else None
+    first_row_pipes: Optional[int]
+    last_row_pipes: Optional[int]
+    # Table metadata found (False for chunks with SMALL_CHUNK_LINES lines or more); None
+    # until first needed, see chunk_has_table_metadata
+    has_table_metadata: Optional[bool]
+    # Whether the text has no leading/trailing whitespace (required by combine_table_features)
+    is_stripped: bool
+    # Cells of the last line if it is a table row (the headers if a following text starts
+    # with a separator row), and whether the first line is a separator row
+    last_line_headers: Optional[Tuple[str, ...]]
+    first_line_is_separator: bool
+
+    @property
+    def is_empty(self) -> bool:
+        return self.non_empty_lines == 0
+
+    @property
+    def is_well_formed_table(self) -> bool:
+        """Whether the text has a table with header, separator and data rows."""
+        return self.table_row_count >= 3 and self.separator_found
+
+    @property
+    def financial_ratio(self) -> Optional[float]:
+        """Share of non-empty lines with financial statement patterns (None for well-formed tables)."""
+        if self.financial_lines is None:
+            return None
+        return self.financial_lines / self.non_empty_lines if self.non_empty_lines else 0.0
+
+    @property
+    def is_table(self) -> bool:
+        """
+        Whether the text is related to table content: a well-formed table (header,
+        separator and data rows) or mostly financial statement lines.
+        """
+        return self.is_well_formed_table or self.financial_ratio > 0.3
+
+def parse_table_headers(line: str) -> Tuple[str, ...]:
+    """Split a markdown table row into stripped column cells."""
+    return tuple(col.strip() for col in line.strip('|').split('|'))
+
+def row_pipes(line: str) -> Optional[int]:
+    """Number of '|' in a line that starts like a table row, else None."""
+    line = line.strip()
+    return line.count('|') if line.startswith('|') else None
+
+def table_features(text: str) -> TableFeatures:
+    """
+    Compute the table features of a text in one pass over its lines. Lines are only
+    scanned for financial patterns if the text is not a well-formed table.
+    """
+
+    line_count = text.count('\n') + 1
+    stripped_text = text.strip()
+    lines = stripped_text.split('\n')
+    
+    non_empty_lines = 0
+    table_row_count = 0
+    separator_found = False
+    headers = ()
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        non_empty_lines += 1
+        
+        # Count table rows and check for header separator
+        if stripped.startswith('|') and stripped.endswith('|'):
+            table_row_count += 1
+            if not separator_found and RE_TABLE_SEPARATOR.match(stripped):
+                separator_found = True
+            # Column headers: the first row followed by a separator row
+            if (not headers and line.startswith('|') and line.endswith('|') and
+                    i + 1 < len(lines) and RE_TABLE_SEPARATOR.match(lines[i + 1])):
+                headers = parse_table_headers(line)
+    
+    if table_row_count >= 3 and separator_found:
+        financial_lines = None
+    else:
+        financial_lines = sum(1 for line in lines if is_financial_line(line))
+    
+    last_line = lines[-1]
+    
+    return TableFeatures(
+        line_count=line_count,
+        non_empty_lines=non_empty_lines,
+        table_row_count=table_row_count,
+        separator_found=separator_found,
+        financial_lines=financial_lines,
+        headers=headers,
+        first_row_pipes=row_pipes(lines[0]),
+        last_row_pipes=row_pipes(lines[-1]),
+        has_table_metadata=None if line_count < SMALL_CHUNK_LINES else False,
+        is_stripped=len(stripped_text) == len(text),
+        last_line_headers=(parse_table_headers(last_line)
+                           if last_line.startswith('|') and last_line.endswith('|') else None),
+        first_line_is_separator=bool(RE_TABLE_SEPARATOR.match(lines[0]))
+    )
+
+def combine_table_features(first: TableFeatures, second: TableFeatures) -> Optional[TableFeatures]:
+    """
+    Table features of first's text + '\n' + second's text without rescanning it.
+    Exact when both texts are stripped and non-empty (the lines of the joined text
+    are then the lines of both); returns None otherwise.
+    """
+    if first.is_empty or second.is_empty or not (first.is_stripped and second.is_stripped):
+        return None
+    headers = first.headers
+    if not headers and first.last_line_headers is not None and second.first_line_is_separator:
+        headers = first.last_line_headers
+    line_count = first.line_count + second.line_count
+    table_row_count = first.table_row_count + second.table_row_count
+    separator_found = first.separator_found or second.separator_found
+    if table_row_count >= 3 and separator_found:
+        financial_lines = None
+    elif first.financial_lines is None or second.financial_lines is None:
+        # Cannot happen: a well-formed table part keeps the joined text a well-formed table
+        return None
+    else:
+        financial_lines = first.financial_lines + second.financial_lines
+    return TableFeatures(
+        line_count=line_count,
+        non_empty_lines=first.non_empty_lines + second.non_empty_lines,
+        table_row_count=table_row_count,
+        separator_found=separator_found,
+        financial_lines=financial_lines,
+        headers=headers or second.headers,
+        first_row_pipes=first.first_row_pipes,
+        last_row_pipes=second.last_row_pipes,
+        # No metadata pattern can span the joining newline
+        has_table_metadata=(False if line_count >= SMALL_CHUNK_LINES else
+                            None if first.has_table_metadata is None or second.has_table_metadata is None else
+                            first.has_table_metadata or second.has_table_metadata),
+        is_stripped=True,
+        last_line_headers=second.last_line_headers,
+        first_line_is_separator=first.first_line_is_separator
+    )
+
+def chunk_table_features(chunk: Dict[str, Any]) -> TableFeatures:
+    """
+    Table features of a chunk, computed once and cached on Chunk objects until their
+    text changes. Plain chunk dicts are computed on every call.
+    """
+    if isinstance(chunk, Chunk):
+        if chunk.table_features is None:
+            chunk.table_features = table_features(chunk.text)
+        return chunk.table_features
+    return table_features(chunk.get('text') or '')
+
+def chunk_has_table_metadata(chunk: Dict[str, Any]) -> bool:
+    """
+    Whether a small chunk contains table metadata such as "(in millions)". Only needed
+    for some merge decisions, so it is searched on first use and cached in the chunk's
+    table features.
+    """
+    features = chunk_table_features(chunk)
+    if features.has_table_metadata is not None:
+        return features.has_table_metadata
+    found = bool(RE_TABLE_METADATA.search(chunk.get('text') or ''))
+    if isinstance(chunk, Chunk):
+        chunk.table_features = features._replace(has_table_metadata=found)
+    return found
 
 def is_related_table_content(text: str) -> bool:
     """
@@ -775,124 +1473,50 @@ def is_related_table_content(text: str) -> bool:
     - Numeric data
     - Table metadata
     """
-    # Skip empty text
-    if not text.strip():
-        return False
-        
-    lines = text.strip().split('\n')
-    
-    # Quick check for obvious table markers
-    has_table_marker = False
-    table_row_count = 0
-    header_separator_found = False
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        # Count table rows and check for header separator
-        if line.startswith('|') and line.endswith('|'):
-            table_row_count += 1
-            has_table_marker = True
-            if re.match(r'\|[\s\-:]+\|', line):
-                header_separator_found = True
-                
-    # If we have a well-formed table (header, separator, and data rows)
-    if has_table_marker and header_separator_found and table_row_count >= 3:
-        return True
-        
-    # Check for financial statement patterns
-    financial_patterns = [
-        # Currency amounts
-        r'\$\s*\d+(?:,\d{3})*(?:\.\d+)?',
-        # Parenthetical amounts
-        r'\(\$?\s*\d+(?:,\d{3})*(?:\.\d+)?\)',
-        # Common financial statement headers
-        r'(?i)^(?:assets|liabilities|equity|revenue|expenses|income|cash flows)',
-        # Date ranges
-        r'(?i)(?:year|quarter|period)s?\s+ended?\s+(?:january|february|march|april|may|june|july|august|september|october|november|december)\s+\d{1,2},\s+\d{4}',
-        # Notes references
-        r'\([0-9A-Z]\)',
-        # Financial metrics
-        r'(?i)(?:total|net|gross|operating|consolidated)\s+(?:revenue|income|loss|assets|liabilities|equity|earnings)'
-    ]
-    
-    # Count how many lines match financial patterns
-    financial_line_count = 0
-    for line in lines:
-        if any(re.search(pattern, line) for pattern in financial_patterns):
-            financial_line_count += 1
-            
-    # If more than 30% of non-empty lines contain financial patterns
-    non_empty_lines = len([l for l in lines if l.strip()])
-    if non_empty_lines > 0 and financial_line_count / non_empty_lines > 0.3:
-        return True
-        
-    return False
+    return table_features(text).is_table
 
 def should_merge_table_chunks(current_chunk: Dict[str, str], next_chunk: Dict[str, str]) -> bool:
     """
     Determine if two chunks should be merged based on their content and context.
+    All checks read the chunks' cached table features (see chunk_table_features).
     """
     # If they don't have the same item heading, don't merge
     if current_chunk.get('heading') != next_chunk.get('heading'):
         return False
+    
+    current = chunk_table_features(current_chunk)
+    following = chunk_table_features(next_chunk)
         
     # If either chunk is empty, don't merge
-    if not current_chunk.get('text').strip() or not next_chunk.get('text').strip():
+    if current.is_empty or following.is_empty:
         return False
-        
-    current_text = current_chunk['text']
-    next_text = next_chunk['text']
-    
-    # Check if both chunks contain table-related content
-    current_is_table = is_related_table_content(current_text)
-    next_is_table = is_related_table_content(next_text)
     
     # If both are table-related, check if they're part of the same context
-    if current_is_table and next_is_table:
+    if current.is_table and following.is_table:
         # If they share similar column headers, they're likely related
-        current_headers = extract_table_headers(current_text)
-        next_headers = extract_table_headers(next_text)
-        if current_headers and next_headers and headers_are_similar(current_headers, next_headers):
+        if current.headers and following.headers and headers_are_similar(current.headers, following.headers):
             return True
             
         # If they're close together and have similar structure
-        if len(current_text.split('\n')) < 20 and len(next_text.split('\n')) < 20:
+        if current.line_count < 20 and following.line_count < 20:
             return True
             
         # If one appears to be a continuation of the other
-        if is_table_continuation(current_text, next_text):
+        if features_continue_table(current, following):
             return True
     
     # If one is a small chunk that looks like a table header or footer
-    if len(current_text.split('\n')) < 4 or len(next_text.split('\n')) < 4:
+    if current.line_count < SMALL_CHUNK_LINES or following.line_count < SMALL_CHUNK_LINES:
         # Check if it contains table-related metadata
-        metadata_patterns = [
-            r'\([Ii]n (?:thousands|millions|billions)',
-            r'[Nn]otes? to',
-            r'[Cc]ontinued',
-            r'[Yy]ear[s]? [Ee]nded',
-            r'[Aa]s of',
-            r'[Ss]ee accompanying notes'
-        ]
-        small_chunk = current_text if len(current_text.split('\n')) < 4 else next_text
-        if any(re.search(pattern, small_chunk) for pattern in metadata_patterns):
+        small_chunk = current_chunk if current.line_count < SMALL_CHUNK_LINES else next_chunk
+        if chunk_has_table_metadata(small_chunk):
             return True
     
     return False
 
 def extract_table_headers(text: str) -> List[str]:
     """Extract column headers from a markdown table."""
-    lines = text.strip().split('\n')
-    for i, line in enumerate(lines):
-        if line.startswith('|') and line.endswith('|'):
-            headers = [col.strip() for col in line.strip('|').split('|')]
-            # Check next line for separator
-            if i + 1 < len(lines) and re.match(r'\|[\s\-:]+\|', lines[i + 1]):
-                return headers
-    return []
+    return list(table_features(text).headers)
 
 def headers_are_similar(headers1: List[str], headers2: List[str]) -> bool:
     """Check if two sets of table headers are similar."""
@@ -918,56 +1542,63 @@ def headers_are_similar(headers1: List[str], headers2: List[str]) -> bool:
     common = set(h1) & set(h2)
     return len(common) >= min(len(h1), len(h2)) * 0.5
 
+def features_continue_table(features1: TableFeatures, features2: TableFeatures) -> bool:
+    """
+    Check if the second text continues the first one's table: the last line of the first
+    and the first line of the second are table rows with the same number of columns.
+    """
+    if features1.last_row_pipes is None or features2.first_row_pipes is None:
+        return False
+    return features1.last_row_pipes == features2.first_row_pipes
+
 def is_table_continuation(text1: str, text2: str) -> bool:
     """Check if text2 appears to be a continuation of text1's table."""
-    lines1 = text1.strip().split('\n')
-    lines2 = text2.strip().split('\n')
-    
-    # If either is empty, not a continuation
-    if not lines1 or not lines2:
-        return False
-        
-    # Check if the last line of text1 and first line of text2 have similar structure
-    last_line = lines1[-1].strip()
-    first_line = lines2[0].strip()
-    
-    if last_line.startswith('|') and first_line.startswith('|'):
-        # Count pipes to check if they have the same number of columns
-        pipes1 = last_line.count('|')
-        pipes2 = first_line.count('|')
-        return pipes1 == pipes2
-        
-    return False
+    return features_continue_table(table_features(text1), table_features(text2))
 
-def merge_related_chunks(chunks: List[Dict[str, str]], max_tokens: int = 300, min_tokens: int = 100) -> List[Dict[str, str]]:
+def merge_related_chunks(chunks: List[Chunk], max_tokens: int = 300, min_tokens: int = 100) -> List[Chunk]:
     """
     Merge chunks that are part of the same table context while respecting the token limit.
     Also ensures that small chunks (below min_tokens) are merged with previous chunks if they share the same Item heading.
+    Token counts come from the cached per-chunk word counts, so each chunk's text is only counted once.
     """
     if not chunks:
         return chunks
-        
-    merged_chunks = []
-    current_chunk = chunks[0]
+    labels = LabelTable()
+    return list(iter_merged_chunks([as_chunk(chunk, labels) for chunk in chunks], max_tokens, min_tokens))
+
+def iter_merged_chunks(chunks: Iterable[Chunk], max_tokens: int = 300, min_tokens: int = 100) -> Iterator[Chunk]:
+    """
+    Streaming version of merge_related_chunks. A merged chunk is yielded once no later
+    chunk can be merged into it, so at most two chunks are held at any time.
+    """
+    current_chunk = None
+    # Last finished chunk; small followers may still be merged into it
+    last_merged = None
     
-    for next_chunk in chunks[1:]:
+    for next_chunk in chunks:
+        if current_chunk is None:
+            current_chunk = next_chunk
+            continue
+        
         should_merge = False
         
         # Check if chunks share the same item heading
         same_heading = current_chunk.get('heading') == next_chunk.get('heading')
         
         # Calculate token counts
-        current_tokens = count_tokens(current_chunk['text'])
-        next_tokens = count_tokens(next_chunk['text'])
-        combined_tokens = count_tokens(current_chunk['text'] + '\n' + next_chunk['text'])
+        current_words = chunk_word_count(current_chunk)
+        next_words = chunk_word_count(next_chunk)
+        current_tokens = tokens_from_words(current_words)
+        next_tokens = tokens_from_words(next_words)
+        combined_tokens = tokens_from_words(current_words + next_words)
         
         # Determine if we should merge based on various conditions
         if same_heading:
             # Always merge if either chunk is very small and combined is within limit
             if (current_tokens < min_tokens or next_tokens < min_tokens) and combined_tokens <= max_tokens:
                 should_merge = True
-            # Merge if they're related table content
-            elif should_merge_table_chunks(current_chunk, next_chunk) and combined_tokens <= max_tokens:
+            # Merge if they're related table content (cheap size check first)
+            elif combined_tokens <= max_tokens and should_merge_table_chunks(current_chunk, next_chunk):
                 should_merge = True
             # Merge if they're both small and sequential
             elif current_tokens < min_tokens and next_tokens < min_tokens and combined_tokens <= max_tokens:
@@ -975,146 +1606,475 @@ def merge_related_chunks(chunks: List[Dict[str, str]], max_tokens: int = 300, mi
         
         if should_merge:
             # Merge the chunks
-            current_chunk['text'] = current_chunk['text'] + '\n' + next_chunk['text']
+            append_chunk_text(current_chunk, next_chunk)
             # Keep the first meaningful subheading if it exists
             if (not current_chunk.get('subheading') or 
                 current_chunk.get('subheading', '').lower() in ['none', 'no heading']) and next_chunk.get('subheading'):
                 current_chunk['subheading'] = next_chunk['subheading']
         else:
             # If we're not merging and the current chunk is too small,
-            # try to merge it with the previous chunk in merged_chunks
-            if current_tokens < min_tokens and merged_chunks and current_chunk.get('heading') == merged_chunks[-1].get('heading'):
-                prev_combined_tokens = count_tokens(merged_chunks[-1]['text'] + '\n' + current_chunk['text'])
+            # try to merge it with the previous finished chunk
+            if current_tokens < min_tokens and last_merged is not None and current_chunk.get('heading') == last_merged.get('heading'):
+                prev_combined_tokens = tokens_from_words(chunk_word_count(last_merged) + current_words)
                 if prev_combined_tokens <= max_tokens:
-                    merged_chunks[-1]['text'] = merged_chunks[-1]['text'] + '\n' + current_chunk['text']
+                    append_chunk_text(last_merged, current_chunk)
                 else:
-                    merged_chunks.append(current_chunk)
+                    yield last_merged
+                    last_merged = current_chunk
             else:
-                merged_chunks.append(current_chunk)
+                if last_merged is not None:
+                    yield last_merged
+                last_merged = current_chunk
             current_chunk = next_chunk
     
     # Handle the last chunk
     if current_chunk:
-        current_tokens = count_tokens(current_chunk['text'])
-        if current_tokens < min_tokens and merged_chunks and current_chunk.get('heading') == merged_chunks[-1].get('heading'):
+        current_tokens = chunk_tokens(current_chunk)
+        if current_tokens < min_tokens and last_merged is not None and current_chunk.get('heading') == last_merged.get('heading'):
             # Try to merge with the previous chunk if they share the same heading
-            prev_combined_tokens = count_tokens(merged_chunks[-1]['text'] + '\n' + current_chunk['text'])
+            prev_combined_tokens = tokens_from_words(chunk_word_count(last_merged) + chunk_word_count(current_chunk))
             if prev_combined_tokens <= max_tokens:
-                merged_chunks[-1]['text'] = merged_chunks[-1]['text'] + '\n' + current_chunk['text']
+                append_chunk_text(last_merged, current_chunk)
             else:
-                merged_chunks.append(current_chunk)
+                yield last_merged
+                last_merged = current_chunk
         else:
-            merged_chunks.append(current_chunk)
+            if last_merged is not None:
+                yield last_merged
+            last_merged = current_chunk
     
-    return merged_chunks
+    if last_merged is not None:
+        yield last_merged
 
-def post_process_chunks(chunks: List[Dict[str, str]], max_tokens: int = 300) -> List[Dict[str, str]]:
+def post_process_chunks(chunks: List[Chunk], max_tokens: int = DEFAULT_MAX_CHUNK_SIZE,
+                        min_tokens: int = DEFAULT_MIN_CHUNK_SIZE) -> List[Chunk]:
     """
     Post-process chunks to ensure they don't exceed the token limit while preserving tables.
     Now also merges related table chunks while respecting the token limit.
     """
+    labels = LabelTable()
+    return list(iter_post_processed_chunks((as_chunk(chunk, labels) for chunk in chunks), max_tokens, min_tokens))
+
+def iter_post_processed_chunks(chunks: Iterable[Chunk], max_tokens: int = DEFAULT_MAX_CHUNK_SIZE,
+                               min_tokens: int = DEFAULT_MIN_CHUNK_SIZE) -> Iterator[Chunk]:
+    """
+    Streaming version of post_process_chunks: split, merge and verify chunk by chunk.
+    """
     # First split chunks that are too large
-    processed_chunks = []
-    for chunk in chunks:
-        processed_chunks.extend(split_chunk_preserve_tables(chunk, max_tokens))
+    split_chunks = (
+        piece for chunk in chunks for piece in split_chunk_preserve_tables(chunk, max_tokens)
+    )
     
     # Then merge related table chunks while respecting the token limit
-    processed_chunks = merge_related_chunks(processed_chunks, max_tokens)
-    
-    # Final verification that no chunk exceeds the limit
-    final_chunks = []
-    for chunk in processed_chunks:
-        if count_tokens(chunk['text']) > max_tokens:
+    for chunk in iter_merged_chunks(split_chunks, max_tokens, min_tokens):
+        # Final verification that no chunk exceeds the limit
+        if chunk_tokens(chunk) > max_tokens:
             # If a chunk somehow still exceeds the limit, split it again
-            final_chunks.extend(split_chunk_preserve_tables(chunk, max_tokens))
+            yield from split_chunk_preserve_tables(chunk, max_tokens)
         else:
-            final_chunks.append(chunk)
+            yield chunk
+
+# Word boundaries used when a single line does not fit the embedding window
+RE_WORD = re.compile(r'\S+')
+
+def split_chunk_to_window(chunk: Chunk, tokenizer: Tokenizer, max_tokens: int = EMBEDDING_TOKEN_BUDGET) -> List[Chunk]:
+    """
+    Split a chunk whose real token count exceeds max_tokens into consecutive pieces that fit.
+    Splits at line boundaries (so table rows stay intact) and falls back to word
+    boundaries for lines that do not fit on their own. Groups are packed on summed
+    line counts, then re-counted as a whole and re-packed with a smaller budget if
+    the tokenizer disagrees. A single word larger than the window is left as is.
+    """
+    text = chunk.text
+    
+    # Non-blank lines, and the words of lines that are too long on their own
+    line_spans = []
+    position = 0
+    for line in text.split('\n'):
+        if line.strip():
+            line_spans.append((position, position + len(line)))
+        position += len(line) + 1
+    line_counts = tokenizer.count_batch([text[start:end] for start, end in line_spans])
+    
+    spans = []
+    counts = []
+    for (start, end), count in zip(line_spans, line_counts):
+        if count > max_tokens:
+            words = [match.span() for match in RE_WORD.finditer(text, start, end)]
+            spans.extend(words)
+            counts.extend(tokenizer.count_batch([text[word_start:word_end] for word_start, word_end in words]))
+        else:
+            spans.append((start, end))
+            counts.append(count)
+    
+    def pack(first: int, last: int, budget: int) -> List[Tuple[int, int]]:
+        """Greedily group spans[first:last] into index ranges whose summed counts fit budget."""
+        groups = []
+        group_start = first
+        group_tokens = 0
+        for index in range(first, last):
+            if index > group_start and group_tokens + counts[index] > budget:
+                groups.append((group_start, index))
+                group_start = index
+                group_tokens = 0
+            group_tokens += counts[index]
+        groups.append((group_start, last))
+        return groups
+    
+    groups = []
+    
+    def fit(first: int, last: int, budget: int):
+        packed = pack(first, last, budget)
+        actual = tokenizer.count_batch([text[spans[a][0]:spans[b - 1][1]] for a, b in packed])
+        for (a, b), count in zip(packed, actual):
+            if count <= max_tokens or b - a == 1:
+                groups.append((a, b))
+            else:
+                fit(a, b, min(budget - 1, budget * max_tokens // count))
     
-    return final_chunks
+    if spans:
+        fit(0, len(spans), max_tokens)
+    
+    return [
+        Chunk(chunk.labels, chunk.heading_id, chunk.subheading_id,
+              slice_pieces(chunk.pieces, spans[a][0], spans[b - 1][1]))
+        for a, b in groups
+    ]
 
-def process_and_save_chunks(text: str, output_file: str = None) -> List[Dict[str, Any]]:
-    """Process text into chunks and save to file if output_file is provided."""
-    print(f"Total lines: {len(text.splitlines())}")
+def iter_window_fitted_chunks(chunks: Iterable[Chunk], tokenizer: Optional[Tokenizer] = None,
+                              max_tokens: int = EMBEDDING_TOKEN_BUDGET, batch_size: int = 64) -> Iterator[Chunk]:
+    """
+    Guarantee that every chunk fits the embedding window according to tokenizer
+    (get_tokenizer() by default). Chunks are counted in batches of batch_size;
+    chunks that are too large are split with split_chunk_to_window.
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    batch = []
     
-    # Find where content starts (after TOC)
-    content_start_idx = find_start_of_content(text)
-    lines = text.split('\n')
-    content = '\n'.join(lines[content_start_idx:])
+    def flush(batch: List[Chunk]) -> Iterator[Chunk]:
+        if tokenizer.word_based:
+            # Same count as the tokenizer, from the word counts the chunker already keeps
+            counts = [chunk_tokens(chunk) for chunk in batch]
+        else:
+            counts = tokenizer.count_batch([chunk.text for chunk in batch])
+        for chunk, count in zip(batch, counts):
+            if count > max_tokens:
+                yield from split_chunk_to_window(chunk, tokenizer, max_tokens)
+            else:
+                yield chunk
     
-    # Process chunks
-    chunks = []
-    current_chunk_lines = []
-    current_item_heading = None
-    found_forward_looking = False
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield from flush(batch)
+            batch = []
+    yield from flush(batch)
+
+def iter_content_lines(lines: Iterable[str]) -> Iterator[Tuple[str, int, int]]:
+    """
+    Yield classified (line, kind, offset) triples starting at the real content, i.e. after the
+    XBRL preamble and the table of contents, as found by ContentStartDetector. Only the
+    preamble and TOC region are buffered until the content start is known (the whole
+    input if a TOC but no content start is found).
+    offset is the character offset of the line in the input (lines are '\n' separated).
+    """
+    def numbered(source: Iterable[str]) -> Iterator[Tuple[str, int, int]]:
+        offset = 0
+        for line in source:
+            yield line, classify_line(line), offset
+            offset += len(line) + 1
+    
+    # Lines from the end of the preamble on are buffered until the content start is known;
+    # preamble lines are kept too in case the input is all preamble
+    line_iter = numbered(lines)
+    detector = ContentStartDetector()
+    buffer = []
+    for index, entry in enumerate(line_iter):
+        buffer.append(entry)
+        in_preamble = detector.state == detector.PREAMBLE
+        done = detector.feed(index, entry[0], entry[1])
+        if in_preamble and detector.state != detector.PREAMBLE:
+            # Preamble ended; keep the line only if it is content (not the "---" separator)
+            buffer = buffer[-1:] if detector.preamble_end == index else []
+        if done:
+            break
     
-    for line in content.split('\n'):
-        line_strip = line.strip()
-        
-        # Check for Forward-Looking Statements
-        if line_strip.lower() == "# forward-looking statements":
-            found_forward_looking = True
-            if not current_item_heading:
-                current_item_heading = "Item 1. Business"
-        
+    layout = detector.layout()
+    # Either the content start or the original start (no TOC / no content start found)
+    if buffer:
+        first_index = index - len(buffer) + 1
+        yield from buffer[max(layout.content_start - first_index, 0):]
+    buffer = None
+    yield from line_iter
+
+def iter_section_chunks(content: Iterable[Tuple[str, int, int]],
+                        labels: Optional[LabelTable] = None,
+                        document: Optional[SourceBuffer] = None) -> Iterator[Chunk]:
+    """
+    Split classified content lines into Item blocks and those into subheading sections,
+    yielding each section as soon as it is closed.
+    """
+    labels = labels if labels is not None else LabelTable()
+    # Content before the first Item heading (e.g. Forward-Looking Statements) belongs to Item 1
+    splitter = SubheadingSplitter("Item 1. Business", labels, document)
+    
+    for line, kind, offset in content:
         # Check if this is a new Item heading
-        item_heading_info = detect_item_heading(line_strip)
-        
-        if item_heading_info and item_heading_info['full_heading'] in STANDARD_10K_HEADINGS:
-            # If this is a real item heading (not just TOC entry)
-            if len(line_strip.split()) > 3:
-                # Save previous chunk if exists
-                if current_chunk_lines:
-                    chunks.append({
-                        "heading": current_item_heading or "Item 1. Business",
-                        "subheading": None,
-                        "text": '\n'.join(current_chunk_lines).strip()
-                    })
-                    current_chunk_lines = []
-                
-                # Start new chunk
-                current_chunk_lines = [line]
-                current_item_heading = item_heading_info["full_heading"]
-                found_forward_looking = False
-            else:
-                # This is a TOC entry, skip it
-                continue
+        if kind & LINE_ITEM_HEADING:
+            yield from splitter.close()
+            splitter = SubheadingSplitter(detect_item_heading(line)["full_heading"], labels, document)
+            yield from splitter.feed(line, kind, offset)
+        elif kind & LINE_TOC_ENTRY:
+            # This is a TOC entry, skip it
+            splitter.skip(line, offset)
         else:
-            # If we're after Forward-Looking Statements but before next item heading
-            if found_forward_looking and not current_item_heading:
-                current_item_heading = "Item 1. Business"
-            
-            # Add to current chunk
-            current_chunk_lines.append(line)
+            yield from splitter.feed(line, kind, offset)
     
-    # Don't forget the last chunk
-    if current_chunk_lines:
-        chunks.append({
-            "heading": current_item_heading or "Item 1. Business",
-            "subheading": None,
-            "text": '\n'.join(current_chunk_lines).strip()
-        })
-    
-    # Split chunks by subheadings
-    final_chunks = []
+    # Don't forget the last block
+    yield from splitter.close()
+
+def iter_chunks(fileobj: Iterable[str], max_tokens: int = DEFAULT_MAX_CHUNK_SIZE, tokenizer: Optional[Tokenizer] = None,
+                window_tokens: int = EMBEDDING_TOKEN_BUDGET, min_tokens: int = DEFAULT_MIN_CHUNK_SIZE) -> Iterator[Chunk]:
+    """
+    Stream final chunks from parsed markdown read line by line (an open file, or any
+    iterable of lines). Chunks are yielded as soon as their Item or subheading section
+    closes, so memory is bounded by the largest section rather than the whole filing.
+    Chunk.source_spans() gives the character offsets of each chunk in the input.
+    Chunks are split to max_tokens (estimated), merged up to min_tokens, and then guaranteed to fit
+    window_tokens according to tokenizer (see iter_window_fitted_chunks).
+    
+    Example:
+        with open("parsed_results/NVDA.md", encoding="utf-8") as f:
+            for chunk in iter_chunks(f):
+                ...
+    """
+    lines = (line[:-1] if line.endswith('\n') else line for line in fileobj)
+    sections = iter_section_chunks(iter_content_lines(lines), LabelTable())
+    return iter_window_fitted_chunks(iter_post_processed_chunks(sections, max_tokens, min_tokens), tokenizer, window_tokens)
+
+def iter_text_lines(text: str) -> Iterator[str]:
+    """Lazily yield the '\n' separated lines of text (like text.split('\n'))."""
+    start = 0
+    while True:
+        end = text.find('\n', start)
+        if end < 0:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+def iter_text_chunks(text: str, max_tokens: int = DEFAULT_MAX_CHUNK_SIZE, tokenizer: Optional[Tokenizer] = None,
+                     window_tokens: int = EMBEDDING_TOKEN_BUDGET, min_tokens: int = DEFAULT_MIN_CHUNK_SIZE) -> Iterator[Chunk]:
+    """
+    Same as iter_chunks for a document that is already in memory. Chunks reference
+    text itself as their shared buffer, so no chunk holds a copy of its text.
+    """
+    sections = iter_section_chunks(iter_content_lines(iter_text_lines(text)), LabelTable(), SourceBuffer(text, 0))
+    return iter_window_fitted_chunks(iter_post_processed_chunks(sections, max_tokens, min_tokens), tokenizer, window_tokens)
+
+def iter_item_sections(chunks: Iterable[Chunk]) -> Iterator[List[Chunk]]:
+    """
+    Group subheading chunks into Item sections: runs of consecutive chunks with the same
+    heading. Chunks with different headings are never merged, so post-processing each
+    section on its own gives the same chunks as post-processing the whole document.
+    Blank chunks are dropped before merging, so they do not end a section.
+    """
+    section = []
     for chunk in chunks:
-        subheading_chunks = split_by_subheadings(chunk['text'])
-        for subchunk in subheading_chunks:
-            final_chunks.append({
-                "heading": chunk['heading'],
-                "subheading": subchunk['subheading'],
-                "text": subchunk['text']
-            })
+        if not chunk.text.strip():
+            continue
+        if section and chunk.heading_id != section[-1].heading_id:
+            yield section
+            section = []
+        section.append(chunk)
+    if section:
+        yield section
+
+# Document of the process pool workers of iter_parallel_text_chunks, set once per worker
+WORKER_DOCUMENT: Optional[SourceBuffer] = None
+
+def init_section_worker(text: str):
+    """Process pool initializer: receive the document once instead of once per section."""
+    global WORKER_DOCUMENT
+    WORKER_DOCUMENT = SourceBuffer(text, 0)
+
+def encode_pieces(pieces: List[Piece]) -> List[Any]:
+    """
+    Pieces in a form that can be sent between processes without the document:
+    [start, end] for a range of the document, or the text itself for separators.
+    """
+    encoded = []
+    for buffer, start, end in pieces:
+        if buffer.offset is None:
+            encoded.append(buffer.text[start:end])
+        else:
+            encoded.append([buffer.offset + start, buffer.offset + end])
+    return encoded
+
+def decode_pieces(encoded: List[Any], document: SourceBuffer) -> List[Piece]:
+    """Inverse of encode_pieces on top of document."""
+    pieces = []
+    for piece in encoded:
+        if isinstance(piece, str):
+            pieces.append((SEPARATOR_BUFFERS.get(piece) or SourceBuffer(piece), 0, len(piece)))
+        else:
+            pieces.append((document, piece[0], piece[1]))
+    return pieces
+
+def post_process_section(task: Tuple[List[Tuple[str, Optional[str], List[Any]]], int, int, str, int]) -> List[Tuple[str, Optional[str], List[Any]]]:
+    """
+    Process pool task of iter_parallel_text_chunks: post-process and window-fit one Item
+    section given as (heading, subheading, encoded pieces) records, and return the
+    resulting chunks in the same form.
+    """
+    records, max_tokens, min_tokens, tokenizer_name, window_tokens = task
+    labels = LabelTable()
+    section = [Chunk(labels, labels.intern(heading), labels.intern(subheading), decode_pieces(pieces, WORKER_DOCUMENT))
+               for heading, subheading, pieces in records]
+    chunks = iter_window_fitted_chunks(iter_post_processed_chunks(iter(section), max_tokens, min_tokens),
+                                       get_tokenizer(tokenizer_name), window_tokens)
+    return [(chunk.heading, chunk.subheading, encode_pieces(chunk.pieces)) for chunk in chunks]
+
+def iter_parallel_text_chunks(text: str, max_tokens: int = DEFAULT_MAX_CHUNK_SIZE, tokenizer: Optional[Tokenizer] = None,
+                              window_tokens: int = EMBEDDING_TOKEN_BUDGET, workers: Optional[int] = None,
+                              min_tokens: int = DEFAULT_MIN_CHUNK_SIZE) -> Iterator[Chunk]:
+    """
+    Same chunks as iter_text_chunks, with the post-processing of each Item section
+    (splitting, merging, window fitting) run in a pool of worker processes (workers
+    defaults to the CPU count). The subheading split runs here, the sections are
+    processed in the pool and their chunks are yielded in document order. Workers look
+    the tokenizer up by name with get_tokenizer, so it must be registered there.
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    workers = workers or os.cpu_count() or 1
+    document = SourceBuffer(text, 0)
+    labels = LabelTable()
+    
+    sections = iter_item_sections(
+        iter_section_chunks(iter_content_lines(iter_text_lines(text)), labels, document))
+    tasks = [([(chunk.heading, chunk.subheading, encode_pieces(chunk.pieces)) for chunk in section],
+              max_tokens, min_tokens, tokenizer.name, window_tokens) for section in sections]
+    if not tasks:
+        return
+    
+    # Several sections per task keep the per-task overhead low on filings with many small Items
+    tasks_per_batch = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_section_worker, initargs=(text,)) as executor:
+        for records in executor.map(post_process_section, tasks, chunksize=tasks_per_batch):
+            for heading, subheading, pieces in records:
+                yield Chunk(labels, labels.intern(heading), labels.intern(subheading), decode_pieces(pieces, document))
+
+def process_and_save_chunks(text: str, output_file: str = None, tokenizer: Optional[Tokenizer] = None,
+                            store_file: str = None, store_header: Optional[Dict[str, Any]] = None,
+                            workers: Optional[int] = None) -> List[Chunk]:
+    """
+    Process text into chunks and save to file if output_file is provided. If store_file is
+    provided, the chunks are also written to a chunk store (see chunk_store) that the
+    indexer and retrieval modules load instead of re-chunking; store_header is added to
+    its header. With workers > 1, Item sections are post-processed in parallel
+    (see iter_parallel_text_chunks); the chunks are the same.
+    """
+    line_count = text.count('\n') + 1
+    print(f"Total lines: {line_count}")
     
-    # Post-process to ensure chunks don't exceed token limit
-    final_chunks = post_process_chunks(final_chunks)
+    if workers and workers > 1:
+        final_chunks = list(iter_parallel_text_chunks(text, tokenizer=tokenizer, workers=workers))
+    else:
+        final_chunks = list(iter_text_chunks(text, tokenizer=tokenizer))
     
     # Save to file if output file is provided
     if output_file:
         save_chunks_to_file(final_chunks, output_file)
         print(f"\nChunks also saved to file: {output_file}")
     
+    if store_file:
+        header = {"source_sha256": text_sha256(text)}
+        header.update(store_header or {})
+        write_chunk_store(final_chunks, store_file, header)
+        print(f"Chunk store written to: {store_file}")
+    
     return final_chunks
 
+def find_input_files(source: str) -> List[str]:
+    """Resolve a directory (all .md files in it) or a glob pattern to a sorted list of files."""
+    if os.path.isdir(source):
+        source = os.path.join(source, "*.md")
+    return sorted(path for path in glob.glob(source) if os.path.isfile(path))
+
+def chunk_file(input_file: str, output_dir: str = "chunking_results") -> Dict[str, Any]:
+    """
+    Chunk one parsed filing and write its chunk artifacts to output_dir: <name>_chunks.md
+    to read and the <name>_chunks.jsonl chunk store to load. Runs in a worker process in
+    batch mode, so it returns a stats record instead of printing, and reports errors in
+    that record instead of raising.
+    """
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    output_file = os.path.join(output_dir, f"{base_name}_chunks.md")
+    store_file = os.path.join(output_dir, f"{base_name}_chunks.jsonl")
+    result = {"file": input_file, "output_file": output_file, "store_file": store_file, "chunks": 0,
+              "lines": 0, "bytes": 0, "seconds": 0.0, "error": None}
+    start = time.perf_counter()
+    try:
+        with open(input_file, 'r', encoding='utf-8') as f:
+            content = f.read()
+        chunks = list(iter_text_chunks(content))
+        save_chunks_to_file(chunks, output_file)
+        write_chunk_store(chunks, store_file, {"filing": base_name, "source_sha256": text_sha256(content)})
+        result["chunks"] = len(chunks)
+        result["lines"] = content.count('\n') + 1
+        result["bytes"] = len(content.encode('utf-8'))
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def print_file_result(result: Dict[str, Any]):
+    """Print the stats record of one chunked file."""
+    name = os.path.basename(result["file"])
+    if result["error"]:
+        print(f"Error chunking {name}: {result['error']}")
+        return
+    seconds = result["seconds"] or 1e-9
+    print(f"{name}: {result['chunks']} chunks, {result['lines']:,} lines in {result['seconds']:.2f}s "
+          f"({result['lines'] / seconds:,.0f} lines/s, {result['bytes'] / seconds / 1e6:.2f} MB/s)")
+
+def chunk_files_parallel(input_files: List[str], output_dir: str = "chunking_results",
+                         workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Chunk many parsed filings across a pool of worker processes (workers defaults to the
+    CPU count; 1 runs in this process). Prints per-file results as they finish and the
+    total throughput at the end. Returns the per-file stats records in input order.
+    """
+    workers = workers or os.cpu_count() or 1
+    print(f"Chunking {len(input_files)} files with {workers} worker(s) into {output_dir}")
+    
+    start = time.perf_counter()
+    results = {}
+    if workers == 1:
+        for input_file in input_files:
+            results[input_file] = chunk_file(input_file, output_dir)
+            print_file_result(results[input_file])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(chunk_file, input_file, output_dir) for input_file in input_files]
+            for future in as_completed(futures):
+                result = future.result()
+                results[result["file"]] = result
+                print_file_result(result)
+    elapsed = time.perf_counter() - start
+    
+    ordered = [results[input_file] for input_file in input_files]
+    succeeded = [result for result in ordered if not result["error"]]
+    total_lines = sum(result["lines"] for result in succeeded)
+    total_bytes = sum(result["bytes"] for result in succeeded)
+    busy_seconds = sum(result["seconds"] for result in ordered)
+    print(f"\nChunked {len(succeeded)} of {len(ordered)} files: "
+          f"{sum(result['chunks'] for result in succeeded):,} chunks, {total_lines:,} lines in {elapsed:.2f}s")
+    if elapsed > 0:
+        print(f"Throughput: {total_lines / elapsed:,.0f} lines/s, {total_bytes / elapsed / 1e6:.2f} MB/s "
+              f"(parallel speedup {busy_seconds / elapsed:.1f}x)")
+    return ordered
+
 def get_sample_text():
     """
     Returns a sample 10-K text for testing the chunking functionality.
@@ -1180,8 +2140,9 @@ def main():
     print("Starting main function...")
     if len(sys.argv) < 2:
         print("Usage:")
-        print("  Test with markdown file: python output_chunking.py <filename>.md")
+        print("  Test with markdown file: python output_chunking.py <filename>.md [--workers N]")
         print("  Test with sample data:   python output_chunking.py --test")
+        print("  Batch mode:              python output_chunking.py --batch <dir|glob> [--workers N] [--output-dir DIR]")
         sys.exit(0)
 
     print(f"Arguments received: {sys.argv}")
@@ -1190,14 +2151,42 @@ def main():
         test()
         return
 
-    # Handle markdown file testing
-    input_file = sys.argv[1]
+    if sys.argv[1] == "--batch":
+        # Batch mode: chunk a directory or glob of parsed filings on all cores
+        args = sys.argv[2:]
+        workers = None
+        output_dir = "chunking_results"
+        if "--workers" in args:
+            idx = args.index("--workers")
+            workers = int(args[idx + 1])
+            del args[idx:idx + 2]
+        if "--output-dir" in args:
+            idx = args.index("--output-dir")
+            output_dir = args[idx + 1]
+            del args[idx:idx + 2]
+        source = args[0] if args else "parsed_results"
+        input_files = find_input_files(source)
+        if not input_files:
+            print(f"No markdown files found for: {source}")
+            return
+        chunk_files_parallel(input_files, output_dir, workers)
+        return
+
+    # Handle markdown file testing; --workers post-processes the file's Item sections in parallel
+    args = sys.argv[1:]
+    workers = None
+    if "--workers" in args:
+        idx = args.index("--workers")
+        workers = int(args[idx + 1])
+        del args[idx:idx + 2]
+    input_file = args[0]
     print(f"Processing input file: {input_file}")
     
     # Generate output filename with timestamp
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     base_name = os.path.splitext(os.path.basename(input_file))[0]
     output_file = os.path.join("chunking_results", f"{base_name}_chunks_{timestamp}.md")
+    store_file = os.path.join("chunking_results", f"{base_name}_chunks.jsonl")
     print(f"Output will be written to: {output_file}")
     
     # Read the input file
@@ -1211,7 +2200,8 @@ def main():
         
     # Process the content
     try:
-        chunks = process_and_save_chunks(content, output_file)
+        chunks = process_and_save_chunks(content, output_file, store_file=store_file,
+                                         store_header={"filing": base_name}, workers=workers)
         print(f"Successfully processed {len(chunks)} chunks")
     except Exception as e:
         print(f"Error processing chunks: {e}")
@@ -1,42 +1,191 @@
+import io
 import os
+import re
 import sys
-from typing import List, Dict, Any
+import time
+from array import array
+from typing import List, Dict, Any, Union, TextIO, Optional, Tuple, Set
 from datetime import datetime
-from import_2_chunking import process_and_save_chunks
+from import_2_chunking import iter_chunks
+from incremental_chunking import chunk_incrementally, commit_manifest, print_diff_summary
+from chunk_store import ChunkStore, chunk_id, mark_indexed
+from chunk_features import chunk_features
+from stage_pipeline import Stage, run_stages, stage_report, print_stage_report
+from embedding_cache import get_embedding_cache, cache_report, print_cache_report
+from embedding_batches import (EmbeddingStats, EMBED_BATCH_SIZE, EMBED_CONCURRENCY, embed_texts,
+                               embedding_report, print_embedding_report)
+from upsert_batches import UpsertStats, UPSERT_CONCURRENCY, upsert_vectors, upsert_report, print_upsert_report
+from near_duplicates import SignatureIndex, DuplicateMatch, minhash_signature, dedupe_report, print_dedupe_report
+from table_compaction import compact_tables, compaction_report, print_compaction_report
+from token_counting import EMBEDDING_MAX_TOKENS, get_tokenizer, get_report_tokenizer, truncation_report, print_truncation_report
 
-try:
-    from pinecone import Pinecone
-except ImportError:
-    raise ImportError("Please install Pinecone via: pip install pinecone")
+# IDs deleted per request, and vectors fetched per request
+DELETE_BATCH_SIZE = 1000
+FETCH_BATCH_SIZE = 100
+
+# What follows the filing prefix in the IDs of a filing's vectors: a content ID (see
+# chunk_store.chunk_id), or the chunk position used as ID by earlier versions
+RE_FILING_VECTOR_SUFFIX = re.compile(r'[0-9a-f]{32}|\d+')
+
+def create_client(api_key: str):
+    """Pinecone client, or None if the pinecone package is not installed."""
+    try:
+        from pinecone import Pinecone
+    except ImportError:
+        print("Please install pinecone-client: pip install pinecone-client")
+        return None
+    return Pinecone(api_key=api_key)
+
+def filing_prefix(metadata: Dict[str, str]) -> str:
+    """ID prefix of the vectors of a company's fiscal year, shared by all its document types."""
+    return f"{metadata.get('company_name', 'unknown')}_{metadata.get('fiscal_year', 'unknown')}_"
+
+def vector_id(metadata: Dict[str, str], content_id: str) -> str:
+    """Pinecone ID of a chunk: company, fiscal year, document type and the chunk's content ID."""
+    return f"{filing_prefix(metadata)}{metadata.get('document_type', 'unknown')}_{content_id}"
+
+def existing_vector_ids(index, namespace: str, metadata: Dict[str, str]) -> Optional[Set[str]]:
+    """
+    IDs of the vectors of a filing already in the namespace, or None if they cannot be
+    listed (only serverless indexes can list IDs). The filing's vectors are listed by
+    their ID prefix, which includes the document type, so a 10-K/A never lists the
+    10-K's vectors. IDs written before the document type was part of them are only
+    included if their metadata has the filing's document type.
+    """
+    prefix = vector_id(metadata, "")
+    legacy_prefix = filing_prefix(metadata)
+    ids = set()
+    legacy_ids = []
+    try:
+        for page in index.list(prefix=legacy_prefix, namespace=namespace):
+            for identifier in page:
+                if identifier.startswith(prefix) and RE_FILING_VECTOR_SUFFIX.fullmatch(identifier[len(prefix):]):
+                    ids.add(identifier)
+                elif RE_FILING_VECTOR_SUFFIX.fullmatch(identifier[len(legacy_prefix):]):
+                    legacy_ids.append(identifier)
+        document_type = metadata.get("document_type", "unknown")
+        for i in range(0, len(legacy_ids), FETCH_BATCH_SIZE):
+            response = index.fetch(ids=legacy_ids[i:i + FETCH_BATCH_SIZE], namespace=namespace)
+            ids.update(identifier for identifier, vector in response.vectors.items()
+                       if (vector.metadata or {}).get("document_type") == document_type)
+    except Exception as e:
+        print(f"Could not list existing vectors, upserting every chunk: {str(e)}")
+        return None
+    return ids
+
+def delete_vectors(index, namespace: str, ids: List[str]):
+    """Delete vectors from Pinecone and from the signature index, so near-duplicates no longer reuse them."""
+    for i in range(0, len(ids), DELETE_BATCH_SIZE):
+        index.delete(ids=ids[i:i + DELETE_BATCH_SIZE], namespace=namespace)
+    signature_index = SignatureIndex()
+    for identifier in ids:
+        signature_index.remove(identifier, namespace)
+    signature_index.commit()
+    signature_index.close()
+
+def fetch_duplicate_vectors(
+    index,
+    duplicates: List[Tuple[str, Dict[str, Any], DuplicateMatch]],
+    embedded: Dict[str, array]
+) -> Tuple[List[Dict[str, Any]], List[Tuple[str, Dict[str, Any], DuplicateMatch]]]:
+    """
+    Build vectors for near-duplicate chunks from the values of the vectors they match:
+    from this run's embeddings when the match was embedded in this run (a vector just
+    upserted may not be visible to fetch yet), otherwise fetched from Pinecone. Returns
+    the vectors and the duplicates whose match could not be found.
+    """
+    to_fetch = {}
+    for _, _, match in duplicates:
+        if match.vector_id not in embedded:
+            to_fetch.setdefault(match.namespace, set()).add(match.vector_id)
+    
+    fetched = {}
+    for match_namespace, ids in to_fetch.items():
+        ids = sorted(ids)
+        for i in range(0, len(ids), FETCH_BATCH_SIZE):
+            try:
+                response = index.fetch(ids=ids[i:i + FETCH_BATCH_SIZE], namespace=match_namespace)
+                for identifier, vector in response.vectors.items():
+                    fetched[(match_namespace, identifier)] = vector.values
+            except Exception as e:
+                print(f"Error fetching duplicate vectors from namespace {match_namespace}: {str(e)}")
+    
+    vectors = []
+    missing = []
+    for identifier, chunk_metadata, match in duplicates:
+        values = embedded.get(match.vector_id)
+        values = list(values) if values is not None else fetched.get((match.namespace, match.vector_id))
+        if values is None:
+            missing.append((identifier, chunk_metadata, match))
+            continue
+        vectors.append({
+            "id": identifier,
+            "values": values,
+            "metadata": dict(chunk_metadata, duplicate_of=match.vector_id)
+        })
+    return vectors, missing
 
 def embed_and_upsert(
-    text_content: str,
+    text_content: Optional[Union[str, TextIO]],
     metadata: Dict[str, str],
     api_key: str,
     save_chunks: bool = True,
-    namespace: str = ""
+    namespace: str = "",
+    chunk_store: Optional[str] = None,
+    dedupe: bool = True,
+    compact: bool = True,
+    batch_size: int = EMBED_BATCH_SIZE,
+    concurrency: int = EMBED_CONCURRENCY,
+    upsert_concurrency: int = UPSERT_CONCURRENCY,
+    cache: bool = True,
+    diff: bool = True,
+    pc=None
 ) -> bool:
     """
-    Embed chunks of text and upsert them to Pinecone.
+    Embed chunks of text and upsert them to Pinecone. Chunking, embedding and upserting
+    run as overlapping stages connected by bounded queues (see stage_pipeline), so memory
+    does not grow with the filing and the run takes about as long as its slowest stage.
+    
+    Vector IDs are content hashes, so the chunks of the filing already in the namespace
+    are known by their IDs: only new chunks are embedded and upserted, and vectors of
+    chunks the filing no longer has are deleted. Re-indexing an unchanged filing costs
+    no embeddings and no upserts.
     
     Args:
-        text_content: The text content to process and embed
+        text_content: The text content to process and embed, or an open file to stream it from
         metadata: Document metadata to include with each chunk
         api_key: Pinecone API key
         save_chunks: Whether to save chunks to a file
         namespace: Pinecone namespace to use (company-specific)
+        chunk_store: Chunk store written by the chunker; if given, its chunks are embedded
+            and text_content is not chunked again, and once every chunk is indexed the
+            store is marked as indexed (see chunk_store.mark_indexed) for retrieval
+        dedupe: Reuse the vector of a near-duplicate chunk embedded earlier (same or other
+            filing, see near_duplicates) instead of embedding the chunk again; the copy's
+            metadata links to the original in duplicate_of
+        compact: Embed and store (as chunk_text) the chunk text with its markdown tables
+            compacted (see table_compaction) instead of the text as parsed
+        batch_size: Chunks per embedding request (capped at the model's input limit)
+        concurrency: Embedding requests in flight at once; failed requests are retried
+            and failed inputs re-embedded on their own (see embedding_batches)
+        upsert_concurrency: Upsert requests in flight at once; batches are packed by size
+            and retried on transient failures (see upsert_batches)
+        cache: Take embeddings of texts embedded before from the local embedding cache
+            (see embedding_cache) and add the new ones to it
+        diff: Skip chunks whose vectors exist and delete stale ones once every new chunk
+            is upserted; without it every chunk is upserted (e.g. to rewrite the metadata
+            after its format changed: vectors indexed before chunk features were added to
+            it have no years, so year-filtered searches only find them after a --no-diff run)
+        pc: Pinecone client to use instead of one created with api_key
     
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if every chunk was indexed, False otherwise (running again only
+            embeds and upserts the missing ones)
     """
-    try:
-        from pinecone import Pinecone
-    except ImportError:
-        print("Please install pinecone-client: pip install pinecone-client")
-        return False
-
     # Initialize Pinecone
-    pc = Pinecone(api_key=api_key)
+    pc = pc or create_client(api_key)
+    if pc is None:
+        return False
     
     # Get the index name from environment variables
     index_name = os.getenv("PINECONE_INDEX_NAME", "financialdocs")
@@ -44,30 +193,67 @@ def embed_and_upsert(
     # Get the index
     index = pc.Index(index_name)
     
-    # Process text into chunks
-    chunks = process_and_save_chunks(text_content)
-    if not chunks:
-        print("No chunks generated")
-        return False
-    
-    print(f"\nEmbedding and upserting {len(chunks)} chunks to namespace: {namespace}")
+    print(f"\nEmbedding and upserting chunks to namespace: {namespace}")
     print(f"Using index: {index_name}")
     
-    # Prepare vectors for batch upsert
-    vectors = []
-    for i, chunk in enumerate(chunks):
-        # Generate embedding
-        try:
-            embedding_list = pc.inference.embed(
-                model="multilingual-e5-large",
-                inputs=[chunk['text']],
-                parameters={"input_type": "passage", "truncate": "END"}
-            )
-            if not embedding_list or not embedding_list.data:
-                print(f"Warning: No embedding generated for chunk {i}")
+    # Vectors of this filing from earlier runs; the chunks that still have them are skipped
+    existing_ids = existing_vector_ids(index, namespace, metadata) if diff else None
+    current_ids = set()
+    
+    # Shared tokenizer chunks are fitted to the embedding window with, and the one the reports count with
+    tokenizer = get_tokenizer()
+    report_tokenizer = get_report_tokenizer(tokenizer)
+    
+    if chunk_store:
+        # Chunks were already written by the chunker; load them instead of chunking again
+        store = ChunkStore(chunk_store)
+        print(f"Loaded {len(store)} chunks from chunk store: {chunk_store}")
+        chunks = iter(store)
+    else:
+        # Stream chunks so embedding starts as soon as the first section is chunked
+        if isinstance(text_content, str):
+            text_content = io.StringIO(text_content)
+        store = None
+        chunks = iter_chunks(text_content, tokenizer=tokenizer)
+    
+    # Near-duplicates of chunks embedded before are matched against the persistent signature index
+    signature_index = SignatureIndex() if dedupe else None
+    duplicates = []
+    # Values of every vector embedded in this run (float32, 4 KB per chunk): any of them can
+    # be matched by a later near-duplicate, and they are not fetched back from Pinecone
+    run_values = {}
+    failed_ids = []
+    upsert_failed_ids = []
+    upserted = []
+    
+    chunk_count = 0
+    unchanged_count = 0
+    token_counts = []
+    compaction_counts = []
+    
+    def prepared_batches():
+        """Chunk and prepare in the calling thread; yields batches of chunks to embed."""
+        nonlocal chunk_count, unchanged_count
+        pending = []
+        for chunk in chunks:
+            chunk_count += 1
+            # IDs are content hashes so unchanged chunks keep their vectors
+            chunk_vector_id = vector_id(metadata, chunk.get("id") or chunk_id(chunk))
+            if chunk_vector_id in current_ids:
+                # Repeated chunk of this filing; it has one vector
                 continue
-                
-            embedding = embedding_list[0].values
+            current_ids.add(chunk_vector_id)
+            if existing_ids is not None and chunk_vector_id in existing_ids:
+                unchanged_count += 1
+                continue
+            
+            chunk_text = chunk['text']
+            if compact:
+                # Chunk stores already hold the compact form of chunks with tables
+                compact_text = chunk.get('compact_text') or compact_tables(chunk_text)
+                compaction_counts.append((report_tokenizer.count(chunk_text), report_tokenizer.count(compact_text)))
+                chunk_text = compact_text
+            token_counts.append(report_tokenizer.count(chunk_text))
             
             # Combine document metadata with chunk metadata
             chunk_metadata = {
@@ -77,46 +263,281 @@ def embed_and_upsert(
                 "document_url": metadata.get("document_url", ""),
                 "top_level_heading": chunk.get("heading") or "",
                 "subheading": chunk.get("subheading") or "",
-                "chunk_text": chunk.get("text") or ""
+                "chunk_text": chunk_text,
+                # Years, currency, table and segment features for pre-filtering (chunk stores hold them already)
+                **(chunk.get("features") or chunk_features(chunk["text"]))
             }
             
-            # Add to vectors list
-            vectors.append({
-                "id": f"{metadata.get('company_name', 'unknown')}_{metadata.get('fiscal_year', 'unknown')}_{i}",
-                "values": embedding,
-                "metadata": chunk_metadata
-            })
+            signature = minhash_signature(chunk_text) if signature_index is not None else None
+            if signature is not None:
+                match = signature_index.find(signature)
+                if match is not None:
+                    duplicates.append((chunk_vector_id, chunk_metadata, match))
+                    if existing_ids is not None and match.namespace == namespace and match.vector_id in existing_ids:
+                        # An earlier version of this filing's chunk, deleted below if it is stale:
+                        # the copy keeps a signature of its own
+                        signature_index.add(chunk_vector_id, namespace, signature)
+                    continue
+                # Indexed right away so later chunks of this filing can match it; removed if embedding fails
+                signature_index.add(chunk_vector_id, namespace, signature)
             
-        except Exception as e:
-            print(f"Error processing chunk {i}: {str(e)}")
-            continue
+            pending.append((chunk_vector_id, chunk_metadata))
+            if len(pending) >= batch_size:
+                yield pending
+                pending = []
+        if pending:
+            yield pending
     
-    if not vectors:
+    def embed_batch_vectors(batch):
+        embeddings = embed_texts(pc, [chunk_metadata["chunk_text"] for _, chunk_metadata in batch],
+                                 batch_size=batch_size, concurrency=1, stats=embedding_stats, cache=embedding_cache)
+        vectors = []
+        for (identifier, chunk_metadata), values in zip(batch, embeddings):
+            if values is None:
+                print(f"Warning: No embedding generated for chunk {identifier}")
+                failed_ids.append(identifier)
+                continue
+            if signature_index is not None:
+                run_values[identifier] = array('f', values)
+            vectors.append({"id": identifier, "values": values, "metadata": chunk_metadata})
+        return [vectors] if vectors else None
+    
+    def upsert_embedded(vectors):
+        # Each sender packs its batch by size; the stage's workers keep several requests in flight
+        failed = upsert_vectors(index, vectors, namespace, concurrency=1, stats=upsert_stats)
+        upsert_failed_ids.extend(failed)
+        upserted.append(len(vectors) - len(failed))
+    
+    # Chunking, embedding and upserting overlap; bounded queues between them keep memory flat
+    embedding_stats = EmbeddingStats()
+    upsert_stats = UpsertStats()
+    embedding_cache = get_embedding_cache() if cache else None
+    stages = [Stage("embed", embed_batch_vectors, concurrency), Stage("upsert", upsert_embedded, upsert_concurrency)]
+    try:
+        seconds = run_stages(prepared_batches(), stages)
+    except Exception as e:
+        print(f"Error upserting to Pinecone: {str(e)}")
+        if signature_index is not None:
+            signature_index.rollback()
+            signature_index.close()
+        return False
+    finally:
+        if store is not None:
+            store.close()
+    
+    if not chunk_count:
+        print("No chunks generated")
+        if signature_index is not None:
+            signature_index.close()
+        return False
+    
+    upserted_count = sum(upserted)
+    embedded_count = upserted_count + len(upsert_failed_ids)
+    print(f"Embedded {embedded_count} of {chunk_count} chunks")
+    print_embedding_report(embedding_report(embedded_count + len(failed_ids), len(failed_ids), embedding_stats,
+                                            stages[0].busy_seconds / stages[0].workers))
+    print_stage_report(stage_report(stages, seconds))
+    if embedding_cache is not None:
+        print_cache_report(cache_report(embedding_cache))
+    if compact:
+        print_compaction_report(compaction_report(compaction_counts, estimated=not report_tokenizer.exact),
+                                report_tokenizer.name)
+    print_truncation_report(truncation_report(token_counts, EMBEDDING_MAX_TOKENS, estimated=not report_tokenizer.exact),
+                            report_tokenizer.name)
+    
+    if signature_index is not None:
+        for identifier in failed_ids + upsert_failed_ids:
+            signature_index.remove(identifier, namespace)
+    
+    vectors = []
+    if duplicates:
+        duplicate_vectors, missing = fetch_duplicate_vectors(index, duplicates, run_values)
+        vectors.extend(duplicate_vectors)
+        # Matches from earlier runs deleted from Pinecone since they were indexed: drop them and embed the
+        # chunk. Matches of this run are missing when they failed to embed; their signatures are gone already.
+        for identifier, chunk_metadata, match in missing:
+            if match.namespace != namespace or match.vector_id not in current_ids:
+                signature_index.remove(match.vector_id, match.namespace)
+        embeddings = embed_texts(pc, [chunk_metadata["chunk_text"] for _, chunk_metadata, _ in missing],
+                                 batch_size=batch_size, concurrency=concurrency, cache=embedding_cache)
+        for (identifier, chunk_metadata, _), values in zip(missing, embeddings):
+            if values is not None:
+                vectors.append({"id": identifier, "values": values, "metadata": chunk_metadata})
+                signature_index.add(identifier, namespace, minhash_signature(chunk_metadata["chunk_text"]))
+        print_dedupe_report(dedupe_report(chunk_count, len(duplicates), len(duplicate_vectors)))
+    elif signature_index is not None:
+        print_dedupe_report(dedupe_report(chunk_count, 0, 0))
+    
+    # Vectors of chunks the filing no longer has
+    removed_ids = sorted(existing_ids - current_ids) if existing_ids is not None else []
+    if existing_ids is not None:
+        print(f"Diff against namespace: {unchanged_count} unchanged, {len(current_ids) - unchanged_count} new, "
+              f"{len(removed_ids)} removed")
+    
+    if not vectors and not upserted_count and not unchanged_count:
         print("No vectors generated")
+        if signature_index is not None:
+            signature_index.close()
         return False
     
-    # Batch upsert to Pinecone
+    # Upsert the vectors of near-duplicates
     try:
-        # Upsert in batches of 100
-        batch_size = 100
-        for i in range(0, len(vectors), batch_size):
-            batch = vectors[i:i + batch_size]
-            index.upsert(vectors=batch, namespace=namespace)
-            print(f"Upserted batch {i//batch_size + 1} of {(len(vectors) + batch_size - 1)//batch_size}")
+        start = time.perf_counter()
+        duplicate_failed_ids = upsert_vectors(index, vectors, namespace, concurrency=upsert_concurrency,
+                                              stats=upsert_stats)
+        upsert_failed_ids.extend(duplicate_failed_ids)
+        print_upsert_report(upsert_report(upsert_stats, stages[1].busy_seconds / stages[1].workers +
+                                          time.perf_counter() - start))
         
-        print(f"Successfully indexed {len(vectors)} vectors in namespace: {namespace}")
+        print(f"Successfully indexed {upserted_count + len(vectors) - len(duplicate_failed_ids)} vectors "
+              f"in namespace: {namespace}{f' ({unchanged_count} unchanged kept)' if unchanged_count else ''}")
+        # New signatures only point at vectors that now exist
+        if signature_index is not None:
+            for identifier in duplicate_failed_ids:
+                signature_index.remove(identifier, namespace)
+            signature_index.commit()
+        if failed_ids or upsert_failed_ids:
+            print(f"{len(failed_ids)} chunks were not embedded and {len(upsert_failed_ids)} vectors not upserted"
+                  f"{f'; {len(removed_ids)} stale vectors kept' if removed_ids else ''}")
+            return False
+        # Stale vectors go only once every new one is in, so a failed run leaves the old version searchable
+        if removed_ids:
+            delete_vectors(index, namespace, removed_ids)
+            print(f"Deleted {len(removed_ids)} stale vectors")
+        if chunk_store:
+            mark_indexed(chunk_store)
         return True
         
     except Exception as e:
         print(f"Error upserting to Pinecone: {str(e)}")
+        if signature_index is not None:
+            signature_index.rollback()
         return False
+    finally:
+        if signature_index is not None:
+            signature_index.close()
+
+def apply_chunk_diff(
+    diff: Dict[str, Any],
+    metadata: Dict[str, str],
+    api_key: str,
+    namespace: str = "",
+    compact: bool = True,
+    batch_size: int = EMBED_BATCH_SIZE,
+    concurrency: int = EMBED_CONCURRENCY,
+    upsert_concurrency: int = UPSERT_CONCURRENCY,
+    cache: bool = True,
+    pc=None
+) -> bool:
+    """
+    Bring a namespace up to date with an incremental chunking run (see
+    incremental_chunking.chunk_incrementally): delete the vectors of removed chunks and
+    embed and upsert only the added ones. Unchanged chunks keep their vectors, and the
+    removed chunks' vectors are only deleted once every added chunk is upserted. Commit
+    the diff's manifest (incremental_chunking.commit_manifest) only if this succeeds.
+    
+    Args:
+        diff: Diff returned by chunk_incrementally
+        metadata: Document metadata to include with each chunk
+        api_key: Pinecone API key
+        namespace: Pinecone namespace to use (company-specific)
+        compact: Embed the chunk text with its tables compacted, as embed_and_upsert does
+        batch_size: Chunks per embedding request, as in embed_and_upsert
+        concurrency: Embedding requests in flight at once, as in embed_and_upsert
+        upsert_concurrency: Upsert requests in flight at once, as in embed_and_upsert
+        cache: Use the local embedding cache, as in embed_and_upsert
+        pc: Pinecone client to use instead of one created with api_key
+    
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    pc = pc or create_client(api_key)
+    if pc is None:
+        return False
+    index_name = os.getenv("PINECONE_INDEX_NAME", "financialdocs")
+    index = pc.Index(index_name)
+    
+    print(f"\nApplying chunk diff for {diff['filing']} to namespace: {namespace}")
+    print(f"Unchanged: {diff['unchanged']}, added: {len(diff['added'])}, removed: {len(diff['removed'])}")
+    
+    texts = [compact_tables(chunk["text"]) if compact else chunk["text"] for chunk in diff["added"]]
+    embedding_stats = EmbeddingStats()
+    start = time.perf_counter()
+    embedding_cache = get_embedding_cache() if cache else None
+    embeddings = embed_texts(pc, texts, batch_size=batch_size, concurrency=concurrency, stats=embedding_stats,
+                             cache=embedding_cache)
+    failed = sum(1 for values in embeddings if values is None)
+    print_embedding_report(embedding_report(len(texts), failed, embedding_stats, time.perf_counter() - start))
+    if embedding_cache is not None:
+        print_cache_report(cache_report(embedding_cache))
+    
+    vectors = []
+    for chunk, chunk_text, values in zip(diff["added"], texts, embeddings):
+        if values is None:
+            print(f"Warning: No embedding generated for chunk {chunk['id']}")
+            continue
+        vectors.append({
+            "id": vector_id(metadata, chunk["id"]),
+            "values": values,
+            "metadata": {
+                "company_name": metadata.get("company_name", ""),
+                "fiscal_year": metadata.get("fiscal_year", ""),
+                "document_type": metadata.get("document_type", ""),
+                "document_url": metadata.get("document_url", ""),
+                "top_level_heading": chunk.get("heading") or "",
+                "subheading": chunk.get("subheading") or "",
+                "chunk_text": chunk_text,
+                **(chunk.get("features") or chunk_features(chunk["text"]))
+            }
+        })
+    
+    if len(vectors) < len(diff["added"]):
+        print(f"Embedded {len(vectors)} of {len(diff['added'])} added chunks")
+    
+    try:
+        upsert_stats = UpsertStats()
+        start = time.perf_counter()
+        failed = upsert_vectors(index, vectors, namespace, concurrency=upsert_concurrency, stats=upsert_stats)
+        print_upsert_report(upsert_report(upsert_stats, time.perf_counter() - start))
+        print(f"Upserted {len(vectors) - len(failed)} vectors in namespace: {namespace}")
+    except Exception as e:
+        print(f"Error upserting to Pinecone: {str(e)}")
+        return False
+    if len(vectors) < len(diff["added"]) or failed:
+        if diff["removed"]:
+            print(f"Kept the vectors of {len(diff['removed'])} removed chunks until every added chunk is upserted")
+        return False
+    
+    try:
+        removed_ids = [vector_id(metadata, identifier) for identifier in diff["removed"]]
+        if removed_ids:
+            delete_vectors(index, namespace, removed_ids)
+            print(f"Deleted {len(removed_ids)} vectors")
+    except Exception as e:
+        print(f"Error deleting from Pinecone: {str(e)}")
+        return False
+    return True
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python indexing.py <input_file> [--metadata key=value ...]")
+        print("Usage: python indexing.py <input_file|chunk_store.jsonl> [--metadata key=value ...] [--incremental] [--no-dedupe] [--no-compact] [--batch-size N] [--concurrency N] [--upsert-concurrency N] [--no-cache] [--no-diff]")
         return
 
     input_file = sys.argv[1]
+    incremental = "--incremental" in sys.argv
+    dedupe = "--no-dedupe" not in sys.argv
+    compact = "--no-compact" not in sys.argv
+    cache = "--no-cache" not in sys.argv
+    diff_existing = "--no-diff" not in sys.argv
+    batch_size = EMBED_BATCH_SIZE
+    concurrency = EMBED_CONCURRENCY
+    upsert_concurrency = UPSERT_CONCURRENCY
+    if "--batch-size" in sys.argv:
+        batch_size = int(sys.argv[sys.argv.index("--batch-size") + 1])
+    if "--concurrency" in sys.argv:
+        concurrency = int(sys.argv[sys.argv.index("--concurrency") + 1])
+    if "--upsert-concurrency" in sys.argv:
+        upsert_concurrency = int(sys.argv[sys.argv.index("--upsert-concurrency") + 1])
     
     # Parse metadata from command line arguments
     metadata = {}
@@ -148,12 +569,32 @@ def main():
             return
 
     try:
-        # Read the input file
-        with open(input_file, 'r', encoding='utf-8') as f:
-            content = f.read()
+        if incremental:
+            # Re-chunk only changed Item sections and apply the chunk diff
+            with open(input_file, 'r', encoding='utf-8') as f:
+                text = f.read()
+            filing_key = f"{metadata['company_name']}_{metadata['fiscal_year']}_{metadata['document_type']}"
+            _, diff = chunk_incrementally(text, filing_key)
+            print_diff_summary(diff)
+            if apply_chunk_diff(diff, metadata, api_key, compact=compact, batch_size=batch_size,
+                                concurrency=concurrency, upsert_concurrency=upsert_concurrency, cache=cache):
+                commit_manifest(diff)
+            else:
+                print("Chunk diff not fully applied; the next --incremental run applies it again")
+            return
         
-        # Process and index the content
-        embed_and_upsert(content, metadata, api_key)
+        if input_file.endswith(".jsonl"):
+            # Chunk store written by the chunker
+            embed_and_upsert(None, metadata, api_key, chunk_store=input_file, dedupe=dedupe, compact=compact,
+                             batch_size=batch_size, concurrency=concurrency, upsert_concurrency=upsert_concurrency,
+                             cache=cache, diff=diff_existing)
+            return
+        
+        # Stream the input file through chunking, embedding and indexing
+        with open(input_file, 'r', encoding='utf-8') as f:
+            embed_and_upsert(f, metadata, api_key, dedupe=dedupe, compact=compact,
+                             batch_size=batch_size, concurrency=concurrency, upsert_concurrency=upsert_concurrency,
+                             cache=cache, diff=diff_existing)
         
     except FileNotFoundError:
         print(f"Error: File '{input_file}' not found")
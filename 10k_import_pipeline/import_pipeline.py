@@ -1,5 +1,5 @@
 import os
-from typing import Optional, Dict
+from typing import Optional, Dict, Any, Iterable
 from datetime import datetime
 from dotenv import load_dotenv
 import re
@@ -29,8 +29,13 @@ check_and_install_packages()
 # Import our pipeline components
 from import_0_search import search_10k, setup_logging
 from import_1_parse import download_sec_filing_pdf, parse_pdf_to_markdown
-from import_2_chunking import process_and_save_chunks
+from import_2_chunking import process_and_save_chunks, DEFAULT_MAX_CHUNK_SIZE, DEFAULT_MIN_CHUNK_SIZE
 from import_3_indexing import embed_and_upsert
+from chunk_store import ChunkStore, chunk_store_path, CHUNK_STORE_VERSION
+from fact_store import write_filing_facts, filing_fact_count, fact_store_dir, FACT_STORE_VERSION
+from incremental_chunking import CHUNKER_FINGERPRINT, source_fingerprint
+from stage_artifacts import ArtifactStage, make_artifact, run_artifact_stages, print_stage_timings
+from token_counting import EMBEDDING_MODEL, get_tokenizer
 
 def generate_namespace(company_name: str) -> str:
     """
@@ -52,7 +57,11 @@ def generate_namespace(company_name: str) -> str:
     # Truncate to 63 characters if needed
     return namespace[:63]
 
-def run_pipeline(company_name: str) -> bool:
+def filing_key(company_name: str, metadata: Dict[str, str]) -> str:
+    """Key of a filing in its namespace's chunk and fact stores."""
+    return f"{company_name}_{metadata.get('fiscal_year', 'unknown')}_{metadata.get('document_type', '10-K')}"
+
+def run_pipeline(company_name: str, force: Iterable[str] = ()) -> bool:
     """
     Run the full document retrieval and processing pipeline:
     1. Search for company's 10-K using Exa
@@ -60,8 +69,18 @@ def run_pipeline(company_name: str) -> bool:
     3. Process markdown into chunks
     4. Embed and index chunks in Pinecone using company-specific namespace
     
+    Each step is a stage of stage_artifacts: its output (search metadata, PDF, markdown,
+    chunk store, fact count) is keyed by the content hash of its inputs and config, and
+    a stage whose output an earlier run already produced is skipped. The chunk and facts
+    configs include a hash of their modules' source, so a code change runs them again,
+    and so does a filing's facts going missing from the fact store. The search always
+    runs, so a newer filing is picked up, and so does indexing, which only embeds and
+    upserts the chunks the namespace does not have (e.g. after it was wiped).
+    
     Args:
         company_name: Name of the company to process
+        force: Stages to run even if their output exists (download, parse, chunk,
+            facts), or "all"
     
     Returns:
         bool: True if pipeline completed successfully, False otherwise
@@ -94,57 +113,90 @@ def run_pipeline(company_name: str) -> bool:
     # Generate namespace for this company
     namespace = generate_namespace(company_name)
     print(f"Using namespace: {namespace}")
-
-    try:
-        # Step 1: Search for 10-K
+    
+    def search(company: str):
         print("\n=== STEP 1: Searching for 10-K ===")
-        metadata = search_10k(company_name, exa_api_key)
-        if not metadata:
-            print("Failed to find 10-K document. Pipeline stopped.")
-            return False
-        
-        # Step 2: Download and Parse
+        return search_10k(company, exa_api_key)
+    
+    def download(metadata: Dict[str, str]):
         print("\n=== STEP 2: Downloading and Parsing PDF ===")
-        pdf_path = download_sec_filing_pdf(metadata["document_url"], sec_api_key)
-        if not pdf_path:
-            print("Failed to download PDF. Pipeline stopped.")
-            return False
-            
-        markdown_path = parse_pdf_to_markdown(pdf_path, llama_api_key)
-        if not markdown_path:
-            print("Failed to parse PDF to markdown. Pipeline stopped.")
-            return False
-            
-        # Step 3: Process into chunks
+        return download_sec_filing_pdf(metadata["document_url"], sec_api_key)
+    
+    def parse(pdf_path: str):
+        return parse_pdf_to_markdown(pdf_path, llama_api_key)
+    
+    def chunk(company: str, metadata: Dict[str, str], markdown_path: str):
         print("\n=== STEP 3: Processing into chunks ===")
         with open(markdown_path, 'r', encoding='utf-8') as f:
             markdown_content = f.read()
-            
+        
         # Generate output filename for chunks
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        chunks_file = f"chunking_results/{company_name}_chunks_{timestamp}.md"
+        chunks_file = f"chunking_results/{company}_chunks_{timestamp}.md"
+        store_file = chunk_store_path(namespace, filing_key(company, metadata))
         
-        chunks = process_and_save_chunks(markdown_content, chunks_file)
+        chunks = process_and_save_chunks(markdown_content, chunks_file, store_file=store_file,
+                                         store_header={"filing": filing_key(company, metadata)})
         if not chunks:
-            print("Failed to process chunks. Pipeline stopped.")
-            return False
-            
+            print("Failed to process chunks.")
+            return None
         print(f"Successfully processed {len(chunks)} chunks")
-        
-        # Step 4: Embed and Index
+        return store_file
+    
+    def facts(company: str, metadata: Dict[str, str], store_file: str):
+        # Table facts answer factual questions without a vector search
+        filing = filing_key(company, metadata)
+        with ChunkStore(store_file) as store:
+            fact_count = write_filing_facts(store, namespace, filing)
+        print(f"Extracted {fact_count} table facts into: {fact_store_dir(namespace)}")
+        return {"namespace": namespace, "filing": filing, "facts": fact_count}
+    
+    def facts_stored(record: Dict[str, Any]) -> bool:
+        return filing_fact_count(record["namespace"], record["filing"]) == record["facts"]
+    
+    def index(metadata: Dict[str, str], store_file: str):
         print("\n=== STEP 4: Embedding and Indexing ===")
-        embed_and_upsert(
-            text_content=markdown_content,
+        indexed = embed_and_upsert(
+            text_content=None,
             metadata=metadata,
             api_key=pinecone_api_key,
             save_chunks=True,
-            namespace=namespace  # Add company-specific namespace
+            namespace=namespace,  # Add company-specific namespace
+            chunk_store=store_file  # Reuse the chunks from step 3
         )
+        return {"namespace": namespace, "chunk_store": store_file} if indexed else None
+    
+    stages = [
+        ArtifactStage("search", ("company",), "search_metadata", search, cache=False),
+        ArtifactStage("download", ("search_metadata",), "pdf", download),
+        ArtifactStage("parse", ("pdf",), "markdown", parse, config={"parser": "llama-parse", "result_type": "markdown"}),
+        ArtifactStage("chunk", ("company", "search_metadata", "markdown"), "chunks", chunk,
+                      config={"namespace": namespace, "max_tokens": DEFAULT_MAX_CHUNK_SIZE,
+                              "min_tokens": DEFAULT_MIN_CHUNK_SIZE, "tokenizer": get_tokenizer().name,
+                              "chunk_store_version": CHUNK_STORE_VERSION, "chunker": CHUNKER_FINGERPRINT,
+                              "chunk_store": source_fingerprint("chunk_store", "table_compaction", "chunk_features")}),
+        ArtifactStage("facts", ("company", "search_metadata", "chunks"), "facts", facts,
+                      config={"namespace": namespace, "fact_store_version": FACT_STORE_VERSION,
+                              "fact_store": source_fingerprint("fact_store", "table_compaction")}, check=facts_stored),
+        # Not cached: the namespace can change outside the pipeline, and indexing skips what it already has
+        ArtifactStage("index", ("search_metadata", "chunks"), "index_record", index, cache=False,
+                      config={"namespace": namespace, "model": EMBEDDING_MODEL,
+                              "index": os.getenv("PINECONE_INDEX_NAME", "financialdocs")})
+    ]
+    
+    try:
+        artifacts, timings = run_artifact_stages(stages, {"company": make_artifact("company", company_name)},
+                                                 force=force)
+        print()
+        print_stage_timings(timings)
+        if artifacts is None:
+            return False
         
         print("\n=== Pipeline completed successfully! ===")
-        print(f"- PDF saved to: {pdf_path}")
-        print(f"- Markdown saved to: {markdown_path}")
-        print(f"- Chunks saved to: {chunks_file}")
+        print(f"- PDF saved to: {artifacts['pdf'].path}")
+        print(f"- Markdown saved to: {artifacts['markdown'].path}")
+        print(f"- Chunk store: {artifacts['chunks'].path}")
+        print(f"- Fact store: {fact_store_dir(namespace)}")
         print(f"- Data indexed in Pinecone namespace: {namespace}")
         
         return True
@@ -157,8 +209,16 @@ def main():
     """Run the pipeline with command line arguments or prompt."""
     import sys
     
-    if len(sys.argv) > 1:
-        company_name = sys.argv[1]
+    # Usage: python import_pipeline.py [company_name] [--force all|stage[,stage]]
+    args = sys.argv[1:]
+    force = []
+    if "--force" in args:
+        idx = args.index("--force")
+        force = args[idx + 1].split(",") if idx + 1 < len(args) else ["all"]
+        del args[idx:idx + 2]
+    
+    if args:
+        company_name = args[0]
     else:
         company_name = input("Enter company name (e.g., NVIDIA, Apple, Microsoft): ").strip()
     
@@ -166,7 +226,7 @@ def main():
         print("Company name cannot be empty")
         return
         
-    success = run_pipeline(company_name)
+    success = run_pipeline(company_name, force)
     if not success:
         print("\nPipeline failed. Check the error messages above.")
     
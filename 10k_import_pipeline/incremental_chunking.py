@@ -0,0 +1,284 @@
+import os
+import sys
+import json
+import hashlib
+from bisect import bisect_right
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+from import_2_chunking import (
+    DEFAULT_MAX_CHUNK_SIZE,
+    DEFAULT_MIN_CHUNK_SIZE,
+    Chunk,
+    LabelTable,
+    SourceBuffer,
+    iter_content_lines,
+    iter_item_sections,
+    iter_post_processed_chunks,
+    iter_section_chunks,
+    iter_text_lines,
+    iter_window_fitted_chunks,
+    slice_pieces
+)
+from token_counting import Tokenizer, EMBEDDING_TOKEN_BUDGET, get_tokenizer
+from chunk_store import chunk_id
+
+# Default location of the per-section chunk cache and per-filing manifests
+CHUNK_CACHE_DIR = "chunk_cache"
+
+def source_fingerprint(*module_names: str) -> str:
+    """Hash of the chunker's source files, so cached sections are invalidated by any code change."""
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module_name in module_names:
+        with open(os.path.join(directory, f"{module_name}.py"), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+CHUNKER_FINGERPRINT = source_fingerprint("import_2_chunking", "token_counting")
+
+def section_hash(chunks: List[Chunk], settings: str) -> str:
+    """
+    Hash of an Item section: the heading, subheading and text of its subheading chunks
+    (TOC entries already stripped) and the chunker settings. Post-processing is a pure
+    function of these, so equal hashes mean equal chunk output.
+    """
+    digest = hashlib.sha256()
+    digest.update(settings.encode("utf-8"))
+    for chunk in chunks:
+        for value in (chunk.heading, chunk.subheading, chunk.text):
+            digest.update(b"\0" if value is None else value.encode("utf-8") + b"\1")
+    return digest.hexdigest()
+
+class ChunkCache:
+    """
+    On-disk cache of chunker output per Item section hash, plus one manifest per filing
+    listing its section hashes and chunk IDs from the last run. Cached chunks store their
+    pieces relative to the section's input chunks, so they can be re-attached to the same
+    section at a different position in a re-parsed document.
+    """
+
+    def __init__(self, cache_dir: str = CHUNK_CACHE_DIR):
+        self.sections_dir = os.path.join(cache_dir, "sections")
+        self.manifests_dir = os.path.join(cache_dir, "manifests")
+        os.makedirs(self.sections_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+
+    def get_section(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Cached chunk records of a section, or None if the section has not been chunked."""
+        path = os.path.join(self.sections_dir, f"{key}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def put_section(self, key: str, records: List[Dict[str, Any]]):
+        """Store the chunk records of a section."""
+        path = os.path.join(self.sections_dir, f"{key}.json")
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(records, f)
+        os.replace(temp_path, path)
+
+    def manifest_path(self, filing_key: str) -> str:
+        safe_key = "".join(c if c.isalnum() or c in "-_." else "_" for c in filing_key)
+        return os.path.join(self.manifests_dir, f"{safe_key}.json")
+
+    def get_manifest(self, filing_key: str) -> Optional[Dict[str, Any]]:
+        """The manifest of the last run for a filing, or None for a new filing."""
+        path = self.manifest_path(filing_key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def put_manifest(self, filing_key: str, manifest: Dict[str, Any]):
+        """Replace the manifest of a filing."""
+        path = self.manifest_path(filing_key)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, path)
+
+def section_layout(section: List[Chunk]) -> List[Tuple[int, int, int, int]]:
+    """
+    Document ranges of the pieces of a section's input chunks, as sorted
+    (start, end, chunk index, position in the chunk's text) tuples. Merging extends input
+    chunks in place, so the layout has to be taken before the section is post-processed.
+    """
+    layout = []
+    for index, source in enumerate(section):
+        position = 0
+        for buffer, start, end in source.pieces:
+            if buffer.offset is not None:
+                layout.append((buffer.offset + start, buffer.offset + end, index, position))
+            position += end - start
+    layout.sort()
+    return layout
+
+def chunk_to_record(chunk: Chunk, layout: List[Tuple[int, int, int, int]]) -> Dict[str, Any]:
+    """
+    Serialize a post-processed chunk for the section cache. Text taken from the document is
+    stored as [index, start, end]: a range of the text of the section's input chunk at
+    index (see section_layout). Separators and other text are stored as strings. Document
+    positions are not stored, so the record stays valid if the section moves.
+    """
+    starts = [entry[0] for entry in layout]
+
+    pieces = []
+    for buffer, start, end in chunk.pieces:
+        if buffer.offset is None:
+            pieces.append(buffer.text[start:end])
+            continue
+        document_start = buffer.offset + start
+        document_end = buffer.offset + end
+        covered = document_start
+        # A piece can span several input pieces when it was coalesced across a separator
+        for range_start, range_end, index, position in layout[max(bisect_right(starts, document_start) - 1, 0):]:
+            if range_start >= document_end:
+                break
+            if range_end <= document_start:
+                continue
+            if range_start > covered:
+                pieces.append(buffer.text[covered - buffer.offset:range_start - buffer.offset])
+                covered = range_start
+            piece_end = min(range_end, document_end)
+            pieces.append([index, position + covered - range_start, position + piece_end - range_start])
+            covered = piece_end
+        if covered < document_end:
+            pieces.append(buffer.text[covered - buffer.offset:end])
+    return {"heading": chunk.heading, "subheading": chunk.subheading, "pieces": pieces}
+
+def chunk_from_record(record: Dict[str, Any], section: List[Chunk], labels: LabelTable) -> Chunk:
+    """Rebuild a cached chunk on top of the current section's input chunks."""
+    pieces = []
+    for piece in record["pieces"]:
+        if isinstance(piece, str):
+            pieces.append((SourceBuffer(piece), 0, len(piece)))
+        else:
+            index, start, end = piece
+            pieces.extend(slice_pieces(section[index].pieces, start, end))
+    return Chunk(labels, labels.intern(record["heading"]), labels.intern(record["subheading"]), pieces)
+
+def chunk_incrementally(text: str, filing_key: str, cache_dir: str = CHUNK_CACHE_DIR,
+                        max_tokens: int = DEFAULT_MAX_CHUNK_SIZE, tokenizer: Optional[Tokenizer] = None,
+                        window_tokens: int = EMBEDDING_TOKEN_BUDGET,
+                        min_tokens: int = DEFAULT_MIN_CHUNK_SIZE) -> Tuple[List[Chunk], Dict[str, Any]]:
+    """
+    Chunk a filing, reusing cached output for every Item section whose content (after TOC
+    stripping) and chunker settings are unchanged. Only the split into subheading chunks
+    runs over the whole document; the expensive post-processing (splitting, merging,
+    window fitting) only runs for changed sections. Gives the same chunks as iter_text_chunks
+    with the same settings.
+
+    Returns the chunks and a diff against the last committed run for filing_key:
+        added:    chunk records (id, heading, subheading, text) that are new
+        removed:  IDs of chunks from the last run that no longer exist
+        manifest: the filing's manifest for this run
+    A filing seen for the first time has every chunk in added. The manifest is only
+    replaced by commit_manifest, once the diff has been applied (e.g. to the index), so
+    a failed apply gives the same diff again on the next run.
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    settings = f"{CHUNKER_FINGERPRINT}|{max_tokens}|{min_tokens}|{window_tokens}|{tokenizer.name}"
+    cache = ChunkCache(cache_dir)
+    labels = LabelTable()
+    document = SourceBuffer(text, 0)
+
+    chunks = []
+    section_keys = []
+    reused = 0
+    sections = iter_section_chunks(iter_content_lines(iter_text_lines(text)), labels, document)
+    for section in iter_item_sections(sections):
+        key = section_hash(section, settings)
+        section_keys.append(key)
+
+        records = cache.get_section(key)
+        if records is not None:
+            reused += 1
+            chunks.extend(chunk_from_record(record, section, labels) for record in records)
+            continue
+
+        layout = section_layout(section)
+        section_chunks = list(iter_window_fitted_chunks(
+            iter_post_processed_chunks(iter(section), max_tokens, min_tokens), tokenizer, window_tokens))
+        cache.put_section(key, [chunk_to_record(chunk, layout) for chunk in section_chunks])
+        chunks.extend(section_chunks)
+
+    ids = [chunk_id(chunk) for chunk in chunks]
+    previous = cache.get_manifest(filing_key)
+    previous_ids = set(previous["chunk_ids"]) if previous else set()
+    current_ids = set(ids)
+
+    added = []
+    seen = set()
+    for identifier, chunk in zip(ids, chunks):
+        if identifier not in previous_ids and identifier not in seen:
+            seen.add(identifier)
+            added.append({"id": identifier, "heading": chunk.heading, "subheading": chunk.subheading,
+                          "text": chunk.text})
+    removed = sorted(previous_ids - current_ids)
+
+    diff = {
+        "filing": filing_key,
+        "sections": len(section_keys),
+        "reused_sections": reused,
+        "rechunked_sections": len(section_keys) - reused,
+        "chunks": len(chunks),
+        "unchanged": len(current_ids & previous_ids),
+        "added": added,
+        "removed": removed,
+        "manifest": {
+            "filing": filing_key,
+            "updated": datetime.now().isoformat(timespec="seconds"),
+            "sections": section_keys,
+            "chunk_ids": ids
+        }
+    }
+    return chunks, diff
+
+def commit_manifest(diff: Dict[str, Any], cache_dir: str = CHUNK_CACHE_DIR):
+    """Record the run that produced diff as the filing's last run, once the diff has been applied."""
+    ChunkCache(cache_dir).put_manifest(diff["filing"], diff["manifest"])
+
+def print_diff_summary(diff: Dict[str, Any]):
+    """Print the section reuse and chunk diff counts of an incremental run."""
+    print(f"Sections: {diff['sections']} ({diff['reused_sections']} reused from cache, "
+          f"{diff['rechunked_sections']} re-chunked)")
+    print(f"Chunks: {diff['chunks']} ({diff['unchanged']} unchanged, {len(diff['added'])} added, "
+          f"{len(diff['removed'])} removed)")
+
+def main():
+    # Usage: python incremental_chunking.py <parsed_markdown_file> [--filing-key KEY] [--cache-dir DIR]
+    # Dry run: prints the diff against the last indexed run without committing the manifest
+    # (import_3_indexing.py --incremental commits it once the diff is applied)
+    args = sys.argv[1:]
+    if not args:
+        print("Usage: python incremental_chunking.py <parsed_markdown_file> [--filing-key KEY] [--cache-dir DIR]")
+        sys.exit(1)
+    cache_dir = CHUNK_CACHE_DIR
+    filing_key = None
+    if "--cache-dir" in args:
+        idx = args.index("--cache-dir")
+        cache_dir = args[idx + 1]
+        del args[idx:idx + 2]
+    if "--filing-key" in args:
+        idx = args.index("--filing-key")
+        filing_key = args[idx + 1]
+        del args[idx:idx + 2]
+    input_file = args[0]
+    filing_key = filing_key or os.path.splitext(os.path.basename(input_file))[0]
+
+    with open(input_file, "r", encoding="utf-8") as f:
+        text = f.read()
+    chunks, diff = chunk_incrementally(text, filing_key, cache_dir)
+    print_diff_summary(diff)
+
+    output_file = os.path.join("chunking_results", f"{filing_key}_diff.json")
+    os.makedirs("chunking_results", exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump({key: value for key, value in diff.items() if key != "manifest"}, f, indent=2)
+    print(f"Diff written to: {output_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import os
+import re
+import sys
+import sqlite3
+import hashlib
+from array import array
+from typing import List, Dict, Any, Optional, NamedTuple, Iterable
+
+# Persistent signature index shared by all filings and namespaces
+SIGNATURE_INDEX_PATH = os.getenv("SIGNATURE_INDEX_PATH", "signature_index.sqlite")
+
+# Estimated Jaccard similarity (of word 5-gram sets) above which a chunk reuses an existing vector
+DEDUPE_THRESHOLD = 0.9
+
+# Chunks with fewer words are always embedded; their shingle sets are too small to compare reliably
+MIN_DEDUPE_WORDS = 20
+
+SHINGLE_WORDS = 5
+# MinHash signature length, split into LSH bands. With 16 bands of 8 values a pair with
+# similarity 0.9 becomes a candidate with probability > 0.9999, one with 0.5 with about 0.06.
+SIGNATURE_SIZE = 128
+LSH_BANDS = 16
+LSH_ROWS = SIGNATURE_SIZE // LSH_BANDS
+
+MASK_64 = (1 << 64) - 1
+# Odd multipliers combining the word hashes of a shingle, and the final mixing constant
+SHINGLE_MULTIPLIERS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9,
+                       0xD6E8FEB86659FD93, 0xFF51AFD7ED558CCD)
+MIX_MULTIPLIER = 0xC4CEB9FE1A85EC53
+EMPTY_BIN = MASK_64
+# Bin values are below BIN_RANGE, so values shifted by densification never equal a real one
+BIN_RANGE = (MASK_64 + 1) // SIGNATURE_SIZE
+
+RE_WORDS = re.compile(r'\w+')
+
+# Word hashes are reused across chunks; filings share most of their vocabulary
+WORD_HASHES: Dict[str, int] = {}
+MAX_WORD_HASHES = 1_000_000
+
+def word_hash(word: str) -> int:
+    """Stable 64-bit hash of a word (Python's hash() is salted per process)."""
+    value = WORD_HASHES.get(word)
+    if value is None:
+        value = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+        if len(WORD_HASHES) < MAX_WORD_HASHES:
+            WORD_HASHES[word] = value
+    return value
+
+def minhash_signature(text: str) -> Optional[array]:
+    """
+    MinHash signature of the word 5-gram set of text, or None for texts shorter than
+    MIN_DEDUPE_WORDS. Uses one-permutation hashing: every shingle hash goes to one of
+    SIGNATURE_SIZE bins by its low bits and each bin keeps its minimum, so a signature
+    costs one hash per shingle instead of one per shingle and bin. Empty bins are filled
+    from the next non-empty bin (densification) so that signatures stay comparable.
+    """
+    words = RE_WORDS.findall(text.lower())
+    if len(words) < MIN_DEDUPE_WORDS:
+        return None
+    hashes = [word_hash(word) for word in words]
+
+    bins = [EMPTY_BIN] * SIGNATURE_SIZE
+    m0, m1, m2, m3, m4 = SHINGLE_MULTIPLIERS
+    for i in range(len(hashes) - SHINGLE_WORDS + 1):
+        value = (hashes[i] * m0 + hashes[i + 1] * m1 + hashes[i + 2] * m2 +
+                 hashes[i + 3] * m3 + hashes[i + 4] * m4) & MASK_64
+        value = ((value ^ (value >> 31)) * MIX_MULTIPLIER) & MASK_64
+        slot = value % SIGNATURE_SIZE
+        value //= SIGNATURE_SIZE
+        if value < bins[slot]:
+            bins[slot] = value
+
+    # Densification: an empty bin takes the value of the next non-empty bin, shifted by the distance
+    if EMPTY_BIN in bins:
+        original = bins[:]
+        for slot in range(SIGNATURE_SIZE):
+            if original[slot] == EMPTY_BIN:
+                for distance in range(1, SIGNATURE_SIZE):
+                    value = original[(slot + distance) % SIGNATURE_SIZE]
+                    if value != EMPTY_BIN:
+                        bins[slot] = value + distance * BIN_RANGE
+                        break
+    return array('Q', bins)
+
+def signature_similarity(first: array, second: array) -> float:
+    """Estimated Jaccard similarity: the fraction of equal signature values."""
+    return sum(1 for a, b in zip(first, second) if a == b) / SIGNATURE_SIZE
+
+def band_keys(signature: array) -> List[int]:
+    """LSH bucket of each band of a signature."""
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(rows.tobytes(), digest_size=8).digest()
+        # SQLite integers are signed 64-bit
+        keys.append(int.from_bytes(digest, "little", signed=True))
+    return keys
+
+class DuplicateMatch(NamedTuple):
+    """An indexed vector that a chunk is a near-duplicate of."""
+    vector_id: str
+    namespace: str
+    similarity: float
+
+class SignatureIndex:
+    """
+    Persistent MinHash/LSH index (SQLite) of the chunks that have been embedded, across all
+    filings and namespaces. find() returns the most similar indexed vector above the
+    threshold; add() records a newly embedded vector. Additions are only visible to other
+    processes after commit(), so callers can roll back when the upsert fails.
+    """
+
+    def __init__(self, path: str = SIGNATURE_INDEX_PATH, threshold: float = DEDUPE_THRESHOLD):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.threshold = threshold
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS signatures (
+                vector_id TEXT NOT NULL,
+                namespace TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                PRIMARY KEY (namespace, vector_id)
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                signature_row INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS bands_bucket ON bands (band, bucket);
+        """)
+
+    def find(self, signature: array) -> Optional[DuplicateMatch]:
+        """Most similar indexed vector with similarity >= threshold, or None."""
+        rows = set()
+        for band, bucket in enumerate(band_keys(signature)):
+            rows.update(row for (row,) in self.connection.execute(
+                "SELECT signature_row FROM bands WHERE band = ? AND bucket = ?", (band, bucket)))
+        best = None
+        for row in rows:
+            record = self.connection.execute(
+                "SELECT vector_id, namespace, signature FROM signatures WHERE rowid = ?", (row,)).fetchone()
+            if record is None:
+                continue
+            candidate = array('Q')
+            candidate.frombytes(record[2])
+            similarity = signature_similarity(signature, candidate)
+            if similarity >= self.threshold and (best is None or similarity > best.similarity):
+                best = DuplicateMatch(record[0], record[1], similarity)
+        return best
+
+    def add(self, vector_id: str, namespace: str, signature: array):
+        """Index the signature of an embedded vector (replacing an earlier one with the same ID)."""
+        self.remove(vector_id, namespace)
+        cursor = self.connection.execute(
+            "INSERT INTO signatures (vector_id, namespace, signature) VALUES (?, ?, ?)",
+            (vector_id, namespace, signature.tobytes()))
+        row = cursor.lastrowid
+        self.connection.executemany(
+            "INSERT INTO bands (band, bucket, signature_row) VALUES (?, ?, ?)",
+            [(band, bucket, row) for band, bucket in enumerate(band_keys(signature))])
+
+    def remove(self, vector_id: str, namespace: str):
+        """Drop a vector from the index, e.g. when it is deleted from Pinecone."""
+        record = self.connection.execute(
+            "SELECT rowid FROM signatures WHERE namespace = ? AND vector_id = ?", (namespace, vector_id)).fetchone()
+        if record is not None:
+            self.connection.execute("DELETE FROM bands WHERE signature_row = ?", (record[0],))
+            self.connection.execute("DELETE FROM signatures WHERE rowid = ?", (record[0],))
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def close(self):
+        self.connection.close()
+
+def dedupe_report(chunks: int, duplicates: int, reused: int) -> Dict[str, Any]:
+    """Near-duplicate counts of one filing."""
+    return {
+        "chunks": chunks,
+        "near_duplicates": duplicates,
+        "reused_vectors": reused,
+        "dedupe_ratio": duplicates / chunks if chunks else 0.0
+    }
+
+def print_dedupe_report(report: Dict[str, Any]):
+    """Print a report produced by dedupe_report."""
+    print(f"Near-duplicates: {report['near_duplicates']} of {report['chunks']} chunks "
+          f"({report['dedupe_ratio']:.1%}), {report['reused_vectors']} reused existing vectors")
+
+def find_duplicates(chunks: Iterable[Dict[str, Any]], index: SignatureIndex) -> List[Optional[DuplicateMatch]]:
+    """Match of each chunk against the index (None for chunks that need embedding)."""
+    matches = []
+    for chunk in chunks:
+        signature = minhash_signature(chunk["text"])
+        matches.append(index.find(signature) if signature is not None else None)
+    return matches
+
+def main():
+    # Usage: python near_duplicates.py <chunk_store.jsonl> [--index PATH]
+    # Dry run: reports how many chunks of a filing would reuse an indexed vector.
+    from chunk_store import ChunkStore
+
+    args = sys.argv[1:]
+    if not args:
+        print("Usage: python near_duplicates.py <chunk_store.jsonl> [--index PATH]")
+        sys.exit(1)
+    path = SIGNATURE_INDEX_PATH
+    if "--index" in args:
+        idx = args.index("--index")
+        path = args[idx + 1]
+        del args[idx:idx + 2]
+
+    index = SignatureIndex(path)
+    with ChunkStore(args[0]) as store:
+        matches = find_duplicates(store, index)
+    duplicates = sum(1 for match in matches if match is not None)
+    print(f"Signature index: {path} ({len(index)} vectors)")
+    print_dedupe_report(dedupe_report(len(matches), duplicates, duplicates))
+    index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import hashlib
+from typing import List, Dict, Any, Optional, Callable, Iterable, NamedTuple, Tuple
+
+# Stage manifests of earlier runs, one directory per stage
+ARTIFACT_DIR = os.getenv("PIPELINE_ARTIFACT_DIR", "pipeline_artifacts")
+
+# Artifact kinds passed between import pipeline stages: "file" artifacts are files a stage
+# wrote, "value" artifacts JSON values (kept in the stage manifest)
+ARTIFACT_KINDS = {
+    "company": "value",
+    "search_metadata": "value",
+    "pdf": "file",
+    "markdown": "file",
+    "chunks": "file",
+    "facts": "value",
+    "index_record": "value"
+}
+
+class Artifact(NamedTuple):
+    """Output of a stage: its kind, content hash, and the file path or JSON value."""
+    kind: str
+    key: str
+    path: Optional[str] = None
+    value: Any = None
+
+class ArtifactStage(NamedTuple):
+    """
+    A pipeline stage: function takes the artifacts of the input kinds (in order) and
+    returns the path (file kinds) or value (value kinds) of its output, or None if it
+    failed. The stage's config and version are part of its cache key; bump version when
+    its code changes what it produces. Stages with cache False always run (e.g. a search
+    whose result changes over time); the stages after them still skip when its output
+    has the same content. A value output that stands for state kept elsewhere (e.g. a
+    store outside the artifact directory) can have a check, called with the output of
+    an earlier run: the stage runs again if it returns False.
+    """
+    name: str
+    inputs: Tuple[str, ...]
+    output: str
+    function: Callable[..., Any]
+    config: Dict[str, Any] = {}
+    version: int = 1
+    cache: bool = True
+    check: Optional[Callable[[Any], bool]] = None
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def value_sha256(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def make_artifact(kind: str, result: Any) -> Artifact:
+    """Artifact of a stage result, keyed by its content; raises TypeError if it does not match the kind."""
+    if kind not in ARTIFACT_KINDS:
+        raise TypeError(f"Unknown artifact kind '{kind}'. Available: {', '.join(ARTIFACT_KINDS)}")
+    if ARTIFACT_KINDS[kind] == "file":
+        if not isinstance(result, str) or not os.path.isfile(result):
+            raise TypeError(f"{kind} artifact must be the path of an existing file, got {result!r}")
+        return Artifact(kind, file_sha256(result), path=result)
+    try:
+        return Artifact(kind, value_sha256(result), value=result)
+    except TypeError:
+        raise TypeError(f"{kind} artifact must be a JSON value, got {type(result).__name__}")
+
+def stage_key(stage: ArtifactStage, inputs: List[Artifact]) -> str:
+    """Cache key of a stage run: the stage, its version and config, and the content of its inputs."""
+    return value_sha256({"stage": stage.name, "version": stage.version, "config": stage.config,
+                         "inputs": [artifact.key for artifact in inputs]})
+
+def manifest_path(stage: ArtifactStage, key: str, artifact_dir: str = ARTIFACT_DIR) -> str:
+    return os.path.join(artifact_dir, stage.name, f"{key}.json")
+
+def load_output(stage: ArtifactStage, key: str, artifact_dir: str = ARTIFACT_DIR) -> Optional[Artifact]:
+    """Output artifact of an earlier run of the stage with the same key, if it still exists unchanged."""
+    path = manifest_path(stage, key, artifact_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        output = json.load(f)["output"]
+    artifact = Artifact(output["kind"], output["key"], output.get("path"), output.get("value"))
+    if artifact.kind != stage.output:
+        return None
+    if artifact.path is not None and (not os.path.isfile(artifact.path) or file_sha256(artifact.path) != artifact.key):
+        return None
+    return artifact
+
+def save_output(stage: ArtifactStage, key: str, inputs: List[Artifact], artifact: Artifact,
+                seconds: float, artifact_dir: str = ARTIFACT_DIR):
+    path = manifest_path(stage, key, artifact_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    manifest = {
+        "stage": stage.name,
+        "version": stage.version,
+        "config": stage.config,
+        "inputs": {artifact.kind: artifact.key for artifact in inputs},
+        "output": artifact._asdict(),
+        "seconds": seconds
+    }
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(temporary_path, path)
+
+def run_artifact_stages(stages: Iterable[ArtifactStage], artifacts: Dict[str, Artifact],
+                        artifact_dir: str = ARTIFACT_DIR, force: Iterable[str] = ()) -> Tuple[Optional[Dict[str, Artifact]], List[Dict[str, Any]]]:
+    """
+    Run stages in order, each on artifacts produced before it (artifacts holds the initial
+    ones, e.g. the company). A stage is skipped when an earlier run with the same inputs,
+    config and version left its output, and that output is unchanged; stages named in
+    force (or all, for "all") run anyway. Returns the artifacts by kind, or None if a
+    stage failed (returned None or raised), and the timing of every stage that was reached.
+    """
+    artifacts = dict(artifacts)
+    force = set(force)
+    timings = []
+    for stage in stages:
+        missing = [kind for kind in stage.inputs if kind not in artifacts]
+        if missing:
+            raise TypeError(f"Stage {stage.name} needs {', '.join(missing)}, which no earlier stage produces")
+        inputs = [artifacts[kind] for kind in stage.inputs]
+        key = stage_key(stage, inputs)
+        start = time.perf_counter()
+        artifact = None
+        if stage.cache and stage.name not in force and "all" not in force:
+            artifact = load_output(stage, key, artifact_dir)
+            if artifact is not None and stage.check is not None and not stage.check(
+                    artifact.value if artifact.path is None else artifact.path):
+                print(f"Stage {stage.name}: {stage.output} of an earlier run no longer exists, running again")
+                artifact = None
+        skipped = artifact is not None
+        if not skipped:
+            try:
+                result = stage.function(*[item.value if item.path is None else item.path for item in inputs])
+            except Exception as e:
+                print(f"Error in stage {stage.name}: {str(e)}")
+                result = None
+            if result is None or result == "":
+                timings.append({"stage": stage.name, "skipped": False, "failed": True,
+                                "seconds": time.perf_counter() - start})
+                print(f"Stage {stage.name} produced no {stage.output}. Pipeline stopped.")
+                return None, timings
+            artifact = make_artifact(stage.output, result)
+            save_output(stage, key, inputs, artifact, time.perf_counter() - start, artifact_dir)
+        timings.append({"stage": stage.name, "skipped": skipped, "failed": False, "seconds": time.perf_counter() - start,
+                        "output": stage.output, "key": artifact.key})
+        artifacts[stage.output] = artifact
+        if skipped:
+            print(f"Stage {stage.name}: {stage.output} unchanged since an earlier run ({artifact.key[:12]}), skipped")
+    return artifacts, timings
+
+def print_stage_timings(timings: List[Dict[str, Any]]):
+    """Print the timings returned by run_artifact_stages."""
+    total = sum(timing["seconds"] for timing in timings)
+    print(f"Stage timings ({total:.1f}s total):")
+    for timing in timings:
+        status = "failed" if timing["failed"] else "skipped" if timing["skipped"] else "ran"
+        share = timing["seconds"] / total if total else 0.0
+        print(f"  {timing['stage']:<10} {status:<8} {timing['seconds']:>8.2f}s {share:>5.0%}")
@@ -0,0 +1,154 @@
+import time
+import queue
+import threading
+from typing import List, Dict, Any, Optional, Iterable, Callable
+
+# Items that may wait in a stage's input queue, per worker of the stage. A full queue blocks
+# the stage before it (backpressure), so memory is bounded by the queue sizes.
+STAGE_QUEUE_SIZE = 2
+
+# How often blocked workers check whether the pipeline was stopped by an error (seconds)
+STOP_POLL_INTERVAL = 0.1
+
+# End-of-input marker put into a stage's queue once per worker
+END_OF_INPUT = object()
+
+class Stage:
+    """
+    One stage of a pipeline: workers threads take items from a bounded input queue and
+    call function on each; the items it returns (an iterable, or None for none) go to the
+    next stage. Counts items, busy time, queue depth (sampled as items are queued) and the
+    time the previous stage spent blocked on this stage's full queue.
+    """
+
+    def __init__(self, name: str, function: Callable[[Any], Optional[Iterable[Any]]],
+                 workers: int = 1, queue_size: Optional[int] = None):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=queue_size or STAGE_QUEUE_SIZE * self.workers)
+        self.lock = threading.Lock()
+        self.items = 0
+        self.outputs = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.max_queue_depth = 0
+        self.queue_depth_total = 0
+
+    def put(self, item: Any, stop: threading.Event) -> bool:
+        """Queue an item, waiting while the queue is full. False if the pipeline was stopped."""
+        start = time.perf_counter()
+        while not stop.is_set():
+            try:
+                self.queue.put(item, timeout=STOP_POLL_INTERVAL)
+                break
+            except queue.Full:
+                continue
+        else:
+            return False
+        if item is not END_OF_INPUT:
+            depth = self.queue.qsize()
+            with self.lock:
+                self.blocked_seconds += time.perf_counter() - start
+                self.max_queue_depth = max(self.max_queue_depth, depth)
+                self.queue_depth_total += depth
+        return True
+
+    def get(self, stop: threading.Event) -> Any:
+        """Next item, END_OF_INPUT at the end, or None if the pipeline was stopped."""
+        while not stop.is_set():
+            try:
+                return self.queue.get(timeout=STOP_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return None
+
+    def record(self, seconds: float, outputs: int):
+        with self.lock:
+            self.items += 1
+            self.outputs += outputs
+            self.busy_seconds += seconds
+
+def run_stages(source: Iterable[Any], stages: List[Stage]) -> float:
+    """
+    Run items from source through stages, all stages at once: source is iterated in the
+    calling thread (so it can use objects bound to that thread, like a SQLite connection)
+    and feeds the first stage. The first exception of any stage stops the pipeline and is
+    raised here. Returns the wall-clock seconds.
+    """
+    stop = threading.Event()
+    errors = []
+
+    def work(position: int):
+        stage = stages[position]
+        following = stages[position + 1] if position + 1 < len(stages) else None
+        while True:
+            item = stage.get(stop)
+            if item is None or item is END_OF_INPUT:
+                return
+            start = time.perf_counter()
+            try:
+                outputs = list(stage.function(item) or [])
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+                return
+            stage.record(time.perf_counter() - start, len(outputs))
+            if following is not None:
+                for output in outputs:
+                    if not following.put(output, stop):
+                        return
+
+    threads = [[threading.Thread(target=work, args=(position,), name=f"{stage.name}-{worker}", daemon=True)
+                for worker in range(stage.workers)] for position, stage in enumerate(stages)]
+    for stage_threads in threads:
+        for thread in stage_threads:
+            thread.start()
+
+    start = time.perf_counter()
+    try:
+        for item in source:
+            if not stages[0].put(item, stop):
+                break
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        # Stages finish in order: a stage gets its end markers once the stage before it is done
+        for stage, stage_threads in zip(stages, threads):
+            if not stop.is_set():
+                for _ in stage_threads:
+                    stage.put(END_OF_INPUT, stop)
+            for thread in stage_threads:
+                thread.join()
+    if errors:
+        raise errors[0]
+    return time.perf_counter() - start
+
+def stage_report(stages: List[Stage], seconds: float) -> Dict[str, Any]:
+    """Per-stage counters of one pipeline run: throughput, worker utilization, queue depth and backpressure."""
+    report = {"seconds": seconds, "stages": []}
+    for stage in stages:
+        report["stages"].append({
+            "stage": stage.name,
+            "workers": stage.workers,
+            "items": stage.items,
+            "outputs": stage.outputs,
+            "items_per_second": stage.items / seconds if seconds else 0.0,
+            "busy_seconds": stage.busy_seconds,
+            "utilization": stage.busy_seconds / (seconds * stage.workers) if seconds else 0.0,
+            "queue_size": stage.queue.maxsize,
+            "max_queue_depth": stage.max_queue_depth,
+            "mean_queue_depth": stage.queue_depth_total / stage.items if stage.items else 0.0,
+            "blocked_seconds": stage.blocked_seconds
+        })
+    return report
+
+def print_stage_report(report: Dict[str, Any]):
+    """Print a report produced by stage_report."""
+    print(f"Pipeline: {report['seconds']:.1f}s")
+    for stage in report["stages"]:
+        print(f"  {stage['stage']:<8} {stage['workers']} workers  {stage['items']:>6} items  "
+              f"{stage['items_per_second']:>8.1f} items/s  busy {stage['utilization']:>4.0%}  "
+              f"queue {stage['mean_queue_depth']:.1f}/{stage['queue_size']} (max {stage['max_queue_depth']})  "
+              f"waited for it {stage['blocked_seconds']:.1f}s")
@@ -0,0 +1,207 @@
+import io
+import re
+import csv
+import sys
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+from token_counting import Tokenizer, get_report_tokenizer
+
+# Delimiter of compact table rows. Cells containing it are quoted (csv quoting rules)
+COMPACT_DELIMITER = ";"
+
+# Separator row cells under a markdown table header, e.g. ---, :---:, ---:
+RE_SEPARATOR_CELL = re.compile(r':?-+:?')
+
+# A number that LlamaParse padded with spaces, e.g. "$ 1,234", "( 12.5 )", "7 %"
+RE_SPACED_AMOUNT = re.compile(r'[$€£¥]?\s*\(?\s*[$€£¥]?\s*-?\s*\d[\d,.]*\s*\)?\s*%?')
+
+# Cells that only hold a currency symbol (belongs to the next value) or a closing
+# parenthesis or percent sign (belongs to the previous value)
+CURRENCY_CELLS = {"$", "€", "£", "¥"}
+SUFFIX_CELLS = {"%", ")", ")%", "%)"}
+
+def is_table_line(line: str) -> bool:
+    """Whether a line belongs to a markdown table (starts with '|', like the chunker's LINE_TABLE_ROW)."""
+    return line.lstrip().startswith('|')
+
+def split_row(line: str) -> List[str]:
+    """Stripped cells of a markdown table row. Only one outer pipe is removed on each side."""
+    line = line.strip()
+    if line.startswith('|'):
+        line = line[1:]
+    if line.endswith('|'):
+        line = line[:-1]
+    return [cell.strip() for cell in line.split('|')]
+
+def is_separator_row(cells: List[str]) -> bool:
+    return any(cells) and all(RE_SEPARATOR_CELL.fullmatch(cell) for cell in cells if cell)
+
+def join_value_cells(cells: List[str]) -> List[str]:
+    """
+    Attach currency symbol cells to the value after them and ")" / "%" cells to the value
+    before them, and remove the padding inside numbers. A moved symbol leaves an empty cell,
+    so the other values keep their column.
+    """
+    cells = list(cells)
+    for i, cell in enumerate(cells):
+        if cell in CURRENCY_CELLS:
+            following = next((j for j in range(i + 1, len(cells)) if cells[j]), None)
+            if following is not None and cells[following][0] in "0123456789(-":
+                cells[following] = cell + cells[following]
+                cells[i] = ""
+        elif cell in SUFFIX_CELLS:
+            previous = next((j for j in range(i - 1, -1, -1) if cells[j]), None)
+            if previous is not None:
+                cells[previous] = cells[previous] + cell
+                cells[i] = ""
+    return ["".join(cell.split()) if RE_SPACED_AMOUNT.fullmatch(cell) else cell for cell in cells]
+
+def compact_table(lines: List[str]) -> str:
+    """
+    Rewrite one markdown table (consecutive table lines) as compact delimited rows:
+    no outer pipes, padding or separator rows, currency symbols and percent signs joined
+    to their numbers, and empty rows dropped.
+
+    A table with a header (rows above the separator row) keeps its column positions:
+    the header rows are merged into one line of column titles, columns that are empty in
+    every row are dropped, and remaining empty cells stay as empty fields so every value
+    lines up with its title. LlamaParse layout grids (empty header, ragged rows whose
+    columns do not line up anyway) keep only the non-empty cells of each row, in order.
+    The text of every non-empty cell is kept.
+    """
+    rows = [split_row(line) for line in lines]
+    separator = next((i for i, cells in enumerate(rows) if is_separator_row(cells)), None)
+    header_rows = rows[:separator] if separator is not None else []
+    body_rows = [join_value_cells(cells) for cells in (rows[separator + 1:] if separator is not None else rows)]
+
+    width = max(len(cells) for cells in rows)
+    header = [" ".join(cells[column] for cells in header_rows if column < len(cells) and cells[column])
+              for column in range(width)]
+
+    output = []
+    if any(header):
+        used = [column for column in range(width)
+                if header[column] or any(column < len(cells) and cells[column] for cells in body_rows)]
+        output.append([header[column] for column in used])
+        for cells in body_rows:
+            if any(cells):
+                row = [cells[column] if column < len(cells) else "" for column in used]
+                while row and not row[-1]:
+                    row.pop()
+                output.append(row)
+    else:
+        output.extend([cell for cell in cells if cell] for cells in body_rows if any(cells))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=COMPACT_DELIMITER, lineterminator="\n")
+    writer.writerows(output)
+    return buffer.getvalue().rstrip("\n")
+
+def compact_tables(text: str) -> str:
+    """
+    Text with every markdown table rewritten by compact_table; all other lines are kept
+    as they are. Returns text itself when it has no table.
+    """
+    if '|' not in text:
+        return text
+    lines = text.split('\n')
+    output = []
+    table = []
+    changed = False
+    for line in lines + [""]:
+        if is_table_line(line):
+            table.append(line)
+            continue
+        if table:
+            compact = compact_table(table)
+            if compact:
+                output.append(compact)
+            table = []
+            changed = True
+        output.append(line)
+    if not changed:
+        return text
+    return "\n".join(output[:-1])
+
+def compaction_report(token_pairs: Iterable[Tuple[int, int]], estimated: bool = False) -> Dict[str, Any]:
+    """
+    Token savings of table compaction for one filing, from the (original, compact) token
+    counts of each chunk. estimated marks counts that are not the model's own (see
+    token_counting.get_report_tokenizer): word estimates overstate the savings, since
+    compact rows have no spaces between their cells.
+    """
+    chunks = 0
+    compacted_chunks = 0
+    original_tokens = 0
+    compact_tokens = 0
+    for original, compact in token_pairs:
+        chunks += 1
+        original_tokens += original
+        compact_tokens += compact
+        if compact < original:
+            compacted_chunks += 1
+    saved_tokens = original_tokens - compact_tokens
+    return {
+        "chunks": chunks,
+        "compacted_chunks": compacted_chunks,
+        "original_tokens": original_tokens,
+        "compact_tokens": compact_tokens,
+        "saved_tokens": saved_tokens,
+        "saved_ratio": saved_tokens / original_tokens if original_tokens else 0.0,
+        "estimated": estimated
+    }
+
+def print_compaction_report(report: Dict[str, Any], tokenizer_name: str = ""):
+    """Print a report produced by compaction_report."""
+    source = f" ({tokenizer_name} tokenizer)" if tokenizer_name else ""
+    print(f"Table compaction{source}: {report['original_tokens']:,} -> {report['compact_tokens']:,} tokens, "
+          f"{report['saved_tokens']:,} saved ({report['saved_ratio']:.1%}) in "
+          f"{report['compacted_chunks']} of {report['chunks']} chunks")
+    if report.get("estimated"):
+        print("Token counts are word estimates, which overstate the savings of compact rows")
+
+def chunk_compaction_report(chunks: Iterable[Dict[str, Any]], tokenizer: Optional[Tokenizer] = None) -> Dict[str, Any]:
+    """
+    compaction_report of chunks, using the compact_text of chunk store records if present.
+    Counts with tokenizer, or the model's own tokenizer if it loads (see get_report_tokenizer).
+    """
+    tokenizer = tokenizer or get_report_tokenizer()
+    pairs = []
+    for chunk in chunks:
+        compact = chunk.get("compact_text") or compact_tables(chunk["text"])
+        pairs.append((tokenizer.count(chunk["text"]), tokenizer.count(compact)))
+    return compaction_report(pairs, estimated=not tokenizer.exact)
+
+def main():
+    # Usage: python table_compaction.py <chunk_store.jsonl|parsed_markdown_file> [--show N]
+    args = sys.argv[1:]
+    if not args:
+        print("Usage: python table_compaction.py <chunk_store.jsonl|parsed_markdown_file> [--show N]")
+        sys.exit(1)
+    show = 0
+    if "--show" in args:
+        idx = args.index("--show")
+        show = int(args[idx + 1])
+        del args[idx:idx + 2]
+
+    if args[0].endswith(".jsonl"):
+        from chunk_store import ChunkStore
+        with ChunkStore(args[0]) as store:
+            chunks = list(store)
+    else:
+        import contextlib
+        from import_2_chunking import iter_text_chunks
+        with open(args[0], "r", encoding="utf-8") as f:
+            text = f.read()
+        with contextlib.redirect_stdout(io.StringIO()):
+            chunks = [{"heading": chunk.heading, "subheading": chunk.subheading, "text": chunk.text}
+                      for chunk in iter_text_chunks(text)]
+
+    tokenizer = get_report_tokenizer()
+    print_compaction_report(chunk_compaction_report(chunks, tokenizer), tokenizer.name)
+    for chunk in [chunk for chunk in chunks if '|' in chunk["text"]][:show]:
+        print(f"\n--- {chunk['heading']} / {chunk['subheading']}")
+        print(chunk.get("compact_text") or compact_tables(chunk["text"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import os
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Iterable, Callable
+
+# Embedding model used by import_3_indexing and the retrieval modules
+EMBEDDING_MODEL = "multilingual-e5-large"
+EMBEDDING_TOKENIZER = "intfloat/multilingual-e5-large"
+# Local copy of the model's tokenizer.json, written once by `python token_counting.py --download`
+TOKENIZER_PATH = os.getenv("TOKENIZER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                          "models", "multilingual-e5-large", "tokenizer.json"))
+# Context window of the embedding model; longer inputs are cut off ("truncate": "END")
+EMBEDDING_MAX_TOKENS = 512
+# Budget chunks are fitted to, leaving headroom for the model's input prefix
+EMBEDDING_TOKEN_BUDGET = EMBEDDING_MAX_TOKENS - 8
+# Most inputs Pinecone Inference accepts in one embedding request for the model
+EMBEDDING_MAX_BATCH_SIZE = 96
+
+# Average tokens per whitespace-separated word for multilingual text
+TOKENS_PER_WORD = 1.3
+
+DEFAULT_TOKEN_CACHE_SIZE = 16384
+
+# Tokenizer chunks are fitted with unless CHUNK_TOKENIZER names another
+DEFAULT_TOKENIZER = "e5"
+
+class Tokenizer(ABC):
+    """
+    Counts tokens offline. Subclasses implement count_batch; counting many texts
+    at once lets tokenizers with a native batch API amortize the call overhead.
+    """
+    name = "base"
+    # True when counts are derived from whitespace word counts only (see TOKENS_PER_WORD),
+    # so callers that already know a text's word count can skip tokenizing it
+    word_based = False
+    # True when counts are the embedding model's own, not an estimate
+    exact = False
+
+    def count(self, text: str) -> int:
+        """Number of tokens in text."""
+        return self.count_batch([text])[0]
+
+    @abstractmethod
+    def count_batch(self, texts: List[str]) -> List[int]:
+        """Number of tokens in each of texts."""
+
+class WordEstimateTokenizer(Tokenizer):
+    """The chunker's historical estimate: 1.3 tokens per whitespace-separated word. No dependencies."""
+    name = "estimate"
+    word_based = True
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        return [int(len(text.split()) * TOKENS_PER_WORD) for text in texts]
+
+class HuggingFaceTokenizer(Tokenizer):
+    """
+    Exact token counts from the embedding model's own tokenizer, using the
+    `tokenizers` package and the local tokenizer.json at tokenizer_path (see
+    download_tokenizer), so counting never goes to the network. Counts include the
+    special tokens the model adds, since they take up room in the window too.
+    """
+    name = "e5"
+    exact = True
+
+    def __init__(self, tokenizer_path: str = TOKENIZER_PATH):
+        try:
+            from tokenizers import Tokenizer as FastTokenizer
+        except ImportError:
+            raise ImportError("Please install tokenizers via: pip install tokenizers")
+
+        if not os.path.isfile(tokenizer_path):
+            raise FileNotFoundError(f"No tokenizer at {tokenizer_path}. "
+                                    "Download it once via: python token_counting.py --download")
+        self.tokenizer = FastTokenizer.from_file(tokenizer_path)
+        # We want the full length, not the length after the model's truncation
+        self.tokenizer.no_truncation()
+        self.tokenizer.no_padding()
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        return [len(encoding.ids) for encoding in self.tokenizer.encode_batch(texts, add_special_tokens=True)]
+
+class CachedTokenizer(Tokenizer):
+    """
+    LRU cache in front of another tokenizer. A batch only sends the texts that are
+    not cached to the wrapped tokenizer, in a single call. The same chunk text is
+    typically counted by the chunker and again by the indexer, so the second
+    count is free. Entries are keyed by (length, hash) of the text so the cache
+    does not keep chunk texts alive.
+    """
+
+    def __init__(self, tokenizer: Tokenizer, maxsize: int = DEFAULT_TOKEN_CACHE_SIZE):
+        self.tokenizer = tokenizer
+        self.name = tokenizer.name
+        self.word_based = tokenizer.word_based
+        self.exact = tokenizer.exact
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        counts = [None] * len(texts)
+        missing = {}
+        for position, text in enumerate(texts):
+            key = (len(text), hash(text))
+            count = self.cache.get(key)
+            if count is None:
+                missing.setdefault(key, []).append(position)
+            else:
+                self.cache.move_to_end(key)
+                counts[position] = count
+        self.hits += len(texts) - sum(len(positions) for positions in missing.values())
+        self.misses += len(missing)
+
+        if missing:
+            new_texts = [texts[positions[0]] for positions in missing.values()]
+            for key, count in zip(missing, self.tokenizer.count_batch(new_texts)):
+                for position in missing[key]:
+                    counts[position] = count
+                self.cache[key] = count
+            while len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            "tokenizer": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self.cache)
+        }
+
+# Tokenizers selectable by name (CHUNK_TOKENIZER environment variable or get_tokenizer(name))
+TOKENIZER_FACTORIES: Dict[str, Callable[[], Tokenizer]] = {
+    "estimate": WordEstimateTokenizer,
+    "e5": HuggingFaceTokenizer
+}
+
+def download_tokenizer(path: str = TOKENIZER_PATH, model_name: str = EMBEDDING_TOKENIZER) -> str:
+    """Fetch the embedding model's tokenizer from the Hugging Face hub into path, for offline counting."""
+    try:
+        from tokenizers import Tokenizer as FastTokenizer
+    except ImportError:
+        raise ImportError("Please install tokenizers via: pip install tokenizers")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    FastTokenizer.from_pretrained(model_name).save(path)
+    load_tokenizer.cache_clear()
+    return path
+
+def register_tokenizer(name: str, factory: Callable[[], Tokenizer]):
+    """Make a tokenizer available to get_tokenizer under name."""
+    TOKENIZER_FACTORIES[name] = factory
+    load_tokenizer.cache_clear()
+
+@lru_cache(maxsize=None)
+def load_tokenizer(name: str) -> Tokenizer:
+    """
+    The shared, cached tokenizer registered under name. One that cannot be loaded (e.g.
+    tokenizers is not installed) is replaced by the word estimate, with a warning; the
+    fallback is cached too, so loading is attempted once per process.
+    """
+    if name not in TOKENIZER_FACTORIES:
+        raise ValueError(f"Unknown tokenizer '{name}'. Available: {', '.join(sorted(TOKENIZER_FACTORIES))}")
+    try:
+        return CachedTokenizer(TOKENIZER_FACTORIES[name]())
+    except Exception as e:
+        if name == "estimate":
+            raise
+        print(f"Warning: could not load the {name} tokenizer ({str(e)}); token counts are estimates "
+              f"({TOKENS_PER_WORD} tokens per word) and chunks may not fit the embedding window")
+        return load_tokenizer("estimate")
+
+def get_tokenizer(name: Optional[str] = None) -> Tokenizer:
+    """
+    Return the shared, cached tokenizer registered under name. Defaults to the
+    CHUNK_TOKENIZER environment variable, or the embedding model's own tokenizer
+    (falling back to the word estimate, see load_tokenizer).
+    """
+    return load_tokenizer(name or os.getenv("CHUNK_TOKENIZER", DEFAULT_TOKENIZER))
+
+def get_report_tokenizer(tokenizer: Optional[Tokenizer] = None) -> Tokenizer:
+    """
+    Tokenizer to count chunks with for truncation and compaction reports. Chunks are
+    fitted to the window with tokenizer (get_tokenizer() by default), so counting them
+    with the same estimate could never find truncation: unless it is exact, the
+    embedding model's own tokenizer is used if it loads, and otherwise the estimate,
+    whose counts callers report as estimated.
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    return tokenizer if tokenizer.exact else get_tokenizer("e5")
+
+def truncation_report(token_counts: Iterable[int], max_tokens: int = EMBEDDING_MAX_TOKENS,
+                      estimated: bool = False) -> Dict[str, Any]:
+    """
+    Summarize how much of the text sent for embedding is cut off by the model window.
+    wasted_tokens are the tokens past max_tokens that are paid for but never embedded.
+    estimated marks counts that are not the model's own (see get_report_tokenizer).
+    """
+    chunks = 0
+    total_tokens = 0
+    truncated_chunks = 0
+    wasted_tokens = 0
+    largest = 0
+    for count in token_counts:
+        chunks += 1
+        total_tokens += count
+        largest = max(largest, count)
+        if count > max_tokens:
+            truncated_chunks += 1
+            wasted_tokens += count - max_tokens
+    return {
+        "chunks": chunks,
+        "total_tokens": total_tokens,
+        "max_tokens": max_tokens,
+        "largest_chunk_tokens": largest,
+        "truncated_chunks": truncated_chunks,
+        "wasted_tokens": wasted_tokens,
+        "wasted_ratio": wasted_tokens / total_tokens if total_tokens else 0.0,
+        "estimated": estimated
+    }
+
+def print_truncation_report(report: Dict[str, Any], tokenizer_name: str = ""):
+    """Print a truncation report produced by truncation_report."""
+    source = f" ({tokenizer_name} tokenizer)" if tokenizer_name else ""
+    print(f"Tokens{source}: {report['total_tokens']:,} in {report['chunks']} chunks, "
+          f"largest {report['largest_chunk_tokens']} (window {report['max_tokens']})")
+    print(f"Truncated chunks: {report['truncated_chunks']}, "
+          f"tokens wasted to truncation: {report['wasted_tokens']:,} ({report['wasted_ratio']:.1%})")
+    if report.get("estimated"):
+        print("Token counts are estimates, which chunks were also fitted with, so truncation may go unreported; "
+              "install tokenizers and run `python token_counting.py --download` for the model's own counts")
+
+def main():
+    # Usage: python token_counting.py <parsed_markdown_file> [tokenizer]
+    #        python token_counting.py --download
+    import sys
+    import io
+    import contextlib
+    from import_2_chunking import iter_chunks
+
+    if len(sys.argv) < 2:
+        print("Usage: python token_counting.py <parsed_markdown_file> [tokenizer] | --download")
+        sys.exit(1)
+    if sys.argv[1] == "--download":
+        print(f"Saved the {EMBEDDING_TOKENIZER} tokenizer to: {download_tokenizer()}")
+        return
+    tokenizer = get_tokenizer(sys.argv[2] if len(sys.argv) > 2 else None)
+    report_tokenizer = get_report_tokenizer(tokenizer)
+
+    # Chunks as they were embedded before window fitting, and as they are now
+    for label, window_tokens in (("Unfitted", sys.maxsize), ("Fitted", EMBEDDING_TOKEN_BUDGET)):
+        with open(sys.argv[1], 'r', encoding='utf-8') as f, contextlib.redirect_stdout(io.StringIO()):
+            counts = [report_tokenizer.count(chunk.text)
+                      for chunk in iter_chunks(f, tokenizer=tokenizer, window_tokens=window_tokens)]
+        print(f"\n{label} chunks:")
+        print_truncation_report(truncation_report(counts, estimated=not report_tokenizer.exact), report_tokenizer.name)
+
+if __name__ == "__main__":
+    main()
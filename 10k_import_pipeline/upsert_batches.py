@@ -0,0 +1,151 @@
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Sequence, Iterator
+
+# Pinecone limits an upsert request to 2 MB and 1000 records; batches are packed below
+# the size limit, leaving room for the request envelope
+UPSERT_MAX_REQUEST_BYTES = 2 * 1024 * 1024
+UPSERT_REQUEST_BYTES = int(UPSERT_MAX_REQUEST_BYTES * 0.9)
+UPSERT_MAX_BATCH_SIZE = 1000
+
+# Upsert requests in flight at once
+UPSERT_CONCURRENCY = 2
+
+# Attempts per request before a batch is split, and the first backoff delay (doubled per retry)
+UPSERT_MAX_ATTEMPTS = 3
+UPSERT_RETRY_DELAY = 1.0
+
+# Failed requests in a row after which the remaining batches fail fast, as for embeddings
+UPSERT_MAX_CONSECUTIVE_FAILURES = 10
+
+# HTTP statuses of requests that fail the same way when sent again
+PERMANENT_STATUSES = {400, 401, 403, 404, 413, 422}
+
+class UpsertStats:
+    """Request counts of upserts, updated by the sender threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.vectors = 0
+        self.bytes = 0
+        self.failed = 0
+        self.requests = 0
+        self.retries = 0
+        self.splits = 0
+        self.consecutive_failures = 0
+
+    def count(self, field: str, amount: int = 1):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def request_done(self, failed: bool):
+        with self.lock:
+            self.consecutive_failures = self.consecutive_failures + 1 if failed else 0
+
+    def outage(self) -> bool:
+        return self.consecutive_failures >= UPSERT_MAX_CONSECUTIVE_FAILURES
+
+def record_bytes(vector: Dict[str, Any]) -> int:
+    """Size of a record serialized as JSON, which is what a REST upsert request carries."""
+    return len(json.dumps(vector, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+
+def pack_batches(vectors: Sequence[Dict[str, Any]], max_bytes: int = UPSERT_REQUEST_BYTES,
+                 max_records: int = UPSERT_MAX_BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Split records into batches in order, each as large as fits under max_bytes and
+    max_records. A record larger than max_bytes on its own is sent alone.
+    """
+    batch = []
+    size = 0
+    for vector in vectors:
+        vector_size = record_bytes(vector)
+        if batch and (size + vector_size > max_bytes or len(batch) >= max_records):
+            yield batch
+            batch = []
+            size = 0
+        batch.append(vector)
+        size += vector_size
+    if batch:
+        yield batch
+
+def is_transient(error: Exception) -> bool:
+    """Whether a failed request may succeed when sent again (rate limits, server errors, network)."""
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    return not isinstance(status, int) or status not in PERMANENT_STATUSES
+
+def upsert_batch(index, vectors: List[Dict[str, Any]], namespace: str, stats: UpsertStats,
+                 max_attempts: int = UPSERT_MAX_ATTEMPTS, retry_delay: float = UPSERT_RETRY_DELAY) -> List[str]:
+    """
+    Upsert one batch with retries and exponential backoff on transient failures. A batch
+    that keeps failing is split in halves, each upserted the same way, so one bad record
+    only fails itself. Returns the IDs of the records that could not be upserted.
+    """
+    error = None
+    for attempt in range(max_attempts):
+        if stats.outage():
+            break
+        if attempt:
+            stats.count("retries")
+            time.sleep(retry_delay * 2 ** (attempt - 1))
+        try:
+            stats.count("requests")
+            index.upsert(vectors=vectors, namespace=namespace)
+        except Exception as e:
+            stats.request_done(failed=True)
+            error = e
+            if not is_transient(e):
+                break
+            continue
+        stats.request_done(failed=False)
+        stats.count("vectors", len(vectors))
+        stats.count("bytes", sum(record_bytes(vector) for vector in vectors))
+        return []
+
+    if len(vectors) > 1 and not stats.outage():
+        stats.count("splits")
+        middle = len(vectors) // 2
+        return (upsert_batch(index, vectors[:middle], namespace, stats, max_attempts, retry_delay) +
+                upsert_batch(index, vectors[middle:], namespace, stats, max_attempts, retry_delay))
+    print(f"Error upserting {len(vectors)} vectors: {str(error) if error else 'too many failed requests'}")
+    stats.count("failed", len(vectors))
+    return [vector["id"] for vector in vectors]
+
+def upsert_vectors(index, vectors: Sequence[Dict[str, Any]], namespace: str, concurrency: int = UPSERT_CONCURRENCY,
+                   stats: Optional[UpsertStats] = None, max_bytes: int = UPSERT_REQUEST_BYTES,
+                   retry_delay: float = UPSERT_RETRY_DELAY) -> List[str]:
+    """
+    Upsert records in batches packed by size (see pack_batches), concurrency requests at a
+    time through the shared index client, whose connection pool keeps connections open.
+    Returns the IDs of the records that could not be upserted.
+    """
+    stats = stats or UpsertStats()
+    batches = list(pack_batches(vectors, max_bytes))
+    if not batches:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(batches)))) as executor:
+        results = executor.map(lambda batch: upsert_batch(index, batch, namespace, stats, UPSERT_MAX_ATTEMPTS, retry_delay),
+                               batches)
+        return [identifier for failed in results for identifier in failed]
+
+def upsert_report(stats: UpsertStats, seconds: float) -> Dict[str, Any]:
+    """Request counts and throughput of the upserts of one filing."""
+    return {
+        "vectors": stats.vectors,
+        "failed": stats.failed,
+        "bytes": stats.bytes,
+        "requests": stats.requests,
+        "retries": stats.retries,
+        "splits": stats.splits,
+        "seconds": seconds,
+        "vectors_per_second": stats.vectors / seconds if seconds else 0.0,
+        "mean_request_bytes": stats.bytes / stats.requests if stats.requests else 0.0
+    }
+
+def print_upsert_report(report: Dict[str, Any]):
+    """Print a report produced by upsert_report."""
+    print(f"Upserts: {report['vectors']} vectors ({report['failed']} failed) in {report['requests']} requests "
+          f"({report['retries']} retries, {report['splits']} split batches), "
+          f"{report['mean_request_bytes'] / 1e6:.2f} MB per request, {report['seconds']:.1f}s, "
+          f"{report['vectors_per_second']:.1f} vectors/s")
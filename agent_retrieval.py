@@ -18,6 +18,12 @@ except ImportError:
 from langgraph.graph.state import StateGraph, START, END
 from langchain_core.runnables import RunnableConfig
 
+# Chunk stores written by the import pipeline (10k_import_pipeline is not importable as a package)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "10k_import_pipeline"))
+from chunk_store import namespace_covered, namespace_subheadings
+from embedding_batches import embed_texts
+from embedding_cache import get_embedding_cache
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -174,6 +180,8 @@ def gemini_determine_headings(state: AgentState, config: RunnableConfig) -> Agen
 def retrieve_metadata_with_zero_vector(state: AgentState, config: RunnableConfig) -> AgentState:
     """
     Node #2: Use a zero vector query to retrieve available subheadings for each relevant heading.
+    Namespaces whose vectors were all indexed from chunk stores on this machine are
+    answered from those stores instead.
     """
     pinecone_api_key = os.getenv("PINECONE_API_KEY")
     if not pinecone_api_key:
@@ -184,6 +192,11 @@ def retrieve_metadata_with_zero_vector(state: AgentState, config: RunnableConfig
     index = pc.Index(host="https://financialdocs-ij61u7y.svc.aped-4627-b74a.pinecone.io")
     namespace = state["company_namespace"]
 
+    if namespace_covered(namespace, index):
+        logging.info("Using subheadings from local chunk store")
+        state["available_subheadings"] = namespace_subheadings(namespace, state["relevant_item_headings"])
+        return state
+
     # Create a zero vector with same dimensions as our embeddings (1024 for multilingual-e5-large)
     zero_vector = [0.0] * 1024
     available_subheadings = {}
@@ -383,22 +396,12 @@ def pinecone_vector_search(state: AgentState, config: RunnableConfig) -> AgentSt
     user_query = state["user_query"]
     search_config = state.get("search_configuration", {"heading_configs": []})
 
-    # Create one embedding for the user query
-    try:
-        query_embedding_list = pc.inference.embed(
-            model="multilingual-e5-large",
-            inputs=[user_query],
-            parameters={"input_type": "query", "truncate": "END"}
-        )
-    except Exception as e:
-        logging.error(f"Error embedding query {user_query}: {e}")
-        return state
-
-    if not query_embedding_list or not query_embedding_list.data:
+    # Create one embedding for the user query (from the embedding cache if it was embedded before)
+    query_vector = embed_texts(pc, [user_query], input_type="query", cache=get_embedding_cache())[0]
+    if query_vector is None:
         logging.warning(f"No query embedding returned from Pinecone inference for: {user_query}")
         return state
 
-    query_vector = query_embedding_list[0].values
     logging.info(f"Embedding generated for query: {user_query[:80]}...")
 
     # Keep track of search queries used
@@ -478,22 +481,12 @@ def pinecone_vector_search(state: AgentState, config: RunnableConfig) -> AgentSt
     user_query = state["user_query"]
     search_config = state.get("search_configuration", {"heading_configs": []})
 
-    # Create one embedding for the user query
-    try:
-        query_embedding_list = pc.inference.embed(
-            model="multilingual-e5-large",
-            inputs=[user_query],
-            parameters={"input_type": "query", "truncate": "END"}
-        )
-    except Exception as e:
-        logging.error(f"Error embedding query {user_query}: {e}")
-        return state
-
-    if not query_embedding_list or not query_embedding_list.data:
+    # Create one embedding for the user query (from the embedding cache if it was embedded before)
+    query_vector = embed_texts(pc, [user_query], input_type="query", cache=get_embedding_cache())[0]
+    if query_vector is None:
         logging.warning(f"No query embedding returned from Pinecone inference for: {user_query}")
         return state
 
-    query_vector = query_embedding_list[0].values
     logging.info(f"Embedding generated for query: {user_query[:80]}...")
 
     # Search based on configuration
@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import logging
 from datetime import datetime
@@ -40,6 +41,14 @@ from langgraph.graph.state import StateGraph, START, END
 from langchain_core.runnables import RunnableConfig
 from langgraph.types import Send, Command
 
+# Chunk stores written by the import pipeline (10k_import_pipeline is not importable as a package)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "10k_import_pipeline"))
+from chunk_store import namespace_covered, namespace_subheadings, namespace_feature_index
+from chunk_features import mentioned_years
+from fact_store import lookup_facts, answers_question, format_facts
+from embedding_batches import embed_texts
+from embedding_cache import get_embedding_cache
+
 # Standard 10-K item headings and approximate info stored
 TENK_ITEM_HEADINGS = {
     "Item 1. Business": "Description of business operations, main products and services, revenue streams, competitive landscape, market share, industry trends, key customers, suppliers, seasonality, government regulations, intellectual property, research and development, employees, geographic markets, corporate structure, subsidiaries, company history, business strategy, recent acquisitions or divestitures",
@@ -90,6 +99,9 @@ class InfoNeedItem(TypedDict):
     metadata: Dict[str, Any]        # from zero-vector retrieval
     search_config: Dict[str, Any]   # from configure search
     search_results: List[Dict[str, Any]]  # from pinecone search
+    tag: str                        # "factual" or "broad", from the information need
+    answered_by: str                # "fact_store" when answered by a fact lookup
+    fact_results: List[Dict[str, Any]]  # fact lookup results added to the search results
 
 class AnalysisVectorDBState(TypedDict):
     """State definition for the vectordb retrieval sub-graph."""
@@ -317,6 +329,8 @@ def retrieve_metadata_with_zero_vector(
     """
     Node #3: Use a zero vector query to retrieve available subheadings for each relevant heading.
     We'll store the result in info_need_items[item_index]["metadata"].
+    Namespaces whose vectors were all indexed from chunk stores on this machine are
+    answered from those stores instead.
     """
     pinecone_api_key = os.getenv("PINECONE_API_KEY")
     if not pinecone_api_key:
@@ -333,6 +347,19 @@ def retrieve_metadata_with_zero_vector(
     pc = Pinecone(api_key=pinecone_api_key)
     index = pc.Index(host="https://financialdocs-ij61u7y.svc.aped-4627-b74a.pinecone.io")
     
+    namespace = state.get("company_namespace")
+    if namespace and namespace_covered(namespace, index):
+        logging.info("Using subheadings from local chunk store")
+        for item in state["info_need_items"]:
+            item["metadata"] = {
+                "available_subheadings": namespace_subheadings(namespace, item["headings"]),
+                "retrieved_for_headings": item["headings"]
+            }
+        return Command(
+            update={},
+            goto="configure_search_with_gemini"
+        )
+    
     # Debug logging for state inspection
     logging.info("\nState contents:")
     for key, value in state.items():
@@ -630,26 +657,14 @@ def pinecone_vector_search(
         info_need = item["info_need"]
         search_config = item.get("search_config", {"heading_configs": []})
 
-        # Create one embedding for the user query
-        try:
-            query_embedding_list = pc.inference.embed(
-                model="multilingual-e5-large",
-                inputs=[info_need],
-                parameters={"input_type": "query", "truncate": "END"}
-            )
-        except Exception as e:
-            logging.error(f"Error embedding query for item {item_index}: {e}")
-            state["error_states"][item_index].append(f"Embedding error: {e}")
-            state["info_need_items"][item_index]["search_results"] = []
-            continue
-
-        if not query_embedding_list or not query_embedding_list.data:
+        # Create one embedding for the user query (from the embedding cache if it was embedded before)
+        query_vector = embed_texts(pc, [info_need], input_type="query", cache=get_embedding_cache())[0]
+        if query_vector is None:
             logging.warning(f"No query embedding returned for item {item_index}")
             state["error_states"][item_index].append("No embedding returned")
             state["info_need_items"][item_index]["search_results"] = []
             continue
 
-        query_vector = query_embedding_list[0].values
         logging.info(f"Embedding generated for query: {info_need[:80]}...")
 
         # Search based on configuration
@@ -1085,6 +1100,44 @@ def parse_info_needs_and_get_metadata(
         info_need = need["description"]
         logging.info(f"\nProcessing info need {i+1}: {info_need[:100]}...")
         
+        # Factual needs asking for the numbers of table line items are answered by a direct
+        # lookup in the fact store, without the metadata query and vector search; facts
+        # found for other factual needs are added to their vector search results
+        fact_results = []
+        if need.get("tag") == "factual":
+            namespace = state.get("company_namespace", "")
+            try:
+                facts = lookup_facts(namespace, info_need)
+            except Exception as e:
+                logging.warning(f"Fact store lookup failed, using vector search: {str(e)}")
+                facts = []
+            if facts:
+                fact_results = [{
+                    "text": format_facts(facts),
+                    "heading": "Fact store",
+                    "subheading": "Financial tables",
+                    "score": 1.0
+                }]
+            if answers_question(info_need, facts, namespace):
+                logging.info(f"Answered from the fact store: {len(facts)} facts")
+                state["search_logs"]["metadata_queries"].append({
+                    "info_need": info_need,
+                    "namespace": namespace,
+                    "query_type": "fact_store",
+                    "facts": len(facts),
+                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                })
+                state["info_need_items"].append({
+                    "info_need": info_need,
+                    "tag": need.get("tag"),
+                    "headings": sorted({fact.heading for fact in facts if fact.heading}),
+                    "search_results": fact_results,
+                    "answered_by": "fact_store"
+                })
+                continue
+            if facts:
+                logging.info(f"Found {len(facts)} facts, adding them to the vector search results")
+        
         try:
             # Initialize Pinecone
             pinecone_api_key = os.getenv("PINECONE_API_KEY")
@@ -1128,8 +1181,10 @@ def parse_info_needs_and_get_metadata(
             # Store processed item
             state["info_need_items"].append({
                 "info_need": info_need,
+                "tag": need.get("tag"),
                 "headings": headings,
-                "search_results": []
+                "search_results": list(fact_results),
+                "fact_results": fact_results
             })
             
         except Exception as e:
@@ -1138,8 +1193,10 @@ def parse_info_needs_and_get_metadata(
             state["error_states"][i] = [error_msg]
             state["info_need_items"].append({
                 "info_need": info_need,
+                "tag": need.get("tag"),
                 "headings": [],
-                "search_results": []
+                "search_results": list(fact_results),
+                "fact_results": fact_results
             })
     
     return state
@@ -1153,6 +1210,10 @@ def configure_search_for_info_needs(
         info_need = item["info_need"]
         headings = item["headings"]
         
+        if item.get("answered_by") == "fact_store":
+            logging.info(f"\nInfo need {i+1} was answered from the fact store, no search needed")
+            continue
+        
         logging.info(f"\nConfiguring search for info need {i+1}")
         logging.info("\nSEARCH CONFIGURATION:")
         
@@ -1213,13 +1274,36 @@ def execute_vector_search(
     state: AnalysisVectorDBState,
     config: RunnableConfig
 ) -> AnalysisVectorDBState:
-    """Execute vector search for each information need."""
+    """
+    Execute vector search for each information need. When the namespace's vectors were
+    all indexed from chunk stores on this machine (see chunk_store.namespace_covered),
+    their feature index is used: heading/subheading searches without any matching chunk
+    are skipped, and factual needs naming years only search chunks that mention one of
+    those years. Vectors indexed before chunk features were stored in their metadata
+    have no years; re-index them with import_3_indexing.py --no-diff first.
+    """
+    namespace = state.get("company_namespace", "")
+    pinecone_api_key = os.getenv("PINECONE_API_KEY")
+    feature_index = None
+    if namespace and pinecone_api_key:
+        index = Pinecone(api_key=pinecone_api_key).Index(host="https://financialdocs-ij61u7y.svc.aped-4627-b74a.pinecone.io")
+        if namespace_covered(namespace, index):
+            feature_index = namespace_feature_index(namespace)
+        else:
+            logging.info("Local chunk stores do not cover the namespace; searching without feature filters")
+    
     for i, item in enumerate(state["info_need_items"]):
         info_need = item["info_need"]
         search_config = item.get("search_config", {})
         
+        if item.get("answered_by") == "fact_store":
+            continue
+        
         logging.info(f"\nPerforming vector search for info need {i+1}")
         
+        years = mentioned_years(info_need) if feature_index is not None and item.get("tag") == "factual" else []
+        feature_filter = {"years": {"$in": years}} if years else {}
+        
         search_log = {
             "info_need": info_need,
             "searches": [],
@@ -1235,12 +1319,10 @@ def execute_vector_search(
             pc = Pinecone(api_key=pinecone_api_key)
             index = pc.Index(host="https://financialdocs-ij61u7y.svc.aped-4627-b74a.pinecone.io")
             
-            # Generate embedding for the query
-            query_embedding = pc.inference.embed(
-                model="multilingual-e5-large",
-                inputs=[info_need],
-                parameters={"input_type": "query", "truncate": "END"}
-            )[0].values
+            # Generate embedding for the query (from the embedding cache if it was embedded before)
+            query_embedding = embed_texts(pc, [info_need], input_type="query", cache=get_embedding_cache())[0]
+            if query_embedding is None:
+                raise ValueError("No embedding returned")
             
             logging.info(f"Embedding generated for query: {info_need[:100]}...")
             
@@ -1249,19 +1331,26 @@ def execute_vector_search(
             
             # Search across broad items
             for heading in search_config.get("broad_items", []):
+                if feature_index is not None and not feature_index.count(
+                        feature_index.select(heading=heading, years=years or None)):
+                    logging.info(f"Skipped {heading}: no matching chunks in the feature index")
+                    search_log["searches"].append({"type": "broad", "heading": heading, "skipped": True})
+                    continue
+                
+                query_filter = {"top_level_heading": {"$eq": heading}, **feature_filter}
                 results = index.query(
                     vector=query_embedding,
                     namespace=state["company_namespace"],
                     top_k=5,
                     include_metadata=True,
-                    filter={"top_level_heading": {"$eq": heading}}
+                    filter=query_filter
                 )
                 
                 # Log search
                 search_log["searches"].append({
                     "type": "broad",
                     "heading": heading,
-                    "filter": {"top_level_heading": {"$eq": heading}},
+                    "filter": query_filter,
                     "results_found": len(results.matches)
                 })
                 
@@ -1280,15 +1369,25 @@ def execute_vector_search(
             # Search with specific subheading filters
             for heading in search_config.get("broad_items", []):
                 for subheading in search_config.get("specific_subheadings", []):
+                    if feature_index is not None and not feature_index.count(
+                            feature_index.select(heading=heading, subheading=subheading, years=years or None)):
+                        logging.info(f"Skipped {heading} / {subheading}: no matching chunks in the feature index")
+                        search_log["searches"].append({
+                            "type": "specific", "heading": heading, "subheading": subheading, "skipped": True
+                        })
+                        continue
+                    
+                    query_filter = {
+                        "top_level_heading": {"$eq": heading},
+                        "subheading": {"$eq": subheading},
+                        **feature_filter
+                    }
                     results = index.query(
                         vector=query_embedding,
                         namespace=state["company_namespace"],
                         top_k=5,
                         include_metadata=True,
-                        filter={
-                            "top_level_heading": {"$eq": heading},
-                            "subheading": {"$eq": subheading}
-                        }
+                        filter=query_filter
                     )
                     
                     # Log search
@@ -1296,10 +1395,7 @@ def execute_vector_search(
                         "type": "specific",
                         "heading": heading,
                         "subheading": subheading,
-                        "filter": {
-                            "top_level_heading": {"$eq": heading},
-                            "subheading": {"$eq": subheading}
-                        },
+                        "filter": query_filter,
                         "results_found": len(results.matches)
                     })
                     
@@ -1315,8 +1411,8 @@ def execute_vector_search(
                         if chunk_info["text"]:
                             all_results.append(chunk_info)
             
-            # Store results
-            item["search_results"] = all_results
+            # Store results, after the facts found for the need
+            item["search_results"] = item.get("fact_results", []) + all_results
             logging.info(f"\nFound {len(all_results)} relevant chunks for item {i}")
             
             # Add to search logs
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The pipeline modules live in 10k_import_pipeline, which is not importable as a package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "10k_import_pipeline"))
@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+from chunk_features import FeatureIndex, chunk_features, feature_keys
+
+def test_chunk_feature_index():
+    """
+    Chunk features (years, currency amounts, tables, segment names) must be extracted from
+    prose and from LlamaParse grids, and the bitmap index must select the right chunks.
+    """
+    chunks = {
+        "table": "| Net sales |  | $ | 574,785 |  | $ | 513,983 |\n|  | 2023 |  | 2022 |",
+        "prose": "Net sales of the North America, International, and AWS segments grew in 2023.",
+        "risk": "Our results may fluctuate. Each reportable segment faces competition."
+    }
+    features = {name: chunk_features(text) for name, text in chunks.items()}
+    assert features["table"] == {"years": ["2022", "2023"], "has_currency": True, "has_table": True, "segments": []}
+    assert features["prose"] == {"years": ["2023"], "has_currency": False, "has_table": False,
+                                 "segments": ["AWS", "International", "North America"]}
+    assert features["risk"]["segments"] == [] and features["risk"]["years"] == []
+    
+    index = FeatureIndex()
+    for name in chunks:
+        index.add(name, feature_keys("Item 7", name, features[name]))
+    assert index.chunk_ids(index.select(years=["2023"], has_table=True)) == ["table"]
+    assert index.chunk_ids(index.select(heading="Item 7", years=["2021", "2023"])) == ["table", "prose"]
+    assert index.chunk_ids(index.select(segments=["AWS"], has_currency=False)) == ["prose"]
+    assert index.count(index.select(heading="Item 1A")) == 0
+    
+    with tempfile.TemporaryDirectory() as directory:
+        index.save(os.path.join(directory, "features"))
+        loaded = FeatureIndex.load(os.path.join(directory, "features"))
+    loaded.extend(index)
+    assert loaded.chunk_ids(loaded.select(subheading="risk")) == ["risk", "risk"]
@@ -0,0 +1,17 @@
+from bench_chunking import load_sample_filing
+from chunk_size_sweep import run_sweep, NETFLIX_QUESTIONS
+
+def test_chunk_size_sweep():
+    """
+    The chunk size sweep must report cost and retrieval numbers for every setting: smaller
+    chunks mean more chunks and embedding requests for about the same tokens, and the
+    stand-in retrieval must answer most of the Netflix question set at the default setting.
+    """
+    for question in NETFLIX_QUESTIONS:
+        assert " ".join(question["evidence"].split()) in " ".join(load_sample_filing().split())
+    
+    small, default = run_sweep([load_sample_filing()], [(150, 50), (300, 100)])["settings"]
+    assert small["chunks"] > default["chunks"] and small["embedding_requests"] > default["embedding_requests"]
+    assert small["index_bytes"] > default["index_bytes"]
+    assert abs(small["embedding_tokens"] - default["embedding_tokens"]) < 0.05 * default["embedding_tokens"]
+    assert default["recall_at_k"] >= 0.5
@@ -0,0 +1,62 @@
+import os
+import tempfile
+
+from chunk_store import (ChunkStore, chunk_id, features_path, index_path, indexed_path, mark_indexed,
+                         namespace_feature_index, namespace_stores, namespace_subheadings, write_chunk_store)
+
+CHUNKS = [
+    {"heading": "Item 1", "subheading": "Overview", "text": "Netflix is a streaming service."},
+    {"heading": "Item 7", "subheading": "Results", "text": "| Metric | 2023 |\n|---|---|\n| Revenue | $33,723 |"},
+    {"heading": "Item 7", "subheading": "Liquidity", "text": "Cash flows were positive in 2023."}
+]
+
+def test_chunk_store_round_trip():
+    """A chunk store must give back every chunk by position and by content ID, with its header."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "filing.jsonl")
+        assert write_chunk_store(CHUNKS, path, header={"filing": "NFLX_2023"}) == 3
+        with ChunkStore(path) as store:
+            assert len(store) == 3 and store.header["filing"] == "NFLX_2023"
+            assert [chunk["text"] for chunk in store] == [chunk["text"] for chunk in CHUNKS]
+            assert store[-1]["subheading"] == "Liquidity" and store[1]["compact_text"] != CHUNKS[1]["text"]
+            assert store.get(chunk_id(CHUNKS[1]))["subheading"] == "Results" and store.get("missing") is None
+
+def test_chunk_store_rebuilds_stale_offset_index():
+    """Reading must not depend on the offset index: a missing or stale one is rebuilt from the file."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "filing.jsonl")
+        write_chunk_store(CHUNKS, path)
+        with open(index_path(path), "rb") as f:
+            old_index = f.read()
+        write_chunk_store(CHUNKS[:2], path)
+        with open(index_path(path), "wb") as f:
+            f.write(old_index)
+        with ChunkStore(path) as store:
+            assert [chunk["subheading"] for chunk in store] == ["Overview", "Results"]
+        os.remove(index_path(path))
+        with ChunkStore(path) as store:
+            assert len(store) == 2 and store.get(chunk_id(CHUNKS[1]))["heading"] == "Item 7"
+
+def test_only_indexed_chunk_stores_answer_for_a_namespace():
+    """Stores must be listed for retrieval only once marked as indexed, until they are rewritten."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "netflix", "filing.jsonl")
+        write_chunk_store(CHUNKS, path)
+        assert namespace_stores("netflix", directory) == [] and namespace_subheadings("netflix", ["Item 7"], directory) is None
+        assert namespace_stores("netflix", directory, indexed=False) == [path]
+        assert mark_indexed(path) == 3
+        assert namespace_subheadings("netflix", ["Item 7"], directory) == {"Item 7": ["Liquidity", "Results"]}
+        write_chunk_store(CHUNKS, path)
+        assert not os.path.exists(indexed_path(path)) and namespace_stores("netflix", directory) == []
+
+def test_namespace_feature_index_needs_every_indexed_store():
+    """The namespace feature index must cover every indexed store, or not be used at all."""
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, "netflix", f"{name}.jsonl") for name in ("2022", "2023")]
+        for path in paths:
+            write_chunk_store(CHUNKS, path)
+            mark_indexed(path)
+        feature_index = namespace_feature_index("netflix", directory)
+        assert feature_index.count(feature_index.select(heading="Item 7")) == 4
+        os.remove(features_path(paths[0]))
+        assert namespace_feature_index("netflix", directory) is None
@@ -1,50 +1,63 @@
-from import_2_chunking import process_and_save_chunks
-from datetime import datetime
-import os
+from bench_chunking import (
+    run_suite,
+    check_linear_scaling,
+    bench_content_start,
+    bench_parallel_chunking,
+    bench_line_predicates,
+    run_adversarial_suite,
+    check_adversarial_scaling,
+    make_dense_toc_filing,
+    make_synthetic_filing,
+    SUITE_SCALES,
+    TOC_WORST_CASE_LINES,
+    ADVERSARIAL_TEST_SIZES
+)
+from import_2_chunking import find_start_of_content, DEFAULT_MAX_CHUNK_SIZE, DEFAULT_MIN_CHUNK_SIZE
+from token_counting import EMBEDDING_TOKEN_BUDGET
 
-def test_chunking_on_file(input_file: str):
-    """Test chunking logic on a specific markdown file."""
-    print(f"\nTesting chunking on file: {input_file}")
-    
-    # Read the input file
-    try:
-        with open(input_file, 'r') as f:
-            content = f.read()
-            print(f"Successfully read input file. Content length: {len(content)} characters")
-    except Exception as e:
-        print(f"Error reading input file: {e}")
-        return
-    
-    # Generate output filename with timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    base_name = os.path.splitext(os.path.basename(input_file))[0]
-    output_file = os.path.join("chunking_results", f"{base_name}_chunks_{timestamp}.md")
-    
-    print(f"Output will be written to: {output_file}")
+def test_chunking_scales_linearly():
+    """
+    Run the chunking benchmark suite (Netflix sample plus synthetic filings at 1x, 10x
+    and 50x) and fail if chunking time grows super-linearly with input size or a chunk
+    does not fit the embedding window.
+    """
+    results = run_suite(SUITE_SCALES)
+
+    synthetic = [result for result in results["documents"] if result["document"].startswith("synthetic")]
+    check_linear_scaling(synthetic)
+
+    for result in results["documents"]:
+        assert result["chunk_sizes"]["chunks"] > 0, f"No chunks produced for {result['document']}"
+        assert result["chunk_sizes"]["max"] <= EMBEDDING_TOKEN_BUDGET, (
+            f"{result['document']}: chunk of {result['chunk_sizes']['max']} tokens exceeds the embedding window"
+        )
+
+def test_content_start_worst_case_is_linear():
+    """
+    Time content start detection on filings with a dense TOC and cross-reference lists
+    all the way to the end (the worst case, since the search never stops early) and fail
+    if it grows super-linearly. Also check the start found with and without a real Item 1.
+    """
+    results = [bench_content_start(make_dense_toc_filing(lines)) for lines in TOC_WORST_CASE_LINES]
+    check_linear_scaling(results)
     
-    # Process the content
-    try:
-        chunks = process_and_save_chunks(content, output_file)
-        print(f"\nSuccessfully processed {len(chunks)} chunks")
-        
-        # Print first few chunks for inspection
-        print("\nFirst few chunks for inspection:")
-        for i, chunk in enumerate(chunks[:3], 1):
-            print(f"\n{'='*80}")
-            print(f"CHUNK {i}")
-            print(f"{'='*80}")
-            print("METADATA:")
-            print(f"Item Heading: {chunk['heading']}")
-            print(f"Subheading: {chunk['subheading']}")
-            print("\nFirst 200 chars of content:")
-            print(chunk['text'][:200] + "...")
-            
-    except Exception as e:
-        print(f"Error processing chunks: {e}")
-        import traceback
-        traceback.print_exc()
-        return
+    for lines in TOC_WORST_CASE_LINES:
+        # No content start after the TOC: content starts right after the "---" preamble line
+        assert find_start_of_content(make_dense_toc_filing(lines)) == 1
+        assert find_start_of_content(make_dense_toc_filing(lines, content_start=True)) == lines - 1
+
+def test_parallel_chunking_is_identical():
+    """Per-Item parallel chunking must give exactly the serial chunks, at the default and a sweep setting."""
+    for max_tokens, min_tokens in ((DEFAULT_MAX_CHUNK_SIZE, DEFAULT_MIN_CHUNK_SIZE), (450, 150)):
+        result = bench_parallel_chunking(make_synthetic_filing(2), workers=2, max_tokens=max_tokens, min_tokens=min_tokens)
+        assert result["identical"], f"Parallel chunking output differs from the serial path at {max_tokens}/{min_tokens}"
 
-if __name__ == "__main__":
-    # Test on NVIDIA parsed document
-    test_chunking_on_file("parsed_results/NVDA_parsed_20250104_204819.md") 
\ No newline at end of file
+def test_adversarial_inputs_scale_linearly():
+    """
+    Run the line predicates on single lines built to trigger regex backtracking, and every
+    adversarial document (long lines, pipe-only lines, huge and malformed tables, fuzz)
+    through each chunker stage, and fail if any time grows super-linearly with input size.
+    The absolute time limits are checked by bench_chunking.py --adversarial.
+    """
+    check_adversarial_scaling(bench_line_predicates(check_limits=False))
+    check_adversarial_scaling(run_adversarial_suite(ADVERSARIAL_TEST_SIZES))
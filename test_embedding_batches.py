@@ -0,0 +1,30 @@
+from embedding_batches import EmbeddingStats, embed_texts
+
+class FlakyEmbeddings:
+    """Embedding endpoint double: every third request fails, responses drop their last input, one input always fails."""
+    
+    def __init__(self):
+        self.inference = self
+        self.requests = 0
+    
+    def embed(self, model, inputs, parameters):
+        self.requests += 1
+        if self.requests % 3 == 0 or "bad input" in inputs:
+            raise RuntimeError("503 Service Unavailable")
+        values = [type("Embedding", (), {"values": [float(len(text))]})() for text in inputs]
+        return type("EmbeddingsList", (), {"data": values[:-1] if len(values) > 1 else values})()
+
+
+def test_embedding_batches_retry_and_partial_failure():
+    """
+    Batched embedding must return every embedding in input order despite failed requests
+    and partial responses, and only the input that always fails may be missing.
+    """
+    texts = ["x" * (i % 50 + 1) for i in range(300)]
+    texts[123] = "bad input"
+    endpoint = FlakyEmbeddings()
+    stats = EmbeddingStats()
+    embeddings = embed_texts(endpoint, texts, batch_size=64, concurrency=1, stats=stats, retry_delay=0)
+    assert embeddings[123] is None
+    assert all(values == [float(len(text))] for i, (text, values) in enumerate(zip(texts, embeddings)) if i != 123)
+    assert stats.retries and stats.splits and stats.requests == endpoint.requests < len(texts)
@@ -0,0 +1,89 @@
+import os
+import sqlite3
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from embedding_batches import EmbeddingStats, embed_texts
+from embedding_cache import EmbeddingCache, cache_report, get_embedding_cache
+from test_embedding_batches import FlakyEmbeddings
+
+def test_embedding_cache_hits_and_eviction():
+    """
+    Texts embedded before must come from the cache without requests, also after reopening
+    it, and the least recently used entries must be evicted first.
+    """
+    texts = [f"chunk {i} " * (i + 1) for i in range(200)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "embedding_cache.sqlite")
+        cache = EmbeddingCache(path, max_entries=150)
+        endpoint = FlakyEmbeddings()
+        first = embed_texts(endpoint, texts[:100], batch_size=32, concurrency=1, cache=cache, retry_delay=0)
+        assert None not in first
+        requests = endpoint.requests
+        assert embed_texts(endpoint, texts[:100], cache=cache) == first and endpoint.requests == requests
+        cache.close()
+        
+        cache = EmbeddingCache(path, max_entries=150)
+        stats = EmbeddingStats()
+        assert embed_texts(endpoint, texts[50:100], stats=stats, cache=cache) == first[50:]
+        assert stats.cached == 50 and stats.requests == 0
+        embed_texts(endpoint, texts[100:], concurrency=1, cache=cache, retry_delay=0)
+        report = cache_report(cache)
+        assert report["entries"] == 150 and report["evictions"] == 50
+        # The first 50 were used least recently
+        assert cache.get_many("multilingual-e5-large", "passage", texts[:50]) == [None] * 50
+        assert None not in cache.get_many("multilingual-e5-large", "passage", texts[50:])
+        assert cache.get_many("multilingual-e5-large", "query", texts[50:51]) == [None]
+        cache.close()
+
+def vector_of(text):
+    number = int(text.split()[1])
+    return [number + position / 8 for position in range(8)]
+
+def write_and_read(path, worker, rounds):
+    """Store and look up overlapping texts from one process; returns the number of wrong vectors read."""
+    cache = EmbeddingCache(path, max_entries=300)
+    wrong = 0
+    for round in range(rounds):
+        texts = [f"text {(worker * 97 + round * 31 + i) % 600}" for i in range(40)]
+        cache.put_many("model", "passage", texts, [vector_of(text) for text in texts])
+        for text, values in zip(texts, cache.get_many("model", "passage", texts)):
+            wrong += values is not None and values != vector_of(text)
+    cache.close()
+    return wrong
+
+def test_embedding_cache_concurrent_processes():
+    """
+    Processes storing and reading overlapping texts at once, with evictions, must never
+    read another text's vector, and every entry must keep a slot of its own.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "embedding_cache.sqlite")
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            assert sum(executor.map(write_and_read, [path] * 4, range(4), [40] * 4)) == 0
+        
+        cache = EmbeddingCache(path, max_entries=300)
+        texts = [f"text {number}" for number in range(600)]
+        found = [(text, values) for text, values in zip(texts, cache.get_many("model", "passage", texts)) if values]
+        assert 0 < len(found) <= 300 and all(values == vector_of(text) for text, values in found)
+        entries, slots = cache.connection.execute("SELECT COUNT(*), COUNT(DISTINCT slot) FROM entries").fetchone()
+        assert entries == slots == len(found)
+        cache.close()
+
+def test_unavailable_embedding_cache_is_skipped():
+    """A cache that cannot be opened or used must not fail embedding, only be skipped."""
+    with tempfile.TemporaryDirectory() as directory:
+        not_a_directory = os.path.join(directory, "file")
+        open(not_a_directory, "w").close()
+        assert get_embedding_cache(os.path.join(not_a_directory, "embedding_cache.sqlite")) is None
+        
+        # A database that can be read but not written, as in a read-only deployment
+        path = os.path.join(directory, "embedding_cache.sqlite")
+        cache = EmbeddingCache(path)
+        embed_texts(FlakyEmbeddings(), ["a"], cache=cache, retry_delay=0)
+        cache.connection.close()
+        cache.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        stats = EmbeddingStats()
+        assert embed_texts(FlakyEmbeddings(), ["a", "bb"], stats=stats, cache=cache, retry_delay=0) == [[1.0], [2.0]]
+        assert len(cache) == 1
+        cache.close()
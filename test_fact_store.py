@@ -0,0 +1,58 @@
+import tempfile
+
+from fact_store import FactStore, extract_facts, write_filing_facts, lookup_facts, answers_question
+
+def test_fact_store_lookup():
+    """
+    Facts extracted from a LlamaParse layout grid must have the right period, value and
+    unit, survive the columnar store round trip, and answer factual questions by line item
+    and year; other questions must find nothing so they fall back to vector search.
+    """
+    grid = "\n".join([
+        "|     |     |     |     |     |     |     |",
+        "| --- | --- | --- | --- | --- | --- | --- |",
+        "|  |  | 2023 |  | 2022 |  | 2023 vs. 2022 |",
+        "|  | (in thousands, except revenue per membership and percentages) |",
+        "| Streaming revenues |  | $ | 33,640,458 |  |  | $ | 31,469,852 |  |  | 7 | % |",
+        "| DVD revenues (1) |  | 82,839 |  |  | 145,698 |  |  | (43) | % |",
+        "| Average revenue per membership | $ | 11.64 |  | $ | 11.76 |  | (1) | % |",
+    ])
+    chunk = {"heading": "Item 7", "subheading": "Results of Operations", "text": grid}
+    facts = {(fact.line_item, fact.period): (fact.value, fact.unit) for fact in extract_facts(chunk, "NFLX_2023")}
+    assert facts[("Streaming revenues", "2022")] == (31469852.0, "USD thousands")
+    assert facts[("DVD revenues", "2023 vs. 2022")] == (-43.0, "%")
+    assert facts[("Average revenue per membership", "2023")] == (11.64, "USD")
+    
+    with tempfile.TemporaryDirectory() as store_dir:
+        write_filing_facts([chunk], "nflx", "NFLX_2023", store_dir)
+        write_filing_facts([chunk], "nflx", "NFLX_2023", store_dir)
+        assert len(FactStore("nflx", store_dir)) == len(facts)
+        
+        answer = lookup_facts("nflx", "Quantify streaming revenues in 2023", store_dir)
+        assert [(fact.line_item, fact.period, fact.value) for fact in answer] == [("Streaming revenues", "2023", 33640458.0)]
+        assert len(lookup_facts("nflx", "DVD revenues over the last two years", store_dir)) == 2
+        assert lookup_facts("nflx", "Describe the competitive landscape", store_dir) == []
+        assert lookup_facts("other", "Streaming revenues", store_dir) == []
+
+def test_fact_lookup_answers_only_quantity_questions():
+    """
+    Facts must only replace vector search for questions asking for the numbers of the
+    matched line items, not for questions that merely mention a line item.
+    """
+    grid = "\n".join([
+        "|  | 2023 | 2022 |",
+        "| Revenues | $ 33,723,297 | $ 31,615,550 |",
+        "| Streaming revenues | $ 33,640,458 | $ 31,469,852 |",
+    ])
+    chunk = {"heading": "Item 7", "subheading": "Results of Operations", "text": grid}
+    with tempfile.TemporaryDirectory() as store_dir:
+        write_filing_facts([chunk], "netflix", "NFLX_2023", store_dir)
+        for question in ("What was Netflix's total revenue in 2023?", "Quantify streaming revenues in 2023",
+                         "Revenues over the last two years"):
+            assert answers_question(question, lookup_facts("netflix", question, store_dir), "netflix"), question
+        for question in ("What risks could affect future revenues?",
+                         "Explain the key drivers behind revenue growth in 2023",
+                         "What were streaming revenues and paid memberships in 2023?",
+                         "How did revenues change due to pricing?"):
+            facts = lookup_facts("netflix", question, store_dir)
+            assert facts and not answers_question(question, facts, "netflix"), question
@@ -0,0 +1,177 @@
+import os
+import hashlib
+import tempfile
+from contextlib import chdir
+from types import SimpleNamespace
+
+from chunk_store import write_chunk_store, chunk_id, indexed_path, namespace_covered
+from import_3_indexing import apply_chunk_diff, embed_and_upsert, existing_vector_ids, vector_id
+
+METADATA = {"company_name": "Netflix", "fiscal_year": "2023", "document_type": "10-K"}
+
+class FakeIndex:
+    """
+    Serverless index double: one namespace, IDs listed in pages, upserts of the IDs in
+    fail_ids rejected, and fetches returning nothing while fetchable is False (as right
+    after an upsert, before the vectors are visible).
+    """
+
+    def __init__(self):
+        self.vectors = {}
+        self.fail_ids = set()
+        self.fetchable = True
+        self.upserted = 0
+
+    def list(self, prefix, namespace):
+        ids = sorted(identifier for identifier in self.vectors if identifier.startswith(prefix))
+        for i in range(0, len(ids), 3):
+            yield ids[i:i + 3]
+
+    def fetch(self, ids, namespace):
+        return SimpleNamespace(vectors={identifier: SimpleNamespace(values=self.vectors[identifier]["values"],
+                                                                    metadata=self.vectors[identifier]["metadata"])
+                                        for identifier in ids if self.fetchable and identifier in self.vectors})
+
+    def upsert(self, vectors, namespace):
+        if any(vector["id"] in self.fail_ids for vector in vectors):
+            raise type("ApiException", (Exception,), {"status": 400})("Bad record")
+        self.vectors.update((vector["id"], vector) for vector in vectors)
+        self.upserted += len(vectors)
+
+    def delete(self, ids, namespace):
+        for identifier in ids:
+            self.vectors.pop(identifier, None)
+
+    def describe_index_stats(self):
+        return SimpleNamespace(namespaces={"netflix": SimpleNamespace(vector_count=len(self.vectors))} if self.vectors else {})
+
+class FakePinecone:
+    """Client double: one index, and embeddings derived from the text hash."""
+
+    def __init__(self):
+        self.inference = self
+        self.index = FakeIndex()
+        self.embedded = 0
+
+    def Index(self, name):
+        return self.index
+
+    def embed(self, model, inputs, parameters):
+        self.embedded += len(inputs)
+        return SimpleNamespace(data=[SimpleNamespace(values=list(hashlib.sha256(text.encode("utf-8")).digest()[:8]))
+                                     for text in inputs])
+
+def make_chunk(name):
+    return {"heading": "Item 7", "subheading": name,
+            "text": f"The {name} section discusses " + " ".join(f"{name}{i}" for i in range(40)) + "."}
+
+def index_chunks(pc, chunks, directory, **options):
+    path = os.path.join(directory, "netflix", "filing.jsonl")
+    write_chunk_store(chunks, path)
+    return embed_and_upsert(None, METADATA, "key", chunk_store=path, namespace="netflix", cache=False, pc=pc, **options)
+
+def test_existing_vector_ids_only_lists_the_filing():
+    """
+    Listing must return the filing's vectors, including those with IDs from before the
+    document type was part of them, but never the vectors of another document type.
+    """
+    index = FakeIndex()
+    content = chunk_id(make_chunk("a"))
+    own = vector_id(METADATA, content)
+    amendment = vector_id(dict(METADATA, document_type="10-K/A"), content)
+    for identifier, document_type in ((own, "10-K"), (amendment, "10-K/A"), ("Netflix_2023_7", "10-K"),
+                                      ("Netflix_2023_8", "10-K/A"), (f"Netflix_2023_{content}", "10-K"),
+                                      (f"Netflix_2022_10-K_{content}", "10-K")):
+        index.vectors[identifier] = {"id": identifier, "values": [0.0], "metadata": {"document_type": document_type}}
+    assert existing_vector_ids(index, "netflix", METADATA) == {own, "Netflix_2023_7", f"Netflix_2023_{content}"}
+    assert existing_vector_ids(index, "netflix", dict(METADATA, document_type="10-K/A")) == {amendment, "Netflix_2023_8"}
+
+def test_reindexing_skips_unchanged_chunks_and_deletes_stale_ones_last():
+    """
+    Re-indexing must only embed and upsert new chunks, and delete the vectors of chunks
+    the filing no longer has only once every new chunk is upserted.
+    """
+    with tempfile.TemporaryDirectory() as directory, chdir(directory):
+        pc = FakePinecone()
+        amendment = vector_id(dict(METADATA, document_type="10-K/A"), "0" * 32)
+        pc.index.vectors[amendment] = {"id": amendment, "values": [0.0], "metadata": {"document_type": "10-K/A"}}
+
+        chunks = [make_chunk(name) for name in ("a", "b", "c")]
+        assert index_chunks(pc, chunks, directory, dedupe=False)
+        assert pc.embedded == 3 and len(pc.index.vectors) == 4
+        assert index_chunks(pc, chunks, directory, dedupe=False)
+        assert pc.embedded == 3 and pc.index.upserted == 3
+
+        changed = chunks[:2] + [make_chunk("d")]
+        new_id, stale_id = (vector_id(METADATA, chunk_id(chunk)) for chunk in (changed[2], chunks[2]))
+        pc.index.fail_ids.add(new_id)
+        assert not index_chunks(pc, changed, directory, dedupe=False)
+        assert stale_id in pc.index.vectors
+        pc.index.fail_ids.clear()
+        assert index_chunks(pc, changed, directory, dedupe=False)
+        assert pc.embedded == 5 and new_id in pc.index.vectors and stale_id not in pc.index.vectors
+        assert amendment in pc.index.vectors
+
+def test_chunk_store_is_trusted_only_once_indexed():
+    """
+    A chunk store must only be marked as indexed once all its chunks are upserted, and
+    only cover its namespace while it accounts for every vector in it.
+    """
+    with tempfile.TemporaryDirectory() as directory, chdir(directory):
+        pc = FakePinecone()
+        chunks = [make_chunk(name) for name in ("a", "b")]
+        pc.index.fail_ids.add(vector_id(METADATA, chunk_id(chunks[1])))
+        assert not index_chunks(pc, chunks, directory, dedupe=False)
+        path = os.path.join(directory, "netflix", "filing.jsonl")
+        assert not os.path.exists(indexed_path(path)) and not namespace_covered("netflix", pc.index, directory)
+        pc.index.fail_ids.clear()
+        assert index_chunks(pc, chunks, directory, dedupe=False)
+        assert namespace_covered("netflix", pc.index, directory)
+        
+        # A filing indexed elsewhere, or a wiped namespace, is not covered by the local stores
+        pc.index.vectors["Netflix_2022_10-K_0"] = {"id": "Netflix_2022_10-K_0", "values": [0.0], "metadata": {}}
+        assert not namespace_covered("netflix", pc.index, directory)
+        pc.index.vectors.clear()
+        assert not namespace_covered("netflix", pc.index, directory)
+
+def test_chunk_diff_deletes_removed_chunks_after_upserting_added_ones():
+    """Applying a chunk diff must keep the removed chunks' vectors until every added chunk is upserted."""
+    with tempfile.TemporaryDirectory() as directory, chdir(directory):
+        pc = FakePinecone()
+        old, new = make_chunk("old"), make_chunk("new")
+        old_id, new_id = vector_id(METADATA, chunk_id(old)), vector_id(METADATA, chunk_id(new))
+        pc.index.vectors[old_id] = {"id": old_id, "values": [0.0], "metadata": {"document_type": "10-K"}}
+        diff = {"filing": "NFLX_2023", "unchanged": 0, "added": [dict(new, id=chunk_id(new))],
+                "removed": [chunk_id(old)]}
+        
+        pc.index.fail_ids.add(new_id)
+        assert not apply_chunk_diff(diff, METADATA, "key", namespace="netflix", cache=False, pc=pc)
+        assert old_id in pc.index.vectors
+        pc.index.fail_ids.clear()
+        assert apply_chunk_diff(diff, METADATA, "key", namespace="netflix", cache=False, pc=pc)
+        assert new_id in pc.index.vectors and old_id not in pc.index.vectors
+
+def test_near_duplicates_of_this_run_reuse_values_without_fetching():
+    """
+    A near-duplicate of a chunk embedded earlier in the same run, even in an earlier batch,
+    must reuse its values without a fetch, and the matched chunk must keep its signature.
+    """
+    with tempfile.TemporaryDirectory() as directory, chdir(directory):
+        pc = FakePinecone()
+        pc.index.fetchable = False
+        original = make_chunk("a")
+        copy = dict(original, subheading="a (continued)", text=original["text"] + " Unchanged.")
+        chunks = [original, make_chunk("b"), copy]
+        assert index_chunks(pc, chunks, directory, batch_size=1)
+        assert pc.embedded == 2
+        original_id, copy_id = (vector_id(METADATA, chunk_id(chunk)) for chunk in (original, copy))
+        assert pc.index.vectors[copy_id]["metadata"]["duplicate_of"] == original_id
+        assert pc.index.vectors[copy_id]["values"] == pc.index.vectors[original_id]["values"]
+        
+        # The signature is still there: a copy in another filing matches it
+        other = dict(METADATA, fiscal_year="2024")
+        path = os.path.join(directory, "other.jsonl")
+        write_chunk_store([dict(copy, subheading="other")], path)
+        pc.index.fetchable = True
+        assert embed_and_upsert(None, other, "key", chunk_store=path, namespace="netflix", cache=False, pc=pc)
+        assert pc.embedded == 2
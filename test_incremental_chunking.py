@@ -0,0 +1,44 @@
+import tempfile
+
+from bench_chunking import make_synthetic_filing
+from import_2_chunking import iter_text_chunks
+from incremental_chunking import chunk_incrementally, commit_manifest
+
+def test_incremental_chunking_reuses_sections_and_diffs_committed_run():
+    """
+    Re-chunking must give the same chunks as a full run, re-chunk only edited sections,
+    and diff against the last committed run, so an uncommitted diff is returned again.
+    """
+    text = make_synthetic_filing(1)
+    expected = [chunk.text for chunk in iter_text_chunks(text)]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        chunks, diff = chunk_incrementally(text, "NFLX_2023", cache_dir)
+        assert [chunk.text for chunk in chunks] == expected
+        assert len(diff["added"]) == len(set(chunk["id"] for chunk in diff["added"])) and not diff["removed"]
+
+        # Not committed: the next run diffs against nothing again, from cached sections
+        chunks, again = chunk_incrementally(text, "NFLX_2023", cache_dir)
+        assert [chunk.text for chunk in chunks] == expected
+        assert again["reused_sections"] == again["sections"] and len(again["added"]) == len(diff["added"])
+        commit_manifest(again, cache_dir)
+        _, unchanged = chunk_incrementally(text, "NFLX_2023", cache_dir)
+        assert not unchanged["added"] and not unchanged["removed"] and unchanged["unchanged"] == len(diff["added"])
+
+        # One edited section, at a different position in the document
+        position = text.index("# Item 1A")
+        edited = "PREFIX LINE\n" + text[:position] + text[position:].replace(".", ". Edited.", 1)
+        chunks, changed = chunk_incrementally(edited, "NFLX_2023", cache_dir)
+        assert [chunk.text for chunk in chunks] == [chunk.text for chunk in iter_text_chunks(edited)]
+        assert changed["rechunked_sections"] == 1 and changed["added"] and changed["removed"]
+        assert changed["unchanged"] + len(changed["removed"]) == unchanged["unchanged"]
+
+def test_incremental_chunking_matches_other_chunk_sizes():
+    """Both chunk size settings must reach the chunker and the section cache key, as for iter_text_chunks."""
+    text = make_synthetic_filing(1)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        chunk_incrementally(text, "NFLX_2023", cache_dir)
+        for min_tokens in (150, 100):
+            chunks, diff = chunk_incrementally(text, "NFLX_2023", cache_dir, max_tokens=450, min_tokens=min_tokens)
+            assert [chunk.text for chunk in chunks] == [chunk.text for chunk in
+                                                        iter_text_chunks(text, 450, min_tokens=min_tokens)]
+            assert diff["reused_sections"] == 0
@@ -0,0 +1,71 @@
+import os
+import tempfile
+from contextlib import chdir
+
+from chunk_store import chunk_id, write_chunk_store
+from import_3_indexing import embed_and_upsert, vector_id
+from near_duplicates import DEDUPE_THRESHOLD, SignatureIndex, minhash_signature, signature_similarity
+from test_import_3_indexing import METADATA, FakePinecone, make_chunk
+
+TEXT = ("Our revenues depend on the number of paid memberships, which grew in every region during the year "
+        "as we expanded our content offering, improved recommendations and introduced an ad supported plan "
+        "while raising prices in several markets without a material increase in cancellations.")
+
+def test_minhash_similarity_separates_near_duplicates():
+    """Near-identical texts must score above the dedupe threshold and unrelated ones far below it."""
+    signature = minhash_signature(TEXT)
+    assert signature == minhash_signature(TEXT) and signature_similarity(signature, signature) == 1.0
+    assert signature_similarity(signature, minhash_signature(TEXT + " Unchanged.")) >= DEDUPE_THRESHOLD
+    unrelated = minhash_signature("Cash and cash equivalents are held in money market funds and time deposits "
+                                  "at several large financial institutions, and we monitor their credit ratings "
+                                  "and concentration of risk on a regular basis throughout the fiscal year.")
+    assert signature_similarity(signature, unrelated) < 0.2
+    assert minhash_signature("Too short to compare.") is None
+
+def test_signature_index_find_add_remove_rollback():
+    """The index must find added signatures, forget removed ones, and keep nothing of a rolled back add."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "signatures.sqlite")
+        signature = minhash_signature(TEXT)
+        near = minhash_signature(TEXT + " Unchanged.")
+
+        index = SignatureIndex(path)
+        assert index.find(signature) is None
+        index.add("a", "netflix", signature)
+        index.commit()
+        match = index.find(near)
+        assert (match.vector_id, match.namespace) == ("a", "netflix") and match.similarity >= DEDUPE_THRESHOLD
+
+        index.add("b", "amazon", near)
+        index.rollback()
+        index.close()
+        index = SignatureIndex(path)
+        assert len(index) == 1 and index.find(near).vector_id == "a"
+        index.remove("a", "netflix")
+        assert index.find(near) is None and len(index) == 0
+        index.close()
+
+def test_near_duplicates_of_earlier_runs_reuse_their_vectors():
+    """
+    A near-duplicate of a vector indexed by an earlier run must reuse its values, and be
+    embedded instead once that vector is gone from the namespace.
+    """
+    with tempfile.TemporaryDirectory() as directory, chdir(directory):
+        pc = FakePinecone()
+        original = make_chunk("a")
+        copy = dict(original, text=original["text"] + " Unchanged.")
+        for year, chunk in (("2022", original), ("2023", copy)):
+            write_chunk_store([chunk], f"{year}.jsonl")
+            assert embed_and_upsert(None, dict(METADATA, fiscal_year=year), "key", chunk_store=f"{year}.jsonl",
+                                    namespace="netflix", cache=False, pc=pc)
+        original_id = vector_id(dict(METADATA, fiscal_year="2022"), chunk_id(original))
+        copy_id = vector_id(dict(METADATA, fiscal_year="2023"), chunk_id(copy))
+        assert pc.embedded == 1 and pc.index.vectors[copy_id]["metadata"]["duplicate_of"] == original_id
+        assert pc.index.vectors[copy_id]["values"] == pc.index.vectors[original_id]["values"]
+
+        # Once both are deleted, a third copy cannot reuse them and is embedded
+        pc.index.vectors.clear()
+        write_chunk_store([dict(copy, subheading="again")], "2024.jsonl")
+        assert embed_and_upsert(None, dict(METADATA, fiscal_year="2024"), "key", chunk_store="2024.jsonl",
+                                namespace="netflix", cache=False, pc=pc)
+        assert pc.embedded == 2 and "duplicate_of" not in next(iter(pc.index.vectors.values()))["metadata"]
@@ -0,0 +1,75 @@
+import os
+import tempfile
+
+from stage_artifacts import ArtifactStage, make_artifact, run_artifact_stages
+
+def test_artifact_stages_skip_unchanged_work():
+    """
+    A stage must be skipped when its inputs and config are unchanged and its output still
+    exists, and run again when any of them changes; stages without cache always run.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        calls = []
+        
+        def search(company):
+            calls.append("search")
+            return {"company_name": company, "fiscal_year": "2023"}
+        
+        def write_markdown(metadata):
+            calls.append("parse")
+            path = os.path.join(directory, f"{metadata['company_name']}.md")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"# {metadata['company_name']} {metadata['fiscal_year']}")
+            return path
+        
+        def count_words(path):
+            calls.append("chunk")
+            with open(path, encoding="utf-8") as f:
+                return len(f.read().split())
+        
+        def run(company, chunk_config):
+            stages = [ArtifactStage("search", ("company",), "search_metadata", search, cache=False),
+                      ArtifactStage("parse", ("search_metadata",), "markdown", write_markdown),
+                      ArtifactStage("chunk", ("markdown",), "facts", count_words, config=chunk_config)]
+            calls.clear()
+            return run_artifact_stages(stages, {"company": make_artifact("company", company)},
+                                       artifact_dir=os.path.join(directory, "artifacts"))
+        
+        artifacts, timings = run("Netflix", {"max_tokens": 300})
+        assert artifacts["facts"].value == 3 and calls == ["search", "parse", "chunk"]
+        artifacts, timings = run("Netflix", {"max_tokens": 300})
+        assert calls == ["search"] and [timing["skipped"] for timing in timings] == [False, True, True]
+        run("Netflix", {"max_tokens": 450})
+        assert calls == ["search", "chunk"]
+        os.remove(artifacts["markdown"].path)
+        run("Netflix", {"max_tokens": 450})
+        assert calls == ["search", "parse"]
+        run("Amazon", {"max_tokens": 450})
+        assert calls == ["search", "parse", "chunk"]
+        
+        failing = [ArtifactStage("parse", ("company",), "markdown", lambda company: None)]
+        artifacts, timings = run_artifact_stages(failing, {"company": make_artifact("company", "Netflix")},
+                                                 artifact_dir=os.path.join(directory, "artifacts"))
+        assert artifacts is None and timings[0]["failed"]
+
+def test_artifact_stage_check_reruns_missing_state():
+    """A cached value output must be produced again when the stage's check says its state is gone."""
+    with tempfile.TemporaryDirectory() as directory:
+        store = {}
+        calls = []
+        
+        def write_facts(company):
+            calls.append(company)
+            store[company] = 2
+            return {"filing": company, "facts": 2}
+        
+        stages = [ArtifactStage("facts", ("company",), "facts", write_facts,
+                                check=lambda record: store.get(record["filing"]) == record["facts"])]
+        for _ in range(2):
+            artifacts, timings = run_artifact_stages(stages, {"company": make_artifact("company", "Netflix")},
+                                                     artifact_dir=directory)
+        assert calls == ["Netflix"] and timings[0]["skipped"]
+        store.clear()
+        artifacts, timings = run_artifact_stages(stages, {"company": make_artifact("company", "Netflix")},
+                                                 artifact_dir=directory)
+        assert calls == ["Netflix", "Netflix"] and not timings[0]["skipped"] and store == {"Netflix": 2}
@@ -0,0 +1,51 @@
+import threading
+import time
+
+from stage_pipeline import Stage, run_stages, stage_report
+
+def test_stage_pipeline_overlaps_with_bounded_queues():
+    """
+    Stages must overlap (the run takes about as long as the slowest stage, not the sum),
+    hold no more items than their queues allow, and stop with the first error.
+    """
+    lock = threading.Lock()
+    in_flight = [0, 0]
+    
+    def produce():
+        for i in range(40):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight[1], in_flight[0])
+            yield i
+    
+    def slow(item):
+        time.sleep(0.01)
+        return [item]
+    
+    received = []
+    def sink(item):
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+            received.append(item)
+    
+    stages = [Stage("a", slow, workers=2), Stage("b", sink, workers=2)]
+    seconds = run_stages(produce(), stages)
+    assert sorted(received) == list(range(40))
+    report = stage_report(stages, seconds)
+    assert [stage["items"] for stage in report["stages"]] == [40, 40]
+    assert seconds < 0.6 * sum(stage["busy_seconds"] for stage in report["stages"])
+    # Queued items plus one per worker, plus the one the source holds while blocked
+    assert in_flight[1] <= sum(stage.queue.maxsize + stage.workers for stage in stages) + 1
+    assert all(stage["max_queue_depth"] <= stage["queue_size"] for stage in report["stages"])
+    
+    def failing(item):
+        if item == 5:
+            raise ValueError("bad item")
+        return [item]
+    try:
+        run_stages(range(1000), [Stage("a", failing), Stage("b", lambda item: None)])
+    except ValueError as e:
+        assert str(e) == "bad item"
+    else:
+        raise AssertionError("the stage error was not raised")
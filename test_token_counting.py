@@ -0,0 +1,46 @@
+import pytest
+
+from token_counting import (TOKENIZER_FACTORIES, Tokenizer, get_report_tokenizer, get_tokenizer, register_tokenizer,
+                            truncation_report)
+
+class CharacterTokenizer(Tokenizer):
+    """Stands in for the model's tokenizer: one token per character."""
+    name = "e5"
+    exact = True
+
+    def count_batch(self, texts):
+        return [len(text) for text in texts]
+
+def missing_tokenizer():
+    missing_tokenizer.calls += 1
+    raise ImportError("Please install tokenizers via: pip install tokenizers")
+missing_tokenizer.calls = 0
+
+def test_tokenizers_must_implement_count_batch():
+    with pytest.raises(TypeError):
+        Tokenizer()
+
+def test_truncation_report_counts_with_the_model_tokenizer():
+    """
+    Chunks fitted with the word estimate must be counted with the model's tokenizer when it
+    loads, so truncation shows up, and be reported as estimates when it does not, without
+    trying to load it again.
+    """
+    original = TOKENIZER_FACTORIES["e5"]
+    text = "extraordinarily " * 20
+    try:
+        register_tokenizer("e5", CharacterTokenizer)
+        estimate = get_tokenizer("estimate")
+        report_tokenizer = get_report_tokenizer(estimate)
+        report = truncation_report([report_tokenizer.count(text)], max_tokens=100, estimated=not report_tokenizer.exact)
+        assert estimate.count(text) < 100 and report["truncated_chunks"] == 1 and not report["estimated"]
+
+        register_tokenizer("e5", missing_tokenizer)
+        estimate = get_tokenizer("estimate")
+        report_tokenizer = get_report_tokenizer(estimate)
+        report = truncation_report([report_tokenizer.count(text)], max_tokens=100, estimated=not report_tokenizer.exact)
+        assert report_tokenizer is estimate and report["truncated_chunks"] == 0 and report["estimated"]
+        assert get_report_tokenizer(estimate) is estimate and get_tokenizer("e5") is estimate
+        assert missing_tokenizer.calls == 1
+    finally:
+        register_tokenizer("e5", original)
@@ -0,0 +1,40 @@
+from upsert_batches import UpsertStats, pack_batches, record_bytes, upsert_vectors
+
+class FlakyIndex:
+    """Upsert endpoint double: rejects oversized requests and the record "poison", every fourth request fails."""
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.requests = 0
+        self.stored = {}
+    
+    def upsert(self, vectors, namespace):
+        self.requests += 1
+        if sum(record_bytes(vector) for vector in vectors) > self.max_bytes:
+            raise type("ApiException", (Exception,), {"status": 413})("Request too large")
+        if self.requests % 4 == 0:
+            raise type("ApiException", (Exception,), {"status": 503})("Service Unavailable")
+        if any(vector["id"] == "poison" for vector in vectors):
+            raise type("ApiException", (Exception,), {"status": 400})("Bad record")
+        self.stored.update((vector["id"], vector) for vector in vectors)
+
+
+def test_upsert_batches_pack_by_size_and_retry():
+    """
+    Upsert batches must stay under the request size in record order, and transient
+    failures must be retried so that only the bad record is missing.
+    """
+    vectors = [{"id": str(i), "values": [0.5] * 64, "metadata": {"chunk_text": "word " * (i * 37 % 400)}}
+               for i in range(300)]
+    vectors[150]["id"] = "poison"
+    max_bytes = 40_000
+    batches = list(pack_batches(vectors, max_bytes))
+    assert [vector for batch in batches for vector in batch] == vectors
+    assert all(sum(record_bytes(vector) for vector in batch) <= max_bytes for batch in batches)
+    assert len(batches) < len(vectors) / 10
+    
+    index = FlakyIndex(max_bytes)
+    stats = UpsertStats()
+    failed = upsert_vectors(index, vectors, "test", concurrency=1, stats=stats, max_bytes=max_bytes, retry_delay=0)
+    assert failed == ["poison"] and len(index.stored) == len(vectors) - 1
+    assert stats.retries and stats.splits and stats.vectors == len(vectors) - 1